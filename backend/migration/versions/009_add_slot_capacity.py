@@ -0,0 +1,57 @@
+"""add slot_capacity table and users.slot_held
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+# Must match MAX_ORDERS_PER_SLOT in src/reservations/availability.py
+# (the reconciliation job corrects the counters if it changes later)
+MAX_ORDERS_PER_SLOT = 30
+
+
+def upgrade() -> None:
+    # Flag telling whether a user's order currently consumes slot capacity
+    # (scripts/update_db.sh may have added it already, before the backend starts)
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('users')}
+    if 'slot_held' not in columns:
+        op.add_column('users', sa.Column('slot_held', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.execute("""
+        UPDATE users SET slot_held = true
+        WHERE menu_id IS NOT NULL
+        AND heure_reservation IS NOT NULL
+        AND payment_status IN ('completed', 'pending')
+    """)
+
+    # One counter row per slot (08:00 to 17:00)
+    # The app's create_all() may already have created the (empty) table
+    if not sa.inspect(op.get_bind()).has_table('slot_capacity'):
+        op.create_table(
+            'slot_capacity',
+            sa.Column('slot_time', sa.Time(), nullable=False),
+            sa.Column('remaining', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('slot_time')
+        )
+    op.execute(f"""
+        INSERT INTO slot_capacity (slot_time, remaining)
+        SELECT s.slot_time, {MAX_ORDERS_PER_SLOT} - COUNT(u.id)
+        FROM (SELECT make_time(h, 0, 0) AS slot_time FROM generate_series(8, 17) AS h) s
+        LEFT JOIN users u ON u.heure_reservation = s.slot_time AND u.slot_held
+        GROUP BY s.slot_time
+        ON CONFLICT (slot_time) DO UPDATE SET remaining = EXCLUDED.remaining
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('slot_capacity')
+    op.drop_column('users', 'slot_held')
@@ -0,0 +1,28 @@
+"""add (payment_status, reservation_expires_at) index for the expiry sweeper
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Lets the sweeper find expired pending holds without scanning users.
+    # IF NOT EXISTS: a fresh database may already have it from create_all()
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_users_payment_status_expires "
+        "ON users (payment_status, reservation_expires_at)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_payment_status_expires', table_name='users')
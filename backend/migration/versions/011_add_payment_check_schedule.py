@@ -0,0 +1,47 @@
+"""add per-user payment check schedule (payment_next_check_at, payment_check_count)
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # When the poller should next ask HelloAsso about the pending checkout
+    # (NULL: nothing to check, or retired after its final check)
+    # scripts/update_db.sh may have added them already
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('users')}
+    if 'payment_next_check_at' not in columns:
+        op.add_column('users', sa.Column('payment_next_check_at', sa.DateTime(), nullable=True))
+    if 'payment_check_count' not in columns:
+        op.add_column('users', sa.Column('payment_check_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Existing pending checkouts get one check at the next pass, then
+    # follow the schedule (or are retired if already too old)
+    op.execute("""
+        UPDATE users SET payment_next_check_at = now() AT TIME ZONE 'utc'
+        WHERE payment_status = 'pending'
+        AND payment_intent_id IS NOT NULL
+    """)
+
+    # IF NOT EXISTS: a fresh database may already have it from create_all()
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_users_payment_status_next_check "
+        "ON users (payment_status, payment_next_check_at)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_payment_status_next_check', table_name='users')
+    op.drop_column('users', 'payment_check_count')
+    op.drop_column('users', 'payment_next_check_at')
@@ -0,0 +1,33 @@
+"""add payment_notifications table (HelloAsso webhook deduplication)
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The app's create_all() may already have created the table
+    if not sa.inspect(op.get_bind()).has_table('payment_notifications'):
+        op.create_table(
+            'payment_notifications',
+            sa.Column('event_id', sa.String(), nullable=False),
+            sa.Column('event_type', sa.String(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('received_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('event_id')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('payment_notifications')
@@ -0,0 +1,34 @@
+"""add helloasso_tokens table (OAuth token shared by all workers)
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The app's create_all() may already have created the table
+    if not sa.inspect(op.get_bind()).has_table('helloasso_tokens'):
+        op.create_table(
+            'helloasso_tokens',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('access_token', sa.String(), nullable=True),
+            sa.Column('refresh_token', sa.String(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('helloasso_tokens')
@@ -0,0 +1,32 @@
+"""add sync_checkpoints table (HelloAsso orders reconciliation high-water mark)
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The app's create_all() may already have created the table
+    if not sa.inspect(op.get_bind()).has_table('sync_checkpoints'):
+        op.create_table(
+            'sync_checkpoints',
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('high_water_mark', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('sync_checkpoints')
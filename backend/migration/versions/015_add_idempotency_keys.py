@@ -0,0 +1,40 @@
+"""add idempotency_keys table (Idempotency-Key replay of order POSTs)
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The app's create_all() may already have created the table
+    if not sa.inspect(op.get_bind()).has_table('idempotency_keys'):
+        op.create_table(
+            'idempotency_keys',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('scope', sa.String(), nullable=False),
+            sa.Column('key', sa.String(), nullable=False),
+            sa.Column('request_hash', sa.String(), nullable=False),
+            sa.Column('status_code', sa.Integer(), nullable=True),
+            sa.Column('response', postgresql.JSONB(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('user_id', 'scope', 'key')
+        )
+        op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
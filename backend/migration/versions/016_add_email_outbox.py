@@ -0,0 +1,43 @@
+"""add email_outbox table (durable email queue)
+
+Revision ID: 016
+Revises: 015
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '016'
+down_revision = '015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The app's create_all() may already have created the table
+    if not sa.inspect(op.get_bind()).has_table('email_outbox'):
+        op.create_table(
+            'email_outbox',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(), nullable=False),
+            sa.Column('recipient', sa.String(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('payload', postgresql.JSONB(), nullable=True),
+            sa.Column('status', sa.String(), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+            sa.Column('last_error', sa.String(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('sent_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_email_outbox_status_next_attempt', 'email_outbox', ['status', 'next_attempt_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_email_outbox_status_next_attempt', table_name='email_outbox')
+    op.drop_table('email_outbox')
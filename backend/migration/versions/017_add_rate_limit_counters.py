@@ -0,0 +1,38 @@
+"""add rate_limit_counters table (rate limits shared by the workers)
+
+Revision ID: 017
+Revises: 016
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '017'
+down_revision = '016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The app's create_all() may already have created the table
+    if not sa.inspect(op.get_bind()).has_table('rate_limit_counters'):
+        op.create_table(
+            'rate_limit_counters',
+            sa.Column('key', sa.String(), nullable=False),
+            sa.Column('window_seconds', sa.Integer(), nullable=False),
+            sa.Column('window_index', sa.BigInteger(), nullable=False),
+            sa.Column('hits', sa.Integer(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('key', 'window_seconds', 'window_index'),
+            # Short-lived counters: skip the WAL
+            prefixes=['UNLOGGED'],
+        )
+        op.create_index('ix_rate_limit_counters_expires_at', 'rate_limit_counters', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_rate_limit_counters_expires_at', table_name='rate_limit_counters')
+    op.drop_table('rate_limit_counters')
@@ -0,0 +1,32 @@
+"""add bde_roster_members table (offline BDE member roster)
+
+Revision ID: 018
+Revises: 017
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '018'
+down_revision = '017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The app's create_all() may already have created the table
+    if not sa.inspect(op.get_bind()).has_table('bde_roster_members'):
+        op.create_table(
+            'bde_roster_members',
+            sa.Column('identity', sa.String(), nullable=False),
+            sa.Column('email', sa.String(), nullable=True),
+            sa.Column('imported_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('identity')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('bde_roster_members')
@@ -0,0 +1,28 @@
+"""add helloasso_tokens.renewal_lease_until (token renewal lease)
+
+Revision ID: 019
+Revises: 018
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '019'
+down_revision = '018'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Worker renewing the OAuth token until then (NULL: nobody); the app's
+    # create_all() may already have created the table with it
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('helloasso_tokens')}
+    if 'renewal_lease_until' not in columns:
+        op.add_column('helloasso_tokens', sa.Column('renewal_lease_until', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('helloasso_tokens', 'renewal_lease_until')
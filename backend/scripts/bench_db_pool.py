@@ -0,0 +1,256 @@
+"""
+Checkout latency with the database layer before and after the async engine.
+
+before: a single sync pool (20+40 by default). The async routes run their
+    queries with a sync Session, on the event loop.
+after:  the routes use the async pool (DB_ASYNC_POOL_SIZE+DB_ASYNC_MAX_OVERFLOW,
+    20+40) and the threads the sync pool (DB_SYNC_POOL_SIZE+DB_SYNC_MAX_OVERFLOW,
+    10+15), as in src/db/session.py.
+
+Each checkout does the database work of start_checkout(): load the user,
+give the connection back, call HelloAsso (simulated, --helloasso-ms), reload
+the user and store the checkout intent. Meanwhile, in both modes:
+- an admin-like request runs a slow query (--slow-query-ms) every
+  --slow-every seconds through the same layer as the checkouts
+- a background job runs a short query in a thread (asyncio.to_thread) every
+  100 ms through the sync pool
+
+Reports checkout latency (p50/p99/max), the longest event loop pause and the
+peak number of connections checked out of each pool. Needs a migrated
+database at DATABASE_URL; the bench users are deleted at the end.
+
+Usage (from backend/, with the app's environment loaded):
+    python scripts/bench_db_pool.py [--checkouts 2000] [--concurrency 100]
+        [--helloasso-ms 100] [--slow-query-ms 200] [--slow-every 1]
+        [--before-pool 20+40] [--sync-pool 10+15] [--async-pool 20+40]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import create_engine, delete, event, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.orm import Session, sessionmaker  # noqa: E402
+
+from src.core.config import settings  # noqa: E402
+from src.db.session import _async_database_url, _register_timestamp_codec  # noqa: E402
+from src.users.models import User  # noqa: E402
+
+BENCH_EMAIL_DOMAIN = "bench-db-pool.invalid"
+
+
+def pool_size(value: str) -> tuple[int, int]:
+    """"20+40" -> (pool_size, max_overflow)"""
+    size, overflow = value.split("+")
+    return int(size), int(overflow)
+
+
+def sync_engine(size: tuple[int, int]):
+    return create_engine(
+        settings.DATABASE_URL, pool_size=size[0], max_overflow=size[1],
+        pool_recycle=3600, pool_pre_ping=True,
+    )
+
+
+class SyncRoutes:
+    """Before: the async routes query through a sync Session, on the event loop."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.Session = sessionmaker(bind=engine, autoflush=False)
+
+    async def checkout(self, user_id: int, helloasso_seconds: float, intent_id: str) -> None:
+        with self.Session() as db:
+            user = db.get(User, user_id)
+            db.commit()
+            await asyncio.sleep(helloasso_seconds)
+            db.refresh(user)
+            user.payment_intent_id = intent_id
+            user.checkout_redirect_url = f"https://pay.test/{intent_id}"
+            user.checkout_created_at = datetime.now(timezone.utc)
+            db.commit()
+
+    async def slow_query(self, seconds: float) -> None:
+        with self.Session() as db:
+            db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": seconds})
+
+    def pools(self) -> dict:
+        return {"sync": self.engine.pool}
+
+    async def dispose(self) -> None:
+        self.engine.dispose()
+
+
+class AsyncRoutes:
+    """After: the async routes query through an AsyncSession (asyncpg)."""
+
+    def __init__(self, size: tuple[int, int]):
+        self.engine = create_async_engine(
+            _async_database_url(settings.DATABASE_URL), pool_size=size[0], max_overflow=size[1],
+            pool_recycle=3600, pool_pre_ping=True,
+        )
+        event.listen(self.engine.sync_engine, "connect", _register_timestamp_codec)
+        self.Session = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+
+    async def checkout(self, user_id: int, helloasso_seconds: float, intent_id: str) -> None:
+        async with self.Session() as db:
+            user = await db.get(User, user_id)
+            await db.commit()
+            await asyncio.sleep(helloasso_seconds)
+            await db.refresh(user)
+            user.payment_intent_id = intent_id
+            user.checkout_redirect_url = f"https://pay.test/{intent_id}"
+            user.checkout_created_at = datetime.now(timezone.utc)
+            await db.commit()
+
+    async def slow_query(self, seconds: float) -> None:
+        async with self.Session() as db:
+            await db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": seconds})
+
+    def pools(self) -> dict:
+        return {"async": self.engine.pool}
+
+    async def dispose(self) -> None:
+        await self.engine.dispose()
+
+
+def create_users(engine, count: int) -> list[int]:
+    with Session(engine) as session:
+        users = [
+            User(email=f"user{i}@{BENCH_EMAIL_DOMAIN}", normalized_email=f"bench-db-pool-{i}")
+            for i in range(count)
+        ]
+        session.add_all(users)
+        session.commit()
+        return [user.id for user in users]
+
+
+def delete_users(engine) -> None:
+    with Session(engine) as session:
+        session.execute(delete(User).where(User.email.like(f"%@{BENCH_EMAIL_DOMAIN}")))
+        session.commit()
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def run(name: str, routes, thread_engine, user_ids: list[int], args) -> None:
+    pools = {**routes.pools(), "sync": thread_engine.pool}
+    peak = dict.fromkeys(pools, 0)
+    longest_pause = 0.0
+    done = False
+
+    async def checkouts(count: int) -> tuple[list[float], float]:
+        """count checkouts from args.concurrency clients. Returns (latencies, elapsed)."""
+        latencies = []
+        queue = iter(range(count))
+
+        async def client(user_id: int):
+            for i in queue:
+                started = time.perf_counter()
+                await routes.checkout(user_id, args.helloasso_ms / 1000, str(100_000 + i))
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(user_ids[i % len(user_ids)]) for i in range(args.concurrency)))
+        return latencies, time.perf_counter() - started
+
+    async def slow_requests():
+        while not done:
+            await asyncio.sleep(args.slow_every)
+            await routes.slow_query(args.slow_query_ms / 1000)
+
+    def short_query():
+        with thread_engine.connect() as connection:
+            connection.execute(text("SELECT count(*) FROM users"))
+
+    async def background_job():
+        while not done:
+            await asyncio.sleep(0.1)
+            await asyncio.to_thread(short_query)
+
+    async def ticker():
+        nonlocal longest_pause
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            longest_pause = max(longest_pause, now - last - 0.005)
+            last = now
+            for pool_name, pool in pools.items():
+                peak[pool_name] = max(peak[pool_name], pool.checkedout())
+
+    # Connexions du pool ouvertes avant la mesure
+    await checkouts(args.concurrency)
+
+    side_tasks = [asyncio.create_task(task()) for task in (slow_requests, background_job, ticker)]
+    latencies, elapsed = await checkouts(args.checkouts)
+    done = True
+    await asyncio.gather(*side_tasks)
+
+    print(
+        f"{name:<7} p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  "
+        f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms  max {max(latencies) * 1000:7.1f} ms  "
+        f"{args.checkouts / elapsed:6.0f} checkouts/s  loop pause {longest_pause * 1000:6.1f} ms  "
+        "peak connections " + ", ".join(f"{pool_name} {count}" for pool_name, count in peak.items())
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--checkouts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--helloasso-ms", type=float, default=100)
+    parser.add_argument("--slow-query-ms", type=float, default=200)
+    parser.add_argument("--slow-every", type=float, default=1.0)
+    parser.add_argument("--before-pool", type=pool_size, default=(20, 40))
+    parser.add_argument(
+        "--sync-pool", type=pool_size, default=(settings.DB_SYNC_POOL_SIZE, settings.DB_SYNC_MAX_OVERFLOW)
+    )
+    parser.add_argument(
+        "--async-pool", type=pool_size, default=(settings.DB_ASYNC_POOL_SIZE, settings.DB_ASYNC_MAX_OVERFLOW)
+    )
+    args = parser.parse_args()
+
+    setup_engine = sync_engine((1, 0))
+    delete_users(setup_engine)
+    user_ids = create_users(setup_engine, args.concurrency)
+    print(
+        f"{args.checkouts} checkouts from {args.concurrency} concurrent clients, "
+        f"HelloAsso {args.helloasso_ms:.0f} ms, {args.slow_query_ms:.0f} ms query every {args.slow_every:g}s"
+    )
+    try:
+        before = sync_engine(args.before_pool)
+        print(f"before: sync {args.before_pool[0]}+{args.before_pool[1]}")
+        asyncio.run(run("before", SyncRoutes(before), before, user_ids, args))
+        before.dispose()
+
+        threads = sync_engine(args.sync_pool)
+        routes = AsyncRoutes(args.async_pool)
+        print(
+            f"after:  async {args.async_pool[0]}+{args.async_pool[1]}, "
+            f"sync {args.sync_pool[0]}+{args.sync_pool[1]}"
+        )
+
+        async def after():
+            try:
+                await run("after", routes, threads, user_ids, args)
+            finally:
+                await routes.dispose()
+
+        asyncio.run(after())
+        threads.dispose()
+    finally:
+        delete_users(setup_engine)
+        setup_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Micro-benchmark of the in-memory rate limiter (src/core/rate_limit.py)
+against the previous implementation (one list of datetimes per key).
+
+Measures, for N keys with H hits each:
+- memory per key (tracemalloc, key strings excluded)
+- check_sync throughput
+- full cleanup: total time and longest event loop pause
+
+With --postgres, measures instead the latency of check() with the shared
+Postgres backend (RATE_LIMIT_BACKEND=postgres) against the in-memory
+counters, from concurrent requests on many keys and on one hot key. Needs
+a migrated database (rate_limit_counters) at DATABASE_URL.
+
+Usage (from backend/, with the app's environment loaded):
+    python scripts/bench_rate_limit.py [--keys 100000] [--hits 5]
+    python scripts/bench_rate_limit.py --postgres [--checks 5000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.core.rate_limit import PostgresRateLimitBackend, RateLimiter  # noqa: E402
+
+
+class LegacyRateLimiter:
+    """Rate limiter before the sliding window counter (reference only)."""
+
+    def __init__(self):
+        self.requests: dict[str, list[datetime]] = defaultdict(list)
+        self._lock = asyncio.Lock()
+
+    def check_sync(self, key: str, max_requests: int, window_seconds: int) -> None:
+        now = datetime.now()
+        cutoff = now - timedelta(seconds=window_seconds)
+        self.requests[key] = [t for t in self.requests[key] if t > cutoff]
+        if len(self.requests[key]) >= max_requests:
+            raise Exception("429")
+        self.requests[key].append(now)
+
+    async def cleanup(self, max_age_seconds: int = 3600) -> int:
+        cutoff = datetime.now() - timedelta(seconds=max_age_seconds)
+        keys_to_remove = []
+        async with self._lock:
+            for key, timestamps in self.requests.items():
+                self.requests[key] = [t for t in timestamps if t > cutoff]
+                if not self.requests[key]:
+                    keys_to_remove.append(key)
+            for key in keys_to_remove:
+                del self.requests[key]
+        return len(keys_to_remove)
+
+
+def fill(limiter, keys: list[str], hits: int) -> float:
+    """Hit every key `hits` times. Returns the elapsed seconds."""
+    started = time.perf_counter()
+    for _ in range(hits):
+        for key in keys:
+            limiter.check_sync(key, hits + 1, 3600)
+    return time.perf_counter() - started
+
+
+async def timed_cleanup(limiter) -> tuple[float, float]:
+    """Sweep every key. Returns (total seconds, longest event loop pause)."""
+    longest_pause = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal longest_pause
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            longest_pause = max(longest_pause, now - last)
+            last = now
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await limiter.cleanup(max_age_seconds=0)
+    elapsed = time.perf_counter() - started
+    done = True
+    await tick
+    return elapsed, longest_pause
+
+
+def bench(name: str, factory, keys: list[str], hits: int) -> None:
+    # Memory on one instance, speed on another (tracemalloc slows every allocation)
+    limiter = factory()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    fill(limiter, keys, hits)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    limiter = factory()
+    elapsed = fill(limiter, keys, hits)
+    cleanup_seconds, pause = asyncio.run(timed_cleanup(limiter))
+    checks = len(keys) * hits
+    print(
+        f"{name:<8} {used / len(keys):>5.0f} B/key  {checks / elapsed:>8.0f} checks/s  "
+        f"cleanup {cleanup_seconds * 1000:>6.1f} ms (longest pause {pause * 1000:.1f} ms)"
+    )
+
+
+async def timed_checks(limiter, keys: list[str], checks: int, concurrency: int) -> tuple[list[float], float]:
+    """checks calls of check() from `concurrency` tasks. Returns (latencies, elapsed)."""
+    latencies = []
+    queue = iter(range(checks))
+
+    async def client():
+        for i in queue:
+            started = time.perf_counter()
+            await limiter.check(keys[i % len(keys)], 10 ** 9, 60)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def bench_postgres(checks: int, concurrency: int) -> None:
+    from src.db.session import async_engine
+
+    try:
+        for name, backend in (("memory", None), ("postgres", PostgresRateLimitBackend())):
+            for label, keys in (("many keys", [f"bench:ip:{i}" for i in range(1000)]), ("hot key", ["bench:ip:nat"])):
+                limiter = RateLimiter(backend=backend)
+                # Connexions du pool ouvertes avant la mesure
+                await timed_checks(limiter, keys, concurrency, concurrency)
+                latencies, elapsed = await timed_checks(limiter, keys, checks, concurrency)
+                print(
+                    f"{name:<8} {label:<9}  p50 {percentile(latencies, 0.5) * 1000:6.2f} ms  "
+                    f"p99 {percentile(latencies, 0.99) * 1000:6.2f} ms  "
+                    f"max {max(latencies) * 1000:6.2f} ms  {checks / elapsed:>8.0f} checks/s  "
+                    f"fallbacks {limiter.fallbacks}"
+                )
+            if backend is not None:
+                await backend.cleanup()
+    finally:
+        await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--hits", type=int, default=5)
+    parser.add_argument("--postgres", action="store_true", help="check() latency, Postgres backend vs memory")
+    parser.add_argument("--checks", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.postgres:
+        print(f"{args.checks} checks from {args.concurrency} concurrent clients")
+        asyncio.run(bench_postgres(args.checks, args.concurrency))
+        return
+
+    keys = [f"ip:10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(args.keys)]
+    print(f"{args.keys} keys, {args.hits} hits per key, Python {sys.version.split()[0]}")
+    bench("legacy", LegacyRateLimiter, keys, args.hits)
+    bench("current", RateLimiter, keys, args.hits)
+
+
+if __name__ == "__main__":
+    main()
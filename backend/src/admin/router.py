@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Query
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, cast, extract
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Header, status, Query, UploadFile, File
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, cast, extract, select
 from sqlalchemy.dialects.postgresql import JSONB
 from pydantic import EmailStr
 from typing import List, Optional
@@ -10,10 +11,13 @@ from datetime import date, time, datetime, timezone
 from src.reservations import schemas as res_schemas
 from src.admin import schemas as admin_schemas
 from src.users.router import get_current_user_from_cookie
-from src.db.session import get_db
+from src.db.session import get_async_db, release_connection
 from src.users.models import User
 from src.auth.schemas import UserResponse
 from src.core.exceptions import AdminException
+from src.core.idempotency import idempotency_store
+from src.reservations.availability import release_slot, sync_slot_hold
+from src.payments.background_tasks import schedule_payment_checks
 
 router = APIRouter()
 
@@ -34,7 +38,10 @@ ALLOWED_UPDATE_FIELDS = {
     "bonus_ids",
 }
 
-from src.menu.utils import get_menu_data
+# Max size of an uploaded BDE roster export (10 MB)
+BDE_ROSTER_MAX_BYTES = 10 * 1024 * 1024
+
+from src.menu.utils import get_menu_catalog, get_menu_stats, reload_menu
 
 def require_admin(current_user):
     """Vérifie que l'utilisateur est admin. Lève AdminException sinon."""
@@ -43,42 +50,16 @@ def require_admin(current_user):
     return current_user
 
 
-def get_menu_data_cached():
-    """Get cached menu data. Uses centralized cache from menu.utils."""
-    return get_menu_data()
-
 def get_item_details(item_id):
-    if not item_id: return None
-    data = get_menu_data_cached()
-    for cat in ["menus", "boissons", "extras"]:
-        for item in data.get(cat, []):
-            if item["id"] == item_id:
-                # Add item_type if missing, based on category
-                item_copy = item.copy()
-                if "item_type" not in item_copy:
-                    if cat == "menus": item_copy["item_type"] = "menu"
-                    elif cat == "boissons": item_copy["item_type"] = "boisson"
-                    elif cat == "extras": item_copy["item_type"] = "upsell"
-                return item_copy
-    return None
+    """Find a menu item by ID. Returns a mutable copy (item_type included)."""
+    item = get_menu_catalog().get_item(item_id)
+    return dict(item) if item else None
 
 
 def get_item_by_name(name: str, category: str = None):
-    """Find a menu item by name. Optionally filter by category (menus, boissons, extras)."""
-    if not name:
-        return None
-    data = get_menu_data_cached()
-    categories = [category] if category else ["menus", "boissons", "extras"]
-    for cat in categories:
-        for item in data.get(cat, []):
-            if item["name"].lower() == name.lower():
-                item_copy = item.copy()
-                if "item_type" not in item_copy:
-                    if cat == "menus": item_copy["item_type"] = "menu"
-                    elif cat == "boissons": item_copy["item_type"] = "boisson"
-                    elif cat == "extras": item_copy["item_type"] = "upsell"
-                return item_copy
-    return None
+    """Find a menu item by name (case-insensitive). Optionally filter by category (menus, boissons, extras)."""
+    item = get_menu_catalog().get_item_by_name(name, section=category, case_sensitive=False)
+    return dict(item) if item else None
 
 def enrich_order(user):
     # Convert SQLAlchemy model to dict-like that Pydantic can parse
@@ -118,7 +99,7 @@ async def get_current_user(
 
 @router.get("/orders", response_model=List[admin_schemas.AdminOrderResponse])
 async def list_orders(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie),
     payment_status: Optional[str] = Query(None),
     status: Optional[str] = Query(None)
@@ -126,7 +107,7 @@ async def list_orders(
     """Liste toutes les commandes (utilisateurs avec réservations)"""
     require_admin(current_user)
     
-    query = db.query(User).filter(
+    query = select(User).where(
         User.menu_id.isnot(None) |
         User.boisson_id.isnot(None) |
         (User.bonus_ids.isnot(None) & (func.jsonb_array_length(User.bonus_ids) > 0)) |
@@ -134,11 +115,11 @@ async def list_orders(
     )
     
     if payment_status:
-        query = query.filter(User.payment_status == payment_status)
+        query = query.where(User.payment_status == payment_status)
     if status:
-        query = query.filter(User.status == status)
+        query = query.where(User.status == status)
         
-    orders = query.order_by(User.created_at.desc()).all()
+    orders = (await db.execute(query.order_by(User.created_at.desc()))).scalars().all()
     
     return [enrich_order(u) for u in orders]
 
@@ -146,13 +127,13 @@ async def list_orders(
 @router.get("/orders/{user_id}", response_model=admin_schemas.AdminOrderResponse)
 async def get_order(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie)
 ):
     """Récupère une commande spécifique"""
     require_admin(current_user)
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     
     if not user:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
@@ -164,13 +145,13 @@ async def get_order(
 async def update_order(
     user_id: int,
     order_update: admin_schemas.AdminOrderUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie)
 ):
     """Met à jour une commande"""
     require_admin(current_user)
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
 
@@ -181,11 +162,17 @@ async def update_order(
         if field not in ALLOWED_UPDATE_FIELDS:
             del update_data[field]
 
+    # Give back the slot place first: heure_reservation/menu_id may change
+    await db.run_sync(release_slot, user)
+
     for field, value in update_data.items():
         setattr(user, field, value)
 
-    db.commit()
-    db.refresh(user)
+    # Re-take a place in the (possibly new) slot, without capacity check
+    await db.run_sync(sync_slot_hold, user)
+
+    await db.commit()
+    await db.refresh(user)
 
     return enrich_order(user)
 
@@ -193,19 +180,20 @@ async def update_order(
 @router.delete("/orders/{user_id}")
 async def delete_order(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie)
 ):
     """Supprime une commande et le compte utilisateur associé"""
     require_admin(current_user)
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
     
-    # Delete the user account completely
-    db.delete(user)
-    db.commit()
+    # Give back the slot place, then delete the user account completely
+    await db.run_sync(release_slot, user)
+    await db.delete(user)
+    await db.commit()
     
     return {"message": "Commande et compte utilisateur supprimés avec succès"}
 
@@ -213,13 +201,13 @@ async def delete_order(
 @router.post("/orders/{user_id}/confirm-payment")
 async def confirm_payment_manually(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie)
 ):
     """Confirme manuellement le paiement d'une commande (pour paiements en espèces/liquide)"""
     require_admin(current_user)
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
     
@@ -231,9 +219,11 @@ async def confirm_payment_manually(
     user.payment_status = "completed"
     user.payment_date = datetime.now(timezone.utc)
     user.payment_intent_id = f"manual_{user_id}_{int(datetime.now(timezone.utc).timestamp())}"
+    user.payment_next_check_at = None
+    await db.run_sync(sync_slot_hold, user)
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     return {"message": "Paiement confirmé manuellement", "order": enrich_order(user)}
 
@@ -241,13 +231,13 @@ async def confirm_payment_manually(
 @router.get("/users/{email}", response_model=UserResponse)
 async def get_user_by_email(
     email: EmailStr,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie)
 ):
     """recherche d'un utilisateur par mail"""
     require_admin(current_user)
 
-    user = db.query(User).filter(User.email == email).first()
+    user = (await db.execute(select(User).where(User.email == email))).scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
 
@@ -256,7 +246,7 @@ async def get_user_by_email(
 
 @router.get("/stats")
 async def get_order_statistics(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie)
 ):
     """
@@ -268,26 +258,26 @@ async def get_order_statistics(
     require_admin(current_user)
 
     # Get total count and revenue with single query
-    base_stats = db.query(
+    base_stats = (await db.execute(select(
         func.count(User.id).label('total_orders'),
         func.coalesce(func.sum(User.total_amount), 0).label('total_revenue')
-    ).filter(
+    ).where(
         User.payment_status == "completed",
         User.menu_id.isnot(None)
-    ).first()
+    ))).first()
 
     # Location distribution (MAISEL vs Evry)
-    maisel_count = db.query(func.count(User.id)).filter(
+    maisel_count = (await db.execute(select(func.count(User.id)).where(
         User.payment_status == "completed",
         User.menu_id.isnot(None),
         User.adresse_if_maisel.isnot(None)
-    ).scalar() or 0
+    ))).scalar() or 0
     
-    evry_count = db.query(func.count(User.id)).filter(
+    evry_count = (await db.execute(select(func.count(User.id)).where(
         User.payment_status == "completed",
         User.menu_id.isnot(None),
         User.adresse_if_maisel.is_(None)
-    ).scalar() or 0
+    ))).scalar() or 0
     
     location_distribution = [
         {"name": "MAISEL", "count": maisel_count},
@@ -310,52 +300,48 @@ async def get_order_statistics(
             "total_revenue": 0.0
         }
 
-    menu_data = get_menu_data_cached()
-
-    # Build ID-to-name lookup maps once (instead of per-item lookups)
-    menu_names = {item["id"]: item["name"] for item in menu_data.get("menus", [])}
-    drink_names = {item["id"]: item["name"] for item in menu_data.get("boissons", [])}
-    extra_names = {item["id"]: item["name"] for item in menu_data.get("extras", [])}
+    # O(1) ID-to-name lookups through the shared catalog indexes
+    catalog = get_menu_catalog()
 
     # Menu distribution - database aggregation
-    menu_counts = db.query(
+    menu_counts = (await db.execute(select(
         User.menu_id,
         func.count(User.id).label('count')
-    ).filter(
+    ).where(
         User.payment_status == "completed",
         User.menu_id.isnot(None)
-    ).group_by(User.menu_id).all()
+    ).group_by(User.menu_id))).all()
 
     menu_distribution = sorted(
-        [{"name": menu_names.get(row.menu_id, row.menu_id), "count": row.count}
+        [{"name": catalog.get_item_name(row.menu_id, default=row.menu_id), "count": row.count}
          for row in menu_counts if row.menu_id],
         key=lambda x: -x["count"]
     )
 
     # Drink distribution - database aggregation
-    drink_counts = db.query(
+    drink_counts = (await db.execute(select(
         User.boisson_id,
         func.count(User.id).label('count')
-    ).filter(
+    ).where(
         User.payment_status == "completed",
         User.boisson_id.isnot(None)
-    ).group_by(User.boisson_id).all()
+    ).group_by(User.boisson_id))).all()
 
     drink_distribution = sorted(
-        [{"name": drink_names.get(row.boisson_id, row.boisson_id), "count": row.count}
+        [{"name": catalog.get_item_name(row.boisson_id, default=row.boisson_id), "count": row.count}
          for row in drink_counts if row.boisson_id],
         key=lambda x: -x["count"]
     )
 
     # Time slot distribution - database aggregation
-    time_slot_counts = db.query(
+    time_slot_counts = (await db.execute(select(
         extract('hour', User.heure_reservation).label('hour'),
         func.count(User.id).label('count')
-    ).filter(
+    ).where(
         User.payment_status == "completed",
         User.menu_id.isnot(None),
         User.heure_reservation.isnot(None)
-    ).group_by(extract('hour', User.heure_reservation)).all()
+    ).group_by(extract('hour', User.heure_reservation)))).all()
 
     time_slot_distribution = sorted(
         [{"slot": f"{int(row.hour)}h-{int(row.hour)+1}h", "count": row.count}
@@ -364,14 +350,14 @@ async def get_order_statistics(
     )
 
     # Order hour distribution - database aggregation
-    order_hour_counts = db.query(
+    order_hour_counts = (await db.execute(select(
         extract('hour', User.created_at).label('hour'),
         func.count(User.id).label('count')
-    ).filter(
+    ).where(
         User.payment_status == "completed",
         User.menu_id.isnot(None),
         User.created_at.isnot(None)
-    ).group_by(extract('hour', User.created_at)).all()
+    ).group_by(extract('hour', User.created_at)))).all()
 
     order_hour_distribution = sorted(
         [{"hour": int(row.hour), "count": row.count}
@@ -381,10 +367,10 @@ async def get_order_statistics(
 
     # Extras distribution - need to fetch bonus_ids and aggregate in Python
     # (JSON array aggregation is complex across databases)
-    orders_with_extras = db.query(User.bonus_ids).filter(
+    orders_with_extras = (await db.execute(select(User.bonus_ids).where(
         User.payment_status == "completed",
         User.bonus_ids.isnot(None)
-    ).all()
+    ))).all()
 
     extras_counts = Counter()
     for (bonus_ids,) in orders_with_extras:
@@ -394,7 +380,7 @@ async def get_order_statistics(
 
     total_extras = sum(extras_counts.values())
     extras_distribution = sorted(
-        [{"name": extra_names.get(extra_id, extra_id), "count": count}
+        [{"name": catalog.get_item_name(extra_id, default=extra_id), "count": count}
          for extra_id, count in extras_counts.items()],
         key=lambda x: -x["count"]
     )
@@ -415,12 +401,25 @@ async def get_order_statistics(
 @router.post("/orders/create", response_model=admin_schemas.AdminOrderResponse)
 async def create_order(
     order_data: admin_schemas.AdminCreateOrder,
-    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie)
 ):
     """Crée manuellement une commande (admin uniquement, aucune validation)"""
     require_admin(current_user)
 
+    # Idempotency-Key: un double envoi du formulaire ne crée pas deux commandes
+    return await idempotency_store.run(
+        idempotency_key,
+        current_user.id,
+        "admin.orders.create",
+        order_data,
+        lambda: _create_order(order_data, db),
+    )
+
+
+async def _create_order(order_data: admin_schemas.AdminCreateOrder, db: AsyncSession):
+
     # Look up menu item by name
     menu_item = get_item_by_name(order_data.menu, "menus")
     if not menu_item:
@@ -464,9 +463,11 @@ async def create_order(
         raise HTTPException(status_code=400, detail="Format heure invalide (HH:MM attendu)")
 
     # Check if user with same email exists - update instead of duplicate
-    existing_user = db.query(User).filter(User.email == email).first()
+    existing_user = (await db.execute(select(User).where(User.email == email))).scalars().first()
 
     if existing_user:
+        # Give back the place of the replaced order before changing the slot
+        await db.run_sync(release_slot, existing_user)
         existing_user.menu_id = menu_item["id"]
         existing_user.boisson_id = boisson_item["id"] if boisson_item else None
         existing_user.bonus_ids = bonus_ids if bonus_ids else []
@@ -484,8 +485,10 @@ async def create_order(
         existing_user.email_verified = True
         existing_user.is_cotisant = True
         existing_user.status = "confirmed"
-        db.commit()
-        db.refresh(existing_user)
+        # Admin orders may overbook the slot (no validation)
+        await db.run_sync(sync_slot_hold, existing_user)
+        await db.commit()
+        await db.refresh(existing_user)
         return enrich_order(existing_user)
 
     # Create new user
@@ -513,21 +516,23 @@ async def create_order(
     )
 
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    # Admin orders may overbook the slot (no validation)
+    await db.run_sync(sync_slot_hold, new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return enrich_order(new_user)
 
 
 @router.post("/orders/{user_id}/checkout-link")
 async def generate_checkout_link(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie)
 ):
     """Génère un lien de paiement HelloAsso pour une commande (admin uniquement)"""
     require_admin(current_user)
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Commande non trouvée")
 
@@ -552,6 +557,9 @@ async def generate_checkout_link(
 
     metadata = {"reservation_id": user.id}
 
+    # Give the connection back to the pool during the HelloAsso call
+    await release_connection(db)
+
     result = await helloasso_service.create_checkout_intent(
         payer_email=user.email,
         payer_first_name=payer_first,
@@ -570,6 +578,133 @@ async def generate_checkout_link(
     user.payment_intent_id = checkout_intent_id
     user.checkout_redirect_url = redirect_url
     user.checkout_created_at = datetime.now(timezone.utc)
-    db.commit()
+    schedule_payment_checks(user, user.checkout_created_at)
+    await db.commit()
+
+    return {"redirect_url": redirect_url, "checkout_intent_id": checkout_intent_id}
+
+
+@router.post("/payments/reconcile")
+async def reconcile_payments(
+    full: bool = Query(False, description="Relire toutes les commandes HelloAsso (ignore le point de reprise)"),
+    current_user = Depends(get_current_user_from_cookie)
+):
+    """Rapproche les paiements en attente avec la liste des commandes HelloAsso"""
+    require_admin(current_user)
+
+    from src.payments.reconciliation import reconcile_orders
+
+    try:
+        return await reconcile_orders(full=full)
+    except Exception as e:
+        print(f"[RECONCILE] Admin reconciliation failed: {e}")
+        raise HTTPException(status_code=502, detail="Rapprochement HelloAsso impossible")
+
+
+@router.get("/bde-roster")
+async def get_bde_roster(
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user_from_cookie)
+):
+    """Taille et date du roster BDE importé"""
+    require_admin(current_user)
+
+    from src.auth.roster import get_roster_info
+
+    return await get_roster_info(db)
+
+
+@router.post("/bde-roster")
+async def import_bde_roster(
+    file: UploadFile = File(..., description="Export des membres BDE (CSV ou JSON)"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user_from_cookie)
+):
+    """Remplace le roster BDE (les connexions des membres listés n'appellent plus l'API BDE)"""
+    require_admin(current_user)
+
+    from src.auth.roster import RosterFormatError, parse_roster, replace_roster
+
+    content = await file.read(BDE_ROSTER_MAX_BYTES + 1)
+    if len(content) > BDE_ROSTER_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Fichier trop volumineux")
+
+    try:
+        members, rejected = parse_roster(content, file.filename or "")
+    except RosterFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not members:
+        raise HTTPException(status_code=400, detail="Aucun membre valide dans le fichier")
+
+    imported = await replace_roster(db, members)
+    return {"imported": imported, "rejected": rejected}
+
+
+@router.delete("/bde-roster")
+async def clear_bde_roster(
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user_from_cookie)
+):
+    """Vide le roster BDE (retour à la vérification par l'API BDE)"""
+    require_admin(current_user)
+
+    from src.auth.roster import clear_roster
+
+    return {"removed": await clear_roster(db)}
+
 
-    return {"redirect_url": redirect_url, "checkout_intent_id": checkout_intent_id}
\ No newline at end of file
+@router.post("/menu/reload")
+async def reload_menu_data(
+    current_user = Depends(get_current_user_from_cookie)
+):
+    """Recharge menu_data.json immédiatement (sans attendre le watcher)"""
+    require_admin(current_user)
+
+    reloaded = await asyncio.to_thread(reload_menu, True)
+
+    return {"reloaded": reloaded, "menu": get_menu_stats()}
+
+
+@router.get("/metrics")
+async def get_metrics(
+    current_user = Depends(get_current_user_from_cookie)
+):
+    """Compteurs internes (caches, rechargements) pour le monitoring"""
+    require_admin(current_user)
+
+    from src.auth.service import get_access_list_stats
+    from src.db.session import get_pool_stats
+    from src.payments.background_tasks import get_poller_stats
+    from src.payments.router import get_notification_stats
+    from src.payments.helloasso_service import get_intent_cache_stats, get_token_stats
+    from src.payments.reconciliation import get_reconciliation_stats
+    from src.reservations.availability import get_expiry_stats
+    from src.reservations.cache import availability_cache
+    from src.reservations.stream import availability_hub
+    from src.outbox import outbox_sender
+    from src.mail import smtp_pool
+    from src.core.rate_limit import rate_limiter
+    from src.core.rate_limit_middleware import request_limits
+    from src.auth.membership import bde_membership
+    from src.auth.roster import get_roster_stats
+
+    return {
+        "menu": get_menu_stats(),
+        "access_lists": get_access_list_stats(),
+        "expired_holds": get_expiry_stats(),
+        "availability_cache": availability_cache.get_stats(),
+        "availability_stream": availability_hub.get_stats(),
+        "db_pool": get_pool_stats(),
+        "payment_poller": get_poller_stats(),
+        "payment_notifications": get_notification_stats(),
+        "checkout_intents": get_intent_cache_stats(),
+        "helloasso_token": get_token_stats(),
+        "payment_reconciliation": get_reconciliation_stats(),
+        "idempotency": idempotency_store.get_stats(),
+        "email_outbox": await outbox_sender.get_stats(),
+        "smtp_pool": smtp_pool.get_stats(),
+        "rate_limiter": rate_limiter.get_stats(),
+        "request_limits": request_limits.get_stats(),
+        "bde_membership": bde_membership.get_stats(),
+        "bde_roster": get_roster_stats(),
+    }
@@ -0,0 +1,118 @@
+"""
+Cache of BDE membership checks (verify_with_bde).
+
+Features:
+- Positive result reused from the database (users.is_cotisant and
+  cotisant_checked_at) while younger than BDE_MEMBERSHIP_TTL_MINUTES
+- Short in-memory cache of negative results (a user who just paid the
+  membership is only refused for a few seconds)
+- Concurrent lookups for the same identity share one BDE API call
+- Hit/miss counters for monitoring
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from src.core.config import settings
+from src.core.security import verify_with_bde
+
+# Max negative results kept (expired ones are dropped first when full)
+BDE_NEGATIVE_CACHE_MAX_SIZE = 10000
+
+
+class BDEMembershipCache:
+    """Membership lookups, BDE API called at most once per identity and window."""
+
+    def __init__(self):
+        # identity -> monotonic expiry of the negative result
+        self._negative: dict[str, float] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+
+        self.db_hits = 0
+        self.negative_hits = 0
+        self.coalesced = 0
+        self.bde_calls = 0
+
+    def _is_fresh(self, checked_at: Optional[datetime]) -> bool:
+        if checked_at is None:
+            return False
+        if checked_at.tzinfo is None:
+            checked_at = checked_at.replace(tzinfo=timezone.utc)  # Stored as naive UTC
+        age = datetime.now(timezone.utc) - checked_at
+        return age < timedelta(minutes=settings.BDE_MEMBERSHIP_TTL_MINUTES)
+
+    def _store_negative(self, identity: str) -> None:
+        now = time.monotonic()
+        if len(self._negative) >= BDE_NEGATIVE_CACHE_MAX_SIZE:
+            self._negative = {key: expiry for key, expiry in self._negative.items() if expiry > now}
+            if len(self._negative) >= BDE_NEGATIVE_CACHE_MAX_SIZE:
+                self._negative.pop(next(iter(self._negative)))
+        self._negative[identity] = now + settings.BDE_NEGATIVE_CACHE_TTL_SECONDS
+
+    async def _lookup(self, email: str, identity: str) -> bool:
+        try:
+            self.bde_calls += 1
+            is_cotisant = await verify_with_bde(email)
+            if is_cotisant:
+                self._negative.pop(identity, None)
+            else:
+                self._store_negative(identity)
+            return is_cotisant
+        finally:
+            self._inflight.pop(identity, None)
+
+    async def check(
+        self,
+        email: str,
+        identity: str,
+        stored_is_cotisant: Optional[bool],
+        stored_checked_at: Optional[datetime],
+    ) -> tuple[bool, bool]:
+        """
+        Membership of a user (identity = normalized prenom.nom).
+
+        Returns (is_cotisant, checked_now); checked_now is True if the BDE API
+        was asked, i.e. cotisant_checked_at must be updated.
+        Errors of the BDE API (HTTPException) are raised and never cached.
+        """
+        if stored_is_cotisant and self._is_fresh(stored_checked_at):
+            self.db_hits += 1
+            return True, False
+
+        expiry = self._negative.get(identity)
+        if expiry is not None:
+            if expiry > time.monotonic():
+                self.negative_hits += 1
+                return False, False
+            self._negative.pop(identity, None)
+
+        task = self._inflight.get(identity)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._lookup(email, identity))
+            # Retrieve the exception even if every caller went away
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[identity] = task
+
+        # Shielded: a client disconnecting doesn't cancel the call for the others
+        return await asyncio.shield(task), True
+
+    def get_stats(self) -> dict:
+        """Hit/miss counters (for monitoring)."""
+        lookups = self.db_hits + self.negative_hits + self.coalesced + self.bde_calls
+        hits = self.db_hits + self.negative_hits + self.coalesced
+        return {
+            "ttl_minutes": settings.BDE_MEMBERSHIP_TTL_MINUTES,
+            "negative_ttl_seconds": settings.BDE_NEGATIVE_CACHE_TTL_SECONDS,
+            "db_hits": self.db_hits,
+            "negative_hits": self.negative_hits,
+            "coalesced": self.coalesced,
+            "bde_calls": self.bde_calls,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "negative_entries": len(self._negative),
+        }
+
+
+bde_membership = BDEMembershipCache()
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, String, DateTime
+from datetime import datetime, timezone
+from src.db.base import Base
+
+
+class BDERosterMember(Base):
+    """BDE member from the last imported roster (see auth/roster.py)."""
+    __tablename__ = "bde_roster_members"
+
+    identity = Column(String, primary_key=True)  # prenom.nom, as normalize_email()
+    email = Column(String, nullable=True)  # As listed in the export
+    imported_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
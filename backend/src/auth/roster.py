@@ -0,0 +1,223 @@
+"""
+Offline roster of BDE members.
+
+Features:
+- Import of a BDE member export (CSV or JSON) into bde_roster_members,
+  keyed by the normalized identity (prenom.nom, as normalize_email())
+- Atomic hot swap: the old roster is replaced in one transaction, logins
+  see either the old or the new one, never an empty table
+- verify_code looks the roster up first; the BDE API is only called for
+  identities missing from it
+
+Import from the command line (in the backend container):
+    python -m src.auth.roster members.csv
+"""
+import asyncio
+import csv
+import io
+import json
+import sys
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.auth.models import BDERosterMember
+
+# Column names accepted for the email in CSV/JSON exports
+ROSTER_EMAIL_FIELDS = ("email", "mail", "e-mail", "courriel", "adresse email")
+
+# Rows inserted per statement during an import
+ROSTER_INSERT_BATCH = 1000
+
+_roster_stats = {
+    "hits": 0,
+    "misses": 0,
+    "imports": 0,
+}
+
+
+class RosterFormatError(ValueError):
+    """Export that can't be read as a member list."""
+
+
+def roster_identity(value: str) -> Optional[str]:
+    """
+    Normalized identity of a roster entry (email, or prenom.nom).
+    Returns None if the entry isn't a valid school identity.
+    """
+    from src.auth.service import normalize_email
+    from src.core.exceptions import InvalidEmailException
+
+    value = (value or "").strip().lower()
+    if not value:
+        return None
+    if "@" in value:
+        try:
+            return normalize_email(value)[1]
+        except InvalidEmailException:
+            return None
+
+    identity = value.replace("_", ".")
+    if len([part for part in identity.split(".") if part]) < 2:
+        return None
+    return identity
+
+
+def _json_values(data) -> list[str]:
+    if isinstance(data, dict):
+        data = data.get("members") or data.get("data") or []
+    if not isinstance(data, list):
+        raise RosterFormatError("Liste de membres attendue")
+
+    values = []
+    for item in data:
+        if isinstance(item, str):
+            values.append(item)
+        elif isinstance(item, dict):
+            fields = {str(key).strip().lower(): value for key, value in item.items()}
+            values.append(next((str(fields[name]) for name in ROSTER_EMAIL_FIELDS if fields.get(name)), ""))
+    return values
+
+
+def _csv_values(content: str) -> list[str]:
+    try:
+        dialect = csv.Sniffer().sniff(content[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    rows = [row for row in csv.reader(io.StringIO(content), dialect) if any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = next((header.index(name) for name in ROSTER_EMAIL_FIELDS if name in header), None)
+    if column is not None:
+        return [row[column] if column < len(row) else "" for row in rows[1:]]
+
+    # Pas d'en-tête reconnu: première cellule contenant un email
+    return [next((cell for cell in row if "@" in cell), row[0]) for row in rows]
+
+
+def parse_roster(content: bytes, filename: str = "") -> tuple[dict[str, str], int]:
+    """
+    Read a CSV or JSON member export.
+
+    Returns ({identity: listed value}, number of rejected entries).
+
+    Raises:
+        RosterFormatError: unreadable file
+    """
+    try:
+        decoded = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        decoded = content.decode("latin-1")
+
+    if filename.lower().endswith(".json") or decoded.lstrip().startswith(("[", "{")):
+        try:
+            values = _json_values(json.loads(decoded))
+        except json.JSONDecodeError as e:
+            raise RosterFormatError(f"JSON invalide: {e}")
+    else:
+        values = _csv_values(decoded)
+
+    members: dict[str, str] = {}
+    rejected = 0
+    for value in values:
+        identity = roster_identity(value)
+        if identity is None:
+            rejected += 1
+        else:
+            members[identity] = value.strip().lower()
+    return members, rejected
+
+
+async def replace_roster(db: AsyncSession, members: dict[str, str]) -> int:
+    """Replace the whole roster in one transaction. Returns the member count."""
+    now = datetime.now(timezone.utc)
+    rows = [{"identity": identity, "email": email, "imported_at": now} for identity, email in members.items()]
+
+    try:
+        # Imports simultanés sérialisés; les lectures continuent sur l'ancien roster
+        await db.execute(text("LOCK TABLE bde_roster_members IN EXCLUSIVE MODE"))
+        await db.execute(delete(BDERosterMember))
+        for start in range(0, len(rows), ROSTER_INSERT_BATCH):
+            await db.execute(insert(BDERosterMember), rows[start:start + ROSTER_INSERT_BATCH])
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    _roster_stats["imports"] += 1
+    print(f"[ROSTER] Imported {len(rows)} BDE members")
+    return len(rows)
+
+
+async def clear_roster(db: AsyncSession) -> int:
+    """Empty the roster (every check goes back to the BDE API). Returns the removed count."""
+    result = await db.execute(delete(BDERosterMember))
+    await db.commit()
+    return result.rowcount
+
+
+async def is_roster_member(db: AsyncSession, identity: str) -> bool:
+    """True if the identity is in the imported roster (one primary key lookup)."""
+    found = await db.scalar(select(BDERosterMember.identity).where(BDERosterMember.identity == identity))
+    if found is None:
+        _roster_stats["misses"] += 1
+        return False
+    _roster_stats["hits"] += 1
+    return True
+
+
+async def get_roster_info(db: AsyncSession) -> dict:
+    """Size and date of the current roster."""
+    count, imported_at = (await db.execute(
+        select(func.count(BDERosterMember.identity), func.max(BDERosterMember.imported_at))
+    )).one()
+    return {
+        "members": count,
+        "imported_at": imported_at.replace(tzinfo=timezone.utc).isoformat() if imported_at else None,
+    }
+
+
+def get_roster_stats() -> dict:
+    """Roster lookup counters (for monitoring)."""
+    lookups = _roster_stats["hits"] + _roster_stats["misses"]
+    return {
+        **_roster_stats,
+        "hit_rate": round(_roster_stats["hits"] / lookups, 3) if lookups else 0.0,
+    }
+
+
+async def _import_file(path: str) -> None:
+    from src.db.session import AsyncSessionLocal, async_engine
+
+    with open(path, "rb") as f:
+        members, rejected = parse_roster(f.read(), path)
+    if not members:
+        raise RosterFormatError("Aucun membre valide dans le fichier")
+
+    try:
+        async with AsyncSessionLocal() as db:
+            count = await replace_roster(db, members)
+    finally:
+        await async_engine.dispose()
+    print(f"{count} membres importés, {rejected} lignes ignorées")
+
+
+def main(argv: Iterable[str]) -> int:
+    args = list(argv)
+    if len(args) != 1:
+        print("Usage: python -m src.auth.roster <export.csv|export.json>")
+        return 1
+    try:
+        asyncio.run(_import_file(args[0]))
+    except (OSError, RosterFormatError) as e:
+        print(f"Erreur: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
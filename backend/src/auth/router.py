@@ -1,12 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, status, Request, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.db.session import get_db
+from src.db.session import get_async_db
 from src.auth import schemas, service
 from src.auth.service import is_ordering_open
 from src.core.exceptions import UserNotVerifiedException
 from src.core.rate_limit import rate_limiter
-from src.mail import send_verification_email
+from src.outbox import outbox_sender
 
 router = APIRouter()
 
@@ -14,13 +14,12 @@ router = APIRouter()
 @router.post("/request-code", response_model=schemas.RequestCodeResponse)
 async def request_code(
     request: schemas.RequestCodeRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Étape 1: L'utilisateur rentre son email
     - Génère un code à 6 chiffres/lettres
-    - Envoie l'email avec code et lien (en background)
+    - Envoie l'email avec code et lien (via l'outbox)
     - Crée/met à jour l'utilisateur en DB
     """
     if not is_ordering_open():
@@ -32,11 +31,10 @@ async def request_code(
     # Rate limit by email: 3 requests per 15 minutes
     await rate_limiter.check(f"email:{request.email}", max_requests=3, window_seconds=900)
 
-    # Generate code and save to DB (returns immediately)
-    delivery_email, code = await service.request_verification_code(request.email, db)
-
-    # Send email in background to avoid blocking the response
-    background_tasks.add_task(send_verification_email, delivery_email, code)
+    # Save the code and queue the email in one transaction (sent by the
+    # outbox sender, retried on failure)
+    await service.request_verification_code(request.email, db)
+    outbox_sender.wake()
 
     return schemas.RequestCodeResponse(
         message=f"Code de vérification envoyé à {request.email}",
@@ -49,7 +47,7 @@ async def verify_code(
     request_data: schemas.VerifyCodeRequest,
     response: Response,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Étape 2: L'utilisateur clique sur le lien ou rentre le code
@@ -117,7 +115,7 @@ async def logout(response: Response):
 async def refresh_access_token(
     request: Request,
     response: Response,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Rafraîchit l'access token en utilisant le refresh token
@@ -136,7 +134,7 @@ async def refresh_access_token(
     token_data = decode_token(refresh_token, expected_type="refresh")
     
     # Vérifier que l'utilisateur existe toujours
-    user = service.get_user_by_token(refresh_token, db, expected_type="refresh")
+    user = await service.get_user_by_token(refresh_token, db, expected_type="refresh")
     
     if not user or not user.email_verified:
         raise HTTPException(
@@ -1,13 +1,22 @@
+import json
+import os
 import random
 import string
+import threading
+import time
+from typing import Optional
 from datetime import datetime, timedelta, timezone
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, select
 from sqlalchemy.exc import IntegrityError
 
 from src.users.models import User
+from src.db.session import release_connection
 from src.core.config import settings
-from src.core.security import verify_with_bde, create_access_token
+from src.core.security import create_access_token
+from src.auth.membership import bde_membership
+from src.auth.roster import is_roster_member
+from src.outbox import enqueue_email
 from src.core.exceptions import (
     InvalidCredentialsException,
     CodeExpiredException,
@@ -75,30 +84,123 @@ def normalize_email(email: str) -> tuple[str, str]:
     return delivery_email, identity
 
 
+# How often an access list checks its file for changes (seconds)
+ACCESS_LIST_CHECK_INTERVAL = 2.0
+
+ACCESS_LISTS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "..")
+
+
+def normalize_identity(identity: str) -> str:
+    """Normalise une identité prenom.nom pour la comparaison (minuscules, _ -> .)"""
+    return identity.lower().replace("_", ".")
+
+
+class AccessList:
+    """
+    Cached set of identities loaded from a JSON file (blacklist/whitelist).
+
+    The normalized identities are kept in a frozenset, so a membership check
+    is one hash lookup. The file is stat'ed at most once per check interval
+    and only re-read when its mtime/inode/size changes (e.g. the mounted
+    file was edited or replaced).
+
+    A missing or corrupt file yields an empty list; callers decide whether
+    that means fail-open or fail-closed.
+    """
+
+    def __init__(self, path: str, key: str, check_interval: float = ACCESS_LIST_CHECK_INTERVAL):
+        self.path = path
+        self.key = key
+        self.check_interval = check_interval
+        self._entries: frozenset[str] = frozenset()
+        self._file_signature: Optional[tuple] = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.loaded_at: Optional[datetime] = None
+        self.load_count = 0
+        self.last_error: Optional[str] = None
+
+    def _file_stat(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def _load(self, signature: Optional[tuple]) -> None:
+        entries: frozenset[str] = frozenset()
+        error = None
+        if signature is None:
+            error = "file not found"
+        else:
+            try:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                entries = frozenset(
+                    normalize_identity(u) for u in data.get(self.key, []) if isinstance(u, str)
+                )
+            except (OSError, json.JSONDecodeError, AttributeError) as e:
+                error = str(e)
+
+        self._entries = entries
+        self._file_signature = signature
+        self.loaded_at = datetime.now(timezone.utc)
+        self.load_count += 1
+        self.last_error = error
+        if error:
+            print(f"[ACCESS_LIST] {os.path.basename(self.path)}: {error}")
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            signature = self._file_stat()
+            if self._checked_at is None or signature != self._file_signature:
+                self._load(signature)
+            self._checked_at = now
+
+    def contains(self, identity: str) -> bool:
+        """True si l'identité (déjà non vide) figure dans la liste."""
+        self._refresh()
+        return normalize_identity(identity) in self._entries
+
+    def get_stats(self) -> dict:
+        """Taille, date de chargement et erreur éventuelle (monitoring)."""
+        self._refresh()
+        return {
+            "size": len(self._entries),
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "load_count": self.load_count,
+            "last_error": self.last_error,
+        }
+
+
+whitelist = AccessList(os.path.join(ACCESS_LISTS_DIR, "whitelist.json"), "allowed_users")
+blacklist = AccessList(os.path.join(ACCESS_LISTS_DIR, "blacklist.json"), "blocked_users")
+
+
+def get_access_list_stats() -> dict:
+    """Statistiques des listes d'accès (blacklist/whitelist)."""
+    return {
+        "blacklist": blacklist.get_stats(),
+        "whitelist": whitelist.get_stats(),
+    }
+
+
 def is_user_whitelisted(identity: str) -> bool:
     """
     Vérifie si l'utilisateur (prenom.nom) est dans la whitelist.
     Les utilisateurs whitelistés peuvent commander même sans être cotisant BDE.
     Normalise les _ en . pour la comparaison.
     """
-    import json
-    import os
-
     if not identity or not identity.strip():
         return False
 
-    whitelist_path = os.path.join(os.path.dirname(__file__), "..", "..", "..", "whitelist.json")
-
-    normalized_identity = identity.lower().replace("_", ".")
-
-    try:
-        with open(whitelist_path, "r") as f:
-            data = json.load(f)
-            allowed_users = data.get("allowed_users", [])
-            normalized_allowed = [u.lower().replace("_", ".") for u in allowed_users]
-            return normalized_identity in normalized_allowed
-    except (FileNotFoundError, json.JSONDecodeError):
-        return False
+    # Fichier absent/corrompu: liste vide, personne n'est whitelisté
+    return whitelist.contains(identity)
 
 
 def is_user_blacklisted(identity: str) -> bool:
@@ -106,36 +208,29 @@ def is_user_blacklisted(identity: str) -> bool:
     Vérifie si l'utilisateur (prenom.nom) est dans la blacklist.
     Normalise les _ en . pour la comparaison.
     """
-    import json
-    import os
-    
     # CRITICAL: If identity is None or empty, reject to be safe
     # This prevents bypassing the blacklist with empty/None normalized_email
     if not identity or not identity.strip():
         return True  # Treat as blacklisted for security
-    
-    blacklist_path = os.path.join(os.path.dirname(__file__), "..", "..", "..", "blacklist.json")
-    
-    # Normaliser l'identité (remplacer _ par .)
-    normalized_identity = identity.lower().replace("_", ".")
-    
-    try:
-        with open(blacklist_path, "r") as f:
-            data = json.load(f)
-            blocked_users = data.get("blocked_users", [])
-            # Normaliser aussi les entrées de la blacklist
-            normalized_blocked = [u.lower().replace("_", ".") for u in blocked_users]
-            return normalized_identity in normalized_blocked
-    except (FileNotFoundError, json.JSONDecodeError):
-        # If blacklist file is missing/corrupt, be permissive (return False)
-        # This maintains backward compatibility
-        return False
 
+    # If blacklist file is missing/corrupt, the list is empty and we are
+    # permissive (return False). This maintains backward compatibility
+    return blacklist.contains(identity)
+
+
+async def _get_user_by_identity(db: AsyncSession, identity: str, delivery_email: str) -> Optional[User]:
+    """Cherche l'utilisateur par normalized_email puis, à défaut, par email."""
+    user = (await db.execute(select(User).where(User.normalized_email == identity))).scalars().first()
+    if not user:
+        user = (await db.execute(select(User).where(User.email == delivery_email))).scalars().first()
+    return user
 
-async def request_verification_code(email: str, db: Session) -> tuple[str, str]:
+
+async def request_verification_code(email: str, db: AsyncSession) -> tuple[str, str]:
     """
-    Génère un code de vérification et le sauvegarde en base.
-    Retourne (delivery_email, code) pour envoi ultérieur en background.
+    Génère un code de vérification, le sauvegarde en base et met l'email en
+    file d'attente (outbox) dans la même transaction.
+    Retourne (delivery_email, code). L'appelant réveille outbox_sender.
     Lance exception si erreur.
     """
     # Valider et normaliser l'email
@@ -150,7 +245,7 @@ async def request_verification_code(email: str, db: Session) -> tuple[str, str]:
     code = ''.join(random.choices(chars, k=settings.EMAIL_CODE_LENGTH))
 
     # Trouver ou créer utilisateur par normalized_email (qui contient maintenant l'identité prenom.nom)
-    user = db.query(User).filter(User.normalized_email == identity).first()
+    user = (await db.execute(select(User).where(User.normalized_email == identity))).scalars().first()
     if not user:
         user = User(email=delivery_email, normalized_email=identity)
         db.add(user)
@@ -162,50 +257,50 @@ async def request_verification_code(email: str, db: Session) -> tuple[str, str]:
     user.verification_code = code
     user.code_created_at = datetime.now(timezone.utc)
 
+    # Même transaction: l'email part si et seulement si le code est enregistré
+    enqueue_email(db, "verification", delivery_email, payload={"code": code})
+
     try:
-        db.commit()
+        await db.commit()
     except IntegrityError:
         # Race condition: another request created the user between our check and insert
-        db.rollback()
-        # Retry by fetching the existing user and updating
-        user = db.query(User).filter(User.normalized_email == identity).first()
-        if not user:
-            # Try by email as fallback
-            user = db.query(User).filter(User.email == delivery_email).first()
+        await db.rollback()
+        # Retry by fetching the existing user (email as fallback) and updating
+        user = await _get_user_by_identity(db, identity, delivery_email)
         if not user:
             raise EmailSendFailedException("Erreur base de données")
         user.email = delivery_email
         user.normalized_email = identity  # Sync normalized_email
         user.verification_code = code
         user.code_created_at = datetime.now(timezone.utc)
+        enqueue_email(db, "verification", delivery_email, payload={"code": code})
         try:
-            db.commit()
+            await db.commit()
         except Exception:
-            db.rollback()
+            await db.rollback()
             raise EmailSendFailedException("Erreur base de données")
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise EmailSendFailedException("Erreur base de données")
 
-    # Return email and code for background sending
     return delivery_email, code
 
 
-async def verify_code(email: str, code: str, db: Session, client_ip: str = None) -> tuple[int, bool]:
+async def verify_code(email: str, code: str, db: AsyncSession, client_ip: str = None) -> tuple[int, bool]:
     """
     Vérifie le code et retourne (user_id, is_cotisant).
     Lance une exception si invalide/expiré.
-    Vérifie aussi avec BDE API.
+    Vérifie aussi avec BDE API (résultat récent réutilisé, voir auth/membership.py).
     """
     
     # Valider et normaliser
     delivery_email, identity = normalize_email(email)
 
     # Chercher utilisateur par normalized_email (identité unique)
-    user = db.query(User).filter(User.normalized_email == identity).first()
+    user = (await db.execute(select(User).where(User.normalized_email == identity))).scalars().first()
     if not user:
         # Fallback: chercher par email
-        user = db.query(User).filter(User.email == delivery_email).first()
+        user = (await db.execute(select(User).where(User.email == delivery_email))).scalars().first()
         # CRITICAL: Sync normalized_email if found by email fallback
         # This ensures old users get their normalized_email updated
         if user:
@@ -236,15 +331,25 @@ async def verify_code(email: str, code: str, db: Session, client_ip: str = None)
     if time_diff > timedelta(minutes=settings.EMAIL_CODE_EXPIRE_MINUTES):
         user.verification_code = None
         user.code_created_at = None
-        db.commit()
+        await db.commit()
         raise CodeExpiredException()
 
     # Whitelist override: skip BDE check entirely for whitelisted users
     # (BDE API may reject non-standard emails like + aliases)
     if is_user_whitelisted(identity):
-        is_cotisant = True
+        is_cotisant, checked_now = True, True
+    elif await is_roster_member(db, identity):
+        # Roster BDE importé: pas d'appel à l'API. cotisant_checked_at reste
+        # la date de la dernière vérif API: retiré du roster, l'utilisateur
+        # n'est pas couvert par un faux résultat récent
+        is_cotisant, checked_now = True, False
     else:
-        is_cotisant = await verify_with_bde(email)
+        stored_is_cotisant, stored_checked_at = user.is_cotisant, user.cotisant_checked_at
+        # Connexion DB rendue au pool pendant l'appel (éventuel) à l'API BDE
+        await release_connection(db)
+        is_cotisant, checked_now = await bde_membership.check(
+            email, identity, stored_is_cotisant, stored_checked_at
+        )
 
     # Extraire prénom/nom depuis l'email (format prenom.nom@...)
     try:
@@ -273,14 +378,15 @@ async def verify_code(email: str, code: str, db: Session, client_ip: str = None)
     # Marquer email comme vérifié et log IP
     user.email_verified = True
     user.is_cotisant = is_cotisant
-    user.cotisant_checked_at = datetime.now(timezone.utc)
+    if checked_now:
+        user.cotisant_checked_at = datetime.now(timezone.utc)
     if client_ip:
         user.last_ip = client_ip
     
     try:
-        db.commit()
+        await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise InvalidCredentialsException("Erreur lors de la vérification")
     
     return user.id, is_cotisant
@@ -303,12 +409,12 @@ async def get_tokens(user_id: int, email: str) -> TokenResponse:
 
 
 
-def get_user_by_token(token: str, db: Session, expected_type: str = "access") -> User:
+async def get_user_by_token(token: str, db: AsyncSession, expected_type: str = "access") -> User:
     """Récupère l'utilisateur à partir d'un token JWT"""
     from src.core.security import decode_token
     
     token_data = decode_token(token, expected_type=expected_type)
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+    user = await db.get(User, token_data.user_id)
     
     if not user:
         raise InvalidCredentialsException("Utilisateur non trouvé")
@@ -322,7 +428,7 @@ def get_user_by_token(token: str, db: Session, expected_type: str = "access") ->
         try:
             _, identity = normalize_email(token_data.email)
             user.normalized_email = identity
-            db.commit()
+            await db.commit()
         except Exception:
             # If normalization fails, keep the user but log it
             # The blacklist check will treat empty normalized_email as blacklisted
@@ -12,6 +12,11 @@ class Settings(BaseSettings):
     
     # Base de données
     DATABASE_URL: str = os.getenv("DATABASE_URL")
+    # Pools de connexions (voir src/db/session.py pour le dimensionnement)
+    DB_SYNC_POOL_SIZE: int = int(os.getenv("DB_SYNC_POOL_SIZE", "10"))
+    DB_SYNC_MAX_OVERFLOW: int = int(os.getenv("DB_SYNC_MAX_OVERFLOW", "15"))
+    DB_ASYNC_POOL_SIZE: int = int(os.getenv("DB_ASYNC_POOL_SIZE", "20"))
+    DB_ASYNC_MAX_OVERFLOW: int = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "40"))
     
     # JWT
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY")
@@ -27,14 +32,18 @@ class Settings(BaseSettings):
     BDE_API_URL: str = os.getenv("BDE_API_URL")
     BDE_API_KEY: str = os.getenv("BDE_API_KEY")  # À définir en env
     BDE_API_TIMEOUT: int = int(os.getenv("BDE_API_TIMEOUT", "5"))  # Timeout en secondes
+    # Durée pendant laquelle un statut cotisant confirmé est réutilisé sans rappeler l'API
+    BDE_MEMBERSHIP_TTL_MINUTES: int = int(os.getenv("BDE_MEMBERSHIP_TTL_MINUTES", "720"))
+    # Durée de cache (en mémoire) d'une réponse "non cotisant"
+    BDE_NEGATIVE_CACHE_TTL_SECONDS: int = int(os.getenv("BDE_NEGATIVE_CACHE_TTL_SECONDS", "60"))
     
-    # Email (FastMail)
+    # Email (SMTP Hypnos)
     MAIL_FROM: str = os.getenv("MAIL_FROM", "test@example.com")
     MAIL_FROM_NAME: str = os.getenv("MAIL_FROM_NAME", "MC INT")
     MAIL_PORT: int = int(os.getenv("MAIL_PORT", "1025"))
     MAIL_SERVER: str = os.getenv("MAIL_SERVER", "mail")
     
-    # Email (FastMail)
+    # Email (SMTP Hypnos)
     MAIL_HYPNOS_USERNAME: str = os.getenv("MAIL_HYPNOS_USERNAME", "username")
     MAIL_HYPNOS_PASSWORD: str = os.getenv("MAIL_HYPNOS_PASSWORD", "password")
     MAIL_HYPNOS_FROM: str = os.getenv("MAIL_HYPNOS_FROM", "test@example.com")
@@ -45,6 +54,25 @@ class Settings(BaseSettings):
     MAIL_HYPNOS_SSL_TLS: bool = os.getenv("MAIL_HYPNOS_SSL_TLS", "false").lower() == "true"
     MAIL_HYPNOS_USE_CREDENTIALS: bool = os.getenv("MAIL_HYPNOS_USE_CREDENTIALS", "false").lower() == "true"
     MAIL_HYPNOS_VALIDATE_CERTS: bool = os.getenv("MAIL_HYPNOS_VALIDATE_CERTS", "false").lower() == "true"
+    # Sessions SMTP persistantes par worker (voir src/mail.py)
+    SMTP_POOL_SIZE: int = int(os.getenv("SMTP_POOL_SIZE", "5"))
+    
+    # Compteurs des limites de connexion (email:/verify:): "postgres" (partagés
+    # entre workers, ~1.5 ms par check, voir scripts/bench_rate_limit.py --postgres)
+    # ou "memory" (par process: N workers = N fois plus d'essais de code).
+    # Les limites par IP du middleware restent en mémoire dans tous les cas
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "postgres")
+    
+    # Proxies devant l'app qui ajoutent à X-Forwarded-For (nginx = 1, Cloudflare + nginx = 2)
+    TRUSTED_PROXY_HOPS: int = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+    # Réseaux derrière un NAT partagé (campus, résidence), séparés par des virgules:
+    # leurs limites par IP sont multipliées par RATE_LIMIT_SHARED_NETWORK_FACTOR
+    RATE_LIMIT_SHARED_NETWORKS: str = os.getenv("RATE_LIMIT_SHARED_NETWORKS", "")
+    RATE_LIMIT_SHARED_NETWORK_FACTOR: int = int(os.getenv("RATE_LIMIT_SHARED_NETWORK_FACTOR", "10"))
+    
+    # Outbox emails: envois simultanés et taille des lots réclamés
+    EMAIL_OUTBOX_CONCURRENCY: int = int(os.getenv("EMAIL_OUTBOX_CONCURRENCY", "5"))
+    EMAIL_OUTBOX_BATCH_SIZE: int = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "20"))
     
     # Frontend
     FRONTEND_URL: str = os.getenv("FRONTEND_URL")
@@ -58,6 +86,10 @@ class Settings(BaseSettings):
 
     HELLOASSO_URL_TOKEN: str = os.getenv("HELLOASSO_URL_TOKEN", "https://api.helloasso.com/oauth2")
     HELLOASSO_API: str = os.getenv("HELLOASSO_API", "https://api.helloasso.com/v5")
+    # Jeton attendu dans l'URL de notification (?token=...), vide = pas de contrôle
+    HELLOASSO_NOTIFICATION_SECRET: str = os.getenv("HELLOASSO_NOTIFICATION_SECRET", "")
+    # Vérifications HelloAsso simultanées du poller de paiements
+    HELLOASSO_POLL_CONCURRENCY: int = int(os.getenv("HELLOASSO_POLL_CONCURRENCY", "10"))
 
     # Ordering cutoff (ISO 8601 with timezone)
     ORDERING_CUTOFF: str = os.getenv("ORDERING_CUTOFF", "2026-02-06T00:01:00+01:00")
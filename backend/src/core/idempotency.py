@@ -0,0 +1,224 @@
+"""
+Idempotency-Key support for order-creating POST endpoints.
+
+Features:
+- Response stored per (user, endpoint, key) in Postgres, shared by all workers
+- Replays get the stored response without running the endpoint again
+- Concurrent duplicate (double click) -> 409 while the first one runs
+- Failed requests are not stored, the client can retry with the same key
+- Periodic cleanup of expired keys
+"""
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+# How long a stored response is replayed
+IDEMPOTENCY_TTL = timedelta(hours=24)
+# A request still running after this is considered dead (worker crash)
+IDEMPOTENCY_LOCK_TIMEOUT = timedelta(seconds=60)
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def _request_hash(payload: Any) -> str:
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """Stores and replays endpoint responses by Idempotency-Key."""
+
+    def __init__(self, cleanup_interval: int = 3600):
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self._cleanup_interval = cleanup_interval
+
+        self.replays = 0
+        self.conflicts = 0
+        self.stored = 0
+
+    async def _begin(self, user_id: int, scope: str, key: str, request_hash: str):
+        """
+        Claim the key. Returns the stored (status_code, response) of a
+        finished request, or None if this request must run.
+        """
+        from sqlalchemy import delete, select
+        from sqlalchemy.dialects.postgresql import insert
+        from src.db.session import AsyncSessionLocal
+        from src.core.models import IdempotencyKey
+
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            claimed = (await db.execute(
+                insert(IdempotencyKey)
+                .values(
+                    user_id=user_id,
+                    scope=scope,
+                    key=key,
+                    request_hash=request_hash,
+                    created_at=now,
+                    expires_at=now + IDEMPOTENCY_TTL,
+                )
+                .on_conflict_do_nothing()
+                .returning(IdempotencyKey.key)
+            )).first()
+            if claimed:
+                await db.commit()
+                return None
+
+            row = (await db.execute(
+                select(IdempotencyKey)
+                .where(
+                    IdempotencyKey.user_id == user_id,
+                    IdempotencyKey.scope == scope,
+                    IdempotencyKey.key == key,
+                )
+                .with_for_update()
+            )).scalars().first()
+
+            # Expired, or the first request died: start over with this one
+            # (stored as naive UTC)
+            stale = row is None or row.expires_at.replace(tzinfo=timezone.utc) < now or (
+                row.status_code is None
+                and row.created_at.replace(tzinfo=timezone.utc) < now - IDEMPOTENCY_LOCK_TIMEOUT
+            )
+            if stale:
+                if row is not None:
+                    await db.execute(delete(IdempotencyKey).where(
+                        IdempotencyKey.user_id == user_id,
+                        IdempotencyKey.scope == scope,
+                        IdempotencyKey.key == key,
+                    ))
+                db.add(IdempotencyKey(
+                    user_id=user_id,
+                    scope=scope,
+                    key=key,
+                    request_hash=request_hash,
+                    created_at=now,
+                    expires_at=now + IDEMPOTENCY_TTL,
+                ))
+                await db.commit()
+                return None
+
+            await db.commit()
+
+        if row.request_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail="Cette clé d'idempotence a déjà été utilisée pour une autre requête"
+            )
+        if row.status_code is None:
+            self.conflicts += 1
+            raise HTTPException(
+                status_code=409,
+                detail="Requête déjà en cours de traitement"
+            )
+        return row.status_code, row.response
+
+    async def _finish(self, user_id: int, scope: str, key: str, response: Optional[Any]) -> None:
+        """Store the response, or release the key if the request failed (response None)."""
+        from sqlalchemy import delete, update
+        from src.db.session import AsyncSessionLocal
+        from src.core.models import IdempotencyKey
+
+        where = (
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key,
+        )
+        async with AsyncSessionLocal() as db:
+            if response is None:
+                await db.execute(delete(IdempotencyKey).where(*where))
+            else:
+                await db.execute(
+                    update(IdempotencyKey).where(*where).values(status_code=200, response=response)
+                )
+            await db.commit()
+
+    async def run(
+        self,
+        key: Optional[str],
+        user_id: int,
+        scope: str,
+        payload: Any,
+        handler: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Run handler() once per Idempotency-Key.
+
+        Without a key the handler just runs. With a key, a replay returns
+        the stored response (same body required); only successful
+        responses are stored.
+
+        Raises:
+            HTTPException: 400 invalid key, 409 same key still running,
+                422 same key with another body
+        """
+        if not key:
+            return await handler()
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail="Clé d'idempotence trop longue")
+
+        stored = await self._begin(user_id, scope, key, _request_hash(payload))
+        if stored is not None:
+            self.replays += 1
+            print(f"[IDEMPOTENCY] Replaying {scope} for user {user_id}")
+            return stored[1]
+
+        try:
+            result = await handler()
+        except BaseException:
+            await asyncio.shield(self._finish(user_id, scope, key, None))
+            raise
+
+        await self._finish(user_id, scope, key, jsonable_encoder(result))
+        self.stored += 1
+        return result
+
+    async def cleanup(self) -> int:
+        """Delete the expired keys. Returns the number of rows removed."""
+        from sqlalchemy import delete
+        from src.db.session import AsyncSessionLocal
+        from src.core.models import IdempotencyKey
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.now(timezone.utc))
+            )
+            await db.commit()
+            return result.rowcount or 0
+
+    async def _cleanup_loop(self):
+        """Background task that runs cleanup periodically."""
+        while True:
+            try:
+                await asyncio.sleep(self._cleanup_interval)
+                removed = await self.cleanup()
+                if removed > 0:
+                    print(f"[IDEMPOTENCY] Cleaned up {removed} expired keys")
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"[IDEMPOTENCY] Cleanup error: {e}")
+
+    def start_cleanup_task(self) -> asyncio.Task:
+        """Start the background cleanup task. Returns the task for cleanup."""
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+        return self._cleanup_task
+
+    def get_stats(self) -> dict:
+        """Replay counters (for monitoring)."""
+        return {
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+            "stored": self.stored,
+            "ttl_seconds": int(IDEMPOTENCY_TTL.total_seconds()),
+        }
+
+
+# Global idempotency store instance
+idempotency_store = IdempotencyStore()
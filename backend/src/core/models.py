@@ -0,0 +1,56 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from datetime import datetime, timezone
+from src.db.base import Base
+
+
+class IdempotencyKey(Base):
+    """Response stored for an Idempotency-Key (per user and endpoint)."""
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, primary_key=True)
+    scope = Column(String, primary_key=True)  # Endpoint, e.g. "reservations.create"
+    key = Column(String, primary_key=True)  # Idempotency-Key header value
+    request_hash = Column(String, nullable=False)  # Same key, other body -> 422
+    status_code = Column(Integer, nullable=True)  # NULL while the first request is running
+    response = Column(JSONB, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class EmailOutbox(Base):
+    """Email waiting to be sent by the outbox sender (src/outbox.py)."""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # verification, order_confirmation
+    recipient = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=True)
+    payload = Column(JSONB, nullable=True)  # Template data (e.g. {"code": "..."})
+    status = Column(String, nullable=False, default="pending")  # pending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    # Next send attempt; pushed forward while a sender holds the message (lease)
+    next_attempt_at = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+
+class RateLimitCounter(Base):
+    """
+    Requests counted for a rate limit key in one fixed window (shared by all workers).
+    UNLOGGED: no WAL writes, the counters are lost (reset) on a Postgres crash.
+    """
+    __tablename__ = "rate_limit_counters"
+
+    key = Column(String, primary_key=True)  # e.g. "verify:user@example.com"
+    window_seconds = Column(Integer, primary_key=True)
+    window_index = Column(BigInteger, primary_key=True)  # epoch // window_seconds
+    hits = Column(Integer, nullable=False, default=0)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
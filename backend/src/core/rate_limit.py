@@ -2,39 +2,279 @@
 In-memory rate limiting for security-sensitive endpoints.
 
 Features:
-- Sliding window rate limiting
-- Automatic periodic cleanup to prevent memory leaks
-- Thread-safe with asyncio.Lock
+- Sliding window counter: O(1) time and memory per key (two counters,
+  weighted by the overlap of the previous fixed window)
+- Monotonic clock, unaffected by system time changes
+- Lock sharding by key (check_sync may run in threadpool threads)
+- Incremental eviction of stale keys on each check, plus a periodic
+  shard-by-shard sweep, instead of a global stop-the-world cleanup
+- Optional shared backend (Postgres) so that limits hold across workers,
+  with fallback to the in-memory counters if the database is unavailable
 """
 import asyncio
-from collections import defaultdict
-from datetime import datetime, timedelta
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
 from fastapi import HTTPException
+from sqlalchemy import text
 from typing import Optional
 
+from src.core.config import settings
+
+# Number of independent (lock, keys) shards
+RATE_LIMIT_SHARDS = 64
+
+# Stale keys evicted from the head of a shard on each check
+RATE_LIMIT_EVICTIONS_PER_CHECK = 2
+
+# Max time spent on a shared backend check before using the local counters (in seconds)
+RATE_LIMIT_BACKEND_TIMEOUT = 0.5
+
+# After a backend failure, local counters are used for this long (in seconds)
+RATE_LIMIT_BACKEND_RETRY = 30
+
+# Expired Postgres counters deleted per statement
+RATE_LIMIT_CLEANUP_BATCH = 5000
+
+
+class _Window:
+    """Counters of one key: requests in the current and previous fixed windows."""
+
+    __slots__ = ("window_start", "current", "previous", "window_seconds")
+
+    def __init__(self, window_start: float, window_seconds: float):
+        self.window_start = window_start
+        self.current = 0
+        self.previous = 0
+        self.window_seconds = window_seconds
+
+    def expires_at(self) -> float:
+        # Both windows out of range: the key no longer counts
+        return self.window_start + 2 * self.window_seconds
+
+
+class _Shard:
+    __slots__ = ("lock", "entries")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Least recently used first (eviction candidates)
+        self.entries: OrderedDict[str, _Window] = OrderedDict()
+
+
+class RateLimitBackend(ABC):
+    """Shared counter storage used by RateLimiter.check (interface)."""
+
+    name = "backend"
+
+    @abstractmethod
+    async def hit(self, key: str, max_requests: int, window_seconds: int) -> bool:
+        """Count one request for key. Returns False (not counted) if over the limit."""
+
+    async def cleanup(self) -> int:
+        """Remove expired counters. Returns the number removed."""
+        return 0
+
+    def get_stats(self) -> dict:
+        return {}
+
+
+# Sliding window counter in one statement: the row of the current window is
+# created or incremented only if previous * overlap + current stays under the
+# limit. Concurrent checks of a key serialize on its row (ON CONFLICT), and
+# DO UPDATE ... WHERE sees the latest count. No row returned = rejected.
+# Every parameter is cast: asyncpg refuses a parameter used with two
+# deduced types (text in SELECT, varchar in the comparisons).
+_POSTGRES_HIT = text("""
+    INSERT INTO rate_limit_counters AS c (key, window_seconds, window_index, hits, expires_at)
+    SELECT CAST(:key AS varchar), CAST(:window_seconds AS integer), CAST(:window_index AS bigint), 1,
+        CAST(:expires_at AS timestamp)
+    WHERE COALESCE((
+        SELECT p.hits FROM rate_limit_counters p
+        WHERE p.key = CAST(:key AS varchar)
+        AND p.window_seconds = CAST(:window_seconds AS integer)
+        AND p.window_index = CAST(:window_index AS bigint) - 1
+    ), 0) * CAST(:overlap AS double precision) < CAST(:max_requests AS integer)
+    ON CONFLICT (key, window_seconds, window_index) DO UPDATE
+    SET hits = c.hits + 1
+    WHERE c.hits + COALESCE((
+        SELECT p.hits FROM rate_limit_counters p
+        WHERE p.key = CAST(:key AS varchar)
+        AND p.window_seconds = CAST(:window_seconds AS integer)
+        AND p.window_index = CAST(:window_index AS bigint) - 1
+    ), 0) * CAST(:overlap AS double precision) < CAST(:max_requests AS integer)
+    RETURNING c.hits
+""")
+
+_POSTGRES_CLEANUP = text("""
+    DELETE FROM rate_limit_counters
+    WHERE ctid IN (
+        SELECT ctid FROM rate_limit_counters
+        WHERE expires_at < :now
+        LIMIT :batch
+        FOR UPDATE SKIP LOCKED
+    )
+""")
+
+
+class PostgresRateLimitBackend(RateLimitBackend):
+    """
+    Counters in the UNLOGGED rate_limit_counters table, one row per key and
+    fixed window (wall clock, shared by every worker).
+    """
+
+    name = "postgres"
+
+    def __init__(self):
+        self.db_checks = 0
+        self.db_seconds_total = 0.0
+        self.db_seconds_max = 0.0
+
+    async def hit(self, key: str, max_requests: int, window_seconds: int) -> bool:
+        from src.db.session import AsyncSessionLocal
+
+        now = time.time()
+        window_index = int(now // window_seconds)
+        started = time.perf_counter()
+
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(_POSTGRES_HIT, {
+                "key": key,
+                "window_seconds": window_seconds,
+                "window_index": window_index,
+                "overlap": 1 - (now % window_seconds) / window_seconds,
+                "max_requests": max_requests,
+                "expires_at": datetime.fromtimestamp((window_index + 2) * window_seconds, timezone.utc),
+            })).first()
+            await db.commit()
+
+        elapsed = time.perf_counter() - started
+        self.db_checks += 1
+        self.db_seconds_total += elapsed
+        self.db_seconds_max = max(self.db_seconds_max, elapsed)
+        return row is not None
+
+    async def cleanup(self) -> int:
+        from src.db.session import AsyncSessionLocal
+
+        removed = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(_POSTGRES_CLEANUP, {
+                    "now": datetime.now(timezone.utc),
+                    "batch": RATE_LIMIT_CLEANUP_BATCH,
+                })
+                await db.commit()
+            removed += result.rowcount
+            if result.rowcount < RATE_LIMIT_CLEANUP_BATCH:
+                return removed
+
+    def get_stats(self) -> dict:
+        return {
+            "db_checks": self.db_checks,
+            "avg_check_ms": round(self.db_seconds_total / self.db_checks * 1000, 2) if self.db_checks else 0.0,
+            "max_check_ms": round(self.db_seconds_max * 1000, 2),
+        }
+
 
 class RateLimiter:
     """
-    Thread-safe in-memory rate limiter using sliding window.
+    Thread-safe in-memory rate limiter using a sliding window counter.
 
-    Includes automatic cleanup to prevent memory growth from stale entries.
+    The estimated count over the last window_seconds is
+    previous * (share of the previous window still in range) + current.
     """
 
-    def __init__(self, cleanup_interval: int = 300):
+    def __init__(
+        self,
+        cleanup_interval: int = 300,
+        shards: int = RATE_LIMIT_SHARDS,
+        backend: Optional[RateLimitBackend] = None,
+    ):
         """
         Initialize rate limiter.
 
         Args:
             cleanup_interval: How often to run cleanup (in seconds). Default 5 minutes.
+            shards: Number of lock shards.
+            backend: Shared counters used by check() (None = in-memory only).
         """
-        self.requests: dict[str, list[datetime]] = defaultdict(list)
-        self._lock = asyncio.Lock()
+        self._shards = [_Shard() for _ in range(shards)]
         self._cleanup_task: Optional[asyncio.Task] = None
         self._cleanup_interval = cleanup_interval
+        self._backend = backend
+        self._backend_down_until = 0.0
+
+        self.checks = 0
+        self.rejected = 0
+        self.evicted = 0
+        self.fallbacks = 0
+
+    def _hit(self, key: str, max_requests: int, window_seconds: float) -> bool:
+        """Count one request for key. Returns False (not counted) if over the limit."""
+        now = time.monotonic()
+        shard = self._shards[hash(key) % len(self._shards)]
+
+        with shard.lock:
+            entries = shard.entries
+            window = entries.get(key)
+            if window is None or window.window_seconds != window_seconds:
+                window = _Window(now - now % window_seconds, window_seconds)
+                entries[key] = window
+            else:
+                entries.move_to_end(key)
+                elapsed = now - window.window_start
+                if elapsed >= 2 * window_seconds:
+                    window.previous = 0
+                    window.current = 0
+                    window.window_start = now - now % window_seconds
+                elif elapsed >= window_seconds:
+                    window.previous = window.current
+                    window.current = 0
+                    window.window_start += window_seconds
+
+            self._evict_head(shard, now, key)
+
+            overlap = 1 - (now - window.window_start) / window_seconds
+            if window.previous * overlap + window.current >= max_requests:
+                return False
+            window.current += 1
+            return True
+
+    def _evict_head(self, shard: _Shard, now: float, skip: str) -> None:
+        """Drop a few stale keys from the least recently used end. Caller holds the lock."""
+        entries = shard.entries
+        for _ in range(RATE_LIMIT_EVICTIONS_PER_CHECK):
+            if not entries:
+                return
+            key = next(iter(entries))
+            if key == skip or entries[key].expires_at() > now:
+                return
+            del entries[key]
+            self.evicted += 1
+
+    async def _backend_hit(self, key: str, max_requests: int, window_seconds: int) -> bool:
+        """Check against the shared backend, or the local counters while it is unavailable."""
+        if time.monotonic() >= self._backend_down_until:
+            try:
+                return await asyncio.wait_for(
+                    self._backend.hit(key, max_requests, window_seconds),
+                    timeout=RATE_LIMIT_BACKEND_TIMEOUT,
+                )
+            except Exception as e:
+                self._backend_down_until = time.monotonic() + RATE_LIMIT_BACKEND_RETRY
+                print(
+                    f"[RATE_LIMITER] {self._backend.name} backend unavailable "
+                    f"({type(e).__name__}: {e}), using in-memory counters for {RATE_LIMIT_BACKEND_RETRY}s"
+                )
+        self.fallbacks += 1
+        return self._hit(key, max_requests, window_seconds)
 
     async def check(self, key: str, max_requests: int, window_seconds: int) -> None:
         """
-        Check if request is allowed under rate limit.
+        Check if request is allowed under rate limit (shared backend if configured).
 
         Args:
             key: Unique identifier (e.g., "email:user@example.com" or "ip:192.168.1.1")
@@ -44,24 +284,29 @@ class RateLimiter:
         Raises:
             HTTPException: 429 if rate limit exceeded
         """
-        now = datetime.now()
-        cutoff = now - timedelta(seconds=window_seconds)
-
-        async with self._lock:
-            # Clean old requests outside the window
-            self.requests[key] = [t for t in self.requests[key] if t > cutoff]
+        if self._backend is None:
+            self.check_sync(key, max_requests, window_seconds)
+            return
 
-            if len(self.requests[key]) >= max_requests:
-                raise HTTPException(
-                    status_code=429,
-                    detail="Trop de requêtes. Réessayez plus tard."
-                )
+        self.checks += 1
+        if not await self._backend_hit(key, max_requests, window_seconds):
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Trop de requêtes. Réessayez plus tard."
+            )
 
-            self.requests[key].append(now)
+    def allow(self, key: str, max_requests: int, window_seconds: int) -> bool:
+        """Count one request for key against the in-memory counters. False if over the limit."""
+        self.checks += 1
+        if not self._hit(key, max_requests, window_seconds):
+            self.rejected += 1
+            return False
+        return True
 
     def check_sync(self, key: str, max_requests: int, window_seconds: int) -> None:
         """
-        Synchronous version of check for non-async contexts.
+        Synchronous version of check for non-async contexts (in-memory counters only).
 
         Args:
             key: Unique identifier (e.g., "email:user@example.com" or "ip:192.168.1.1")
@@ -71,46 +316,45 @@ class RateLimiter:
         Raises:
             HTTPException: 429 if rate limit exceeded
         """
-        now = datetime.now()
-        cutoff = now - timedelta(seconds=window_seconds)
-
-        # Clean old requests outside the window
-        self.requests[key] = [t for t in self.requests[key] if t > cutoff]
-
-        if len(self.requests[key]) >= max_requests:
+        if not self.allow(key, max_requests, window_seconds):
             raise HTTPException(
                 status_code=429,
                 detail="Trop de requêtes. Réessayez plus tard."
             )
 
-        self.requests[key].append(now)
-
     async def cleanup(self, max_age_seconds: int = 3600) -> int:
         """
-        Remove stale entries older than max_age to prevent memory growth.
+        Remove stale keys, one shard at a time (checks on other shards go on).
 
         Args:
-            max_age_seconds: Maximum age of entries to keep (default 1 hour)
+            max_age_seconds: Keys unused for this long are removed even if
+                their window is longer (default 1 hour)
 
         Returns:
             Number of keys removed
         """
-        cutoff = datetime.now() - timedelta(seconds=max_age_seconds)
         keys_removed = 0
 
-        async with self._lock:
-            keys_to_remove = []
-
-            for key, timestamps in self.requests.items():
-                # Remove old timestamps
-                self.requests[key] = [t for t in timestamps if t > cutoff]
-                # Mark empty keys for removal
-                if not self.requests[key]:
-                    keys_to_remove.append(key)
-
-            for key in keys_to_remove:
-                del self.requests[key]
-                keys_removed += 1
+        for shard in self._shards:
+            now = time.monotonic()
+            with shard.lock:
+                stale = [
+                    key for key, window in shard.entries.items()
+                    if window.expires_at() <= now or now - window.window_start > max_age_seconds
+                ]
+                for key in stale:
+                    del shard.entries[key]
+            keys_removed += len(stale)
+            # Let the request handlers run between shards
+            await asyncio.sleep(0)
+
+        self.evicted += keys_removed
+
+        if self._backend is not None:
+            try:
+                keys_removed += await self._backend.cleanup()
+            except Exception as e:
+                print(f"[RATE_LIMITER] {self._backend.name} cleanup error: {e}")
 
         return keys_removed
 
@@ -150,11 +394,22 @@ class RateLimiter:
 
     def get_stats(self) -> dict:
         """Get current rate limiter statistics."""
+        total_keys = sum(len(shard.entries) for shard in self._shards)
         return {
-            "total_keys": len(self.requests),
-            "total_entries": sum(len(v) for v in self.requests.values()),
+            "total_keys": total_keys,
+            # One fixed-size entry per key
+            "total_entries": total_keys,
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+            "backend": self._backend.name if self._backend else "memory",
+            "fallbacks": self.fallbacks,
+            **(self._backend.get_stats() if self._backend else {}),
         }
 
 
-# Global singleton instance
-rate_limiter = RateLimiter()
+# Global singleton instance (login endpoints: email:/verify: keys, shared
+# across workers by default; the per-IP middleware has its own in-memory one)
+rate_limiter = RateLimiter(
+    backend=PostgresRateLimitBackend() if settings.RATE_LIMIT_BACKEND == "postgres" else None
+)
@@ -0,0 +1,223 @@
+"""
+Per-IP rate limiting of incoming requests (ASGI middleware).
+
+Features:
+- Per-route policies for the public endpoints, plus a global per-IP limit
+- Rejection before routing: no DB session, cookie decoding or HelloAsso call
+  is made for a rejected request
+- Client IP taken from the reverse proxy headers (X-Real-IP / X-Forwarded-For),
+  trusted only when the request comes from a private address (the proxy)
+- Higher limits for the networks behind a shared NAT (campus, residence),
+  where every user has the same public IP (RATE_LIMIT_SHARED_NETWORKS)
+- Rejected request counters per policy
+
+Counters are in-memory and per worker process (no DB round trip per request):
+with N workers, a client can get up to N times the limits below.
+"""
+import ipaddress
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+from src.core.config import settings
+from src.core.rate_limit import RateLimiter
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    """Limit of requests per client IP for the paths starting with prefix."""
+
+    name: str
+    prefix: str
+    max_requests: int
+    window_seconds: int
+
+    def matches(self, path: str) -> bool:
+        return path == self.prefix or path.startswith(self.prefix.rstrip("/") + "/")
+
+
+# First matching policy wins (most specific first)
+ROUTE_POLICIES = (
+    # Each call may end up in a HelloAsso API call
+    RoutePolicy("payment_status", "/payments/status", 30, 60),
+    RoutePolicy("order_status", "/users/order/status", 30, 60),
+    RoutePolicy("availability_stream", "/reservations/availability/stream", 10, 60),
+    RoutePolicy("availability", "/reservations/availability", 120, 60),
+    RoutePolicy("ordering_status", "/status", 60, 60),
+    RoutePolicy("menu", "/menu", 120, 60),
+)
+
+# Any request, whatever the route
+GLOBAL_POLICY = RoutePolicy("global", "/", 600, 60)
+
+_REJECTED_BODY = json.dumps({"detail": "Trop de requêtes. Réessayez plus tard."}).encode()
+
+
+def _is_proxy(host: Optional[str]) -> bool:
+    """Requests from private/loopback addresses come through the reverse proxy."""
+    if not host:
+        return False
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return address.is_private or address.is_loopback
+
+
+def get_client_ip(scope) -> str:
+    """
+    Client IP of an ASGI request.
+
+    Behind TRUSTED_PROXY_HOPS proxies, each appending to X-Forwarded-For, the
+    client is the entry written by the outermost one (the entries left of it
+    are sent by the client and can be forged).
+    """
+    peer = scope["client"][0] if scope.get("client") else None
+    if not _is_proxy(peer):
+        return peer or "unknown"
+
+    headers = {}
+    for name, value in scope.get("headers", ()):
+        if name in (b"x-forwarded-for", b"x-real-ip"):
+            headers[name] = value.decode("latin-1")
+
+    hops = settings.TRUSTED_PROXY_HOPS
+    forwarded = [ip.strip() for ip in headers.get(b"x-forwarded-for", "").split(",") if ip.strip()]
+    if hops > 1 and forwarded:
+        return forwarded[-min(hops, len(forwarded))]
+    real_ip = headers.get(b"x-real-ip", "").strip()
+    if real_ip:
+        return real_ip
+    if forwarded:
+        return forwarded[-1]
+    return peer
+
+
+def parse_networks(value: str) -> tuple:
+    """Networks of a comma-separated CIDR list (invalid entries are skipped)."""
+    networks = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            print(f"[RATE_LIMITER] Ignoring invalid shared network {entry!r}")
+    return tuple(networks)
+
+
+def _route_path(scope) -> str:
+    """Request path without the app's root_path ("/api")."""
+    path = scope["path"]
+    root_path = scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):] or "/"
+    return path
+
+
+class RequestLimits:
+    """Per-worker counters of the middleware, with rejections per policy."""
+
+    def __init__(
+        self,
+        policies=ROUTE_POLICIES,
+        global_policy=GLOBAL_POLICY,
+        shared_networks: Optional[tuple] = None,
+        shared_network_factor: Optional[int] = None,
+    ):
+        self.policies = policies
+        self.global_policy = global_policy
+        self.shared_networks = (
+            parse_networks(settings.RATE_LIMIT_SHARED_NETWORKS) if shared_networks is None else shared_networks
+        )
+        self.shared_network_factor = max(
+            settings.RATE_LIMIT_SHARED_NETWORK_FACTOR if shared_network_factor is None else shared_network_factor, 1
+        )
+        self.limiter = RateLimiter()
+        self.rejected: dict[str, int] = {}
+        self.shared_network_requests = 0
+
+    def _policy(self, path: str) -> Optional[RoutePolicy]:
+        for policy in self.policies:
+            if policy.matches(path):
+                return policy
+        return None
+
+    def _limit_factor(self, ip: str) -> int:
+        """Limit multiplier of a client IP (> 1 behind a shared NAT)."""
+        if not self.shared_networks:
+            return 1
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return 1
+        if any(address in network for network in self.shared_networks):
+            self.shared_network_requests += 1
+            return self.shared_network_factor
+        return 1
+
+    def check(self, path: str, ip: str) -> Optional[RoutePolicy]:
+        """
+        Count one request. Returns the policy it exceeds, or None if allowed.
+
+        The global limit is checked first: a request it rejects is not
+        counted against the route limit.
+        """
+        factor = self._limit_factor(ip)
+        for policy in (self.global_policy, self._policy(path)):
+            if policy is None:
+                continue
+            if not self.limiter.allow(f"{policy.name}:{ip}", policy.max_requests * factor, policy.window_seconds):
+                self.rejected[policy.name] = self.rejected.get(policy.name, 0) + 1
+                return policy
+        return None
+
+    def get_stats(self) -> dict:
+        """Rejected requests per policy (for monitoring)."""
+        limiter_stats = self.limiter.get_stats()
+        return {
+            "tracked_keys": limiter_stats["total_keys"],
+            "checks": limiter_stats["checks"],
+            "rejected_total": sum(self.rejected.values()),
+            "rejected": dict(self.rejected),
+            "policies": {
+                policy.name: f"{policy.max_requests}/{policy.window_seconds}s"
+                for policy in (*self.policies, self.global_policy)
+            },
+            "shared_networks": [str(network) for network in self.shared_networks],
+            "shared_network_factor": self.shared_network_factor,
+            "shared_network_requests": self.shared_network_requests,
+        }
+
+
+request_limits = RequestLimits()
+
+
+class RateLimitMiddleware:
+    """Rejects with 429 the HTTP requests over their route or global limit."""
+
+    def __init__(self, app, limits: RequestLimits = request_limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.limits.check(_route_path(scope), get_client_ip(scope))
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(_REJECTED_BODY)).encode()),
+                (b"retry-after", str(policy.window_seconds).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": _REJECTED_BODY})
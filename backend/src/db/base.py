@@ -7,4 +7,7 @@ Base = declarative_base()
 def import_models():
     """Import all models for Alembic autogenerate discovery."""
     from src.users.models import User  # noqa: F401
-    from src.reservations.models import MenuItemLimit  # noqa: F401
+    from src.reservations.models import MenuItemLimit, SlotCapacity  # noqa: F401
+    from src.payments.models import PaymentNotification, HelloAssoToken, SyncCheckpoint  # noqa: F401
+    from src.core.models import IdempotencyKey, EmailOutbox, RateLimitCounter  # noqa: F401
+    from src.auth.models import BDERosterMember  # noqa: F401
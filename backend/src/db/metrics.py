@@ -0,0 +1,76 @@
+"""
+Connection pool metrics.
+
+Measures how long each pooled connection stays checked out (checkout ->
+checkin). Long checkouts mean a connection was held across slow work
+(outbound HTTP, SMTP...) and starve the other requests of the pool.
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds (in seconds) of the checkout duration histogram buckets
+CHECKOUT_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Checkouts longer than this are counted as slow (in seconds)
+SLOW_CHECKOUT_THRESHOLD = 1.0
+
+
+class PoolCheckoutStats:
+    """Checkout duration counters for one engine's pool (thread-safe)."""
+
+    def __init__(self, name: str, engine: Engine):
+        self.name = name
+        self._engine = engine
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.slow_checkouts = 0
+        self.buckets = [0] * (len(CHECKOUT_DURATION_BUCKETS) + 1)
+
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is None:
+            return
+        self._record(time.perf_counter() - started)
+
+    def _record(self, duration: float) -> None:
+        index = len(CHECKOUT_DURATION_BUCKETS)
+        for i, bound in enumerate(CHECKOUT_DURATION_BUCKETS):
+            if duration <= bound:
+                index = i
+                break
+
+        with self._lock:
+            self.checkouts += 1
+            self.total_seconds += duration
+            self.max_seconds = max(self.max_seconds, duration)
+            self.buckets[index] += 1
+            if duration > SLOW_CHECKOUT_THRESHOLD:
+                self.slow_checkouts += 1
+
+    def get_stats(self) -> dict:
+        """Pool occupancy and checkout duration histogram (for monitoring)."""
+        pool = self._engine.pool
+        with self._lock:
+            labels = [f"<={bound}s" for bound in CHECKOUT_DURATION_BUCKETS]
+            labels.append(f">{CHECKOUT_DURATION_BUCKETS[-1]}s")
+            return {
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "checkouts": self.checkouts,
+                "avg_checkout_ms": round(self.total_seconds / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                "max_checkout_ms": round(self.max_seconds * 1000, 2),
+                "slow_checkouts": self.slow_checkouts,
+                "checkout_duration": dict(zip(labels, self.buckets)),
+            }
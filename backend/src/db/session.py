@@ -1,19 +1,38 @@
-from sqlalchemy import create_engine
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
 from src.core.config import settings
-from typing import Generator
+from src.db.metrics import PoolCheckoutStats
+from typing import AsyncGenerator, Generator
 
 # Créer l'engine avec configuration du pool de connexions
 # - pool_size: nombre de connexions permanentes dans le pool
 # - max_overflow: connexions supplémentaires autorisées au-delà du pool_size
 # - pool_recycle: durée max (secondes) avant recyclage d'une connexion
 # - pool_pre_ping: vérifie la validité de la connexion avant utilisation
+#
+# Engine synchrone: threads (tâches de fond via asyncio.to_thread, routes
+# `def` /status, print et terminal), Alembic et create_all. Les routes async
+# passent par async_engine.
+#
+# Dimensionnement (un seul worker, cf. Dockerfile.prod): sync 10+15 et
+# async 20+40 = 85 connexions au maximum, sous le max_connections=100 par
+# défaut de Postgres, avec une marge pour Alembic, psql et les sauvegardes.
+# L'ancien pool unique (20+40) ne tient plus à côté du pool async. Côté
+# sync, les seuls appelants simultanés sont les routes `def` (au plus 40
+# threads AnyIO, dont /status le plus sollicité, une requête courte), la
+# purge des créneaux et le chargement des disponibilités (un à la fois).
+# Réglables par DB_SYNC_POOL_SIZE / DB_SYNC_MAX_OVERFLOW et
+# DB_ASYNC_POOL_SIZE / DB_ASYNC_MAX_OVERFLOW; l'occupation réelle de chaque
+# pool est visible dans /admin/metrics (db_pool).
 engine = create_engine(
     settings.DATABASE_URL,
     echo=False,  # À passer à True pour debug SQL
     future=True,
-    pool_size=20,
-    max_overflow=40,
+    pool_size=settings.DB_SYNC_POOL_SIZE,
+    max_overflow=settings.DB_SYNC_MAX_OVERFLOW,
     pool_recycle=3600,
     pool_pre_ping=True,
 )
@@ -27,6 +46,78 @@ SessionLocal = sessionmaker(
 )
 
 
+def _async_database_url(url: str) -> str:
+    """Same database, asyncpg driver (postgresql:// -> postgresql+asyncpg://)."""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+# Engine asynchrone (asyncpg) pour les routes async et les tâches de fond async:
+# une requête lente n'immobilise plus la boucle d'événements
+async_engine = create_async_engine(
+    _async_database_url(settings.DATABASE_URL),
+    echo=False,
+    pool_size=settings.DB_ASYNC_POOL_SIZE,
+    max_overflow=settings.DB_ASYNC_MAX_OVERFLOW,
+    pool_recycle=3600,
+    pool_pre_ping=True,
+)
+
+
+def _encode_timestamp(value: datetime) -> str:
+    # Les colonnes DateTime sont "timestamp without time zone" mais le code
+    # écrit des datetimes UTC aware: asyncpg les refuse, psycopg2 les stocke
+    # en heure UTC naïve. Même comportement ici.
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(sep=" ")
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _register_timestamp_codec(dbapi_connection, connection_record):
+    dbapi_connection.run_async(
+        lambda connection: connection.set_type_codec(
+            "timestamp",
+            schema="pg_catalog",
+            encoder=_encode_timestamp,
+            decoder=datetime.fromisoformat,
+            format="text",
+        )
+    )
+
+
+# expire_on_commit=False: les attributs restent lisibles après commit
+# (un rechargement implicite est impossible en async)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+# Durée de checkout des connexions (exposée dans /admin/metrics)
+sync_pool_stats = PoolCheckoutStats("sync", engine)
+async_pool_stats = PoolCheckoutStats("async", async_engine.sync_engine)
+
+
+def get_pool_stats() -> dict:
+    """Occupation des pools et durée de checkout des connexions."""
+    return {
+        "async": async_pool_stats.get_stats(),
+        "sync": sync_pool_stats.get_stats(),
+    }
+
+
+async def release_connection(db: AsyncSession) -> None:
+    """
+    End the session's transaction so its pooled connection is checked back
+    in before a slow outbound call (HelloAsso, BDE API, SMTP...).
+
+    Pending changes are committed. Loaded objects stay usable
+    (expire_on_commit=False) and the next query opens a new transaction.
+    """
+    await db.commit()
+
+
 def get_db() -> Generator[Session, None, None]:
     """Dépendance FastAPI pour injecter une session DB"""
     db = SessionLocal()
@@ -34,3 +125,9 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Dépendance FastAPI pour injecter une session DB asynchrone"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,18 +1,159 @@
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
+"""
+Emails Mc'INT (templates HTML + envoi SMTP).
+
+Les envois passent par un pool de sessions SMTP authentifiées réutilisées
+(keep-alive + RSET entre deux messages) au lieu d'un connect/STARTTLS/login
+par email.
+"""
+import asyncio
+import time
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+
+import aiosmtplib
+
 from src.core.config import settings
 
-conf_mail_hypnos = ConnectionConfig(
-    MAIL_USERNAME=settings.MAIL_HYPNOS_USERNAME,
-    MAIL_PASSWORD=settings.MAIL_HYPNOS_PASSWORD,
-    MAIL_FROM=settings.MAIL_HYPNOS_FROM,
-    MAIL_PORT=settings.MAIL_HYPNOS_PORT,
-    MAIL_SERVER=settings.MAIL_HYPNOS_SERVER,
-    MAIL_FROM_NAME=settings.MAIL_HYPNOS_FROM_NAME,
-    MAIL_STARTTLS=settings.MAIL_HYPNOS_STARTTLS,
-    MAIL_SSL_TLS=settings.MAIL_HYPNOS_SSL_TLS,
-    USE_CREDENTIALS=settings.MAIL_HYPNOS_USE_CREDENTIALS,
-    VALIDATE_CERTS=settings.MAIL_HYPNOS_VALIDATE_CERTS
-)
+# Idle sessions older than this are closed instead of reused (providers drop them)
+SMTP_POOL_IDLE_TIMEOUT = 240
+# Timeout of each SMTP command, connection included (in seconds)
+SMTP_TIMEOUT = 30
+
+
+class SMTPPool:
+    """
+    Pool of persistent SMTP sessions (one pool per worker process).
+
+    At most `size` sessions are open at once; a send waits for a free one.
+    A session is reset with RSET before being reused, and a send that fails
+    because the server dropped the connection is retried once on a new session.
+    """
+
+    def __init__(self, size: int):
+        self._size = max(size, 1)
+        self._semaphore = asyncio.Semaphore(self._size)
+        # (session, last used monotonic)
+        self._idle: list[tuple[aiosmtplib.SMTP, float]] = []
+
+        self.sent = 0
+        self.failed = 0
+        self.connects = 0
+        self.reconnects = 0
+        self.send_seconds_total = 0.0
+        self.send_seconds_max = 0.0
+
+    def _new_session(self) -> aiosmtplib.SMTP:
+        use_credentials = settings.MAIL_HYPNOS_USE_CREDENTIALS
+        return aiosmtplib.SMTP(
+            hostname=settings.MAIL_HYPNOS_SERVER,
+            port=settings.MAIL_HYPNOS_PORT,
+            use_tls=settings.MAIL_HYPNOS_SSL_TLS,
+            start_tls=settings.MAIL_HYPNOS_STARTTLS,
+            validate_certs=settings.MAIL_HYPNOS_VALIDATE_CERTS,
+            username=settings.MAIL_HYPNOS_USERNAME if use_credentials else None,
+            password=settings.MAIL_HYPNOS_PASSWORD if use_credentials else None,
+            timeout=SMTP_TIMEOUT,
+        )
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        session = self._new_session()
+        await session.connect()  # EHLO, STARTTLS et login inclus
+        self.connects += 1
+        return session
+
+    async def _close(self, session: aiosmtplib.SMTP) -> None:
+        try:
+            if session.is_connected:
+                await session.quit()
+        except Exception:
+            session.close()
+
+    async def _acquire(self) -> aiosmtplib.SMTP:
+        """Return a ready session (reused if possible). Caller holds the semaphore."""
+        while self._idle:
+            session, last_used = self._idle.pop()
+            if time.monotonic() - last_used > SMTP_POOL_IDLE_TIMEOUT or not session.is_connected:
+                await self._close(session)
+                continue
+            try:
+                await session.rset()
+                return session
+            except (aiosmtplib.SMTPException, OSError):
+                # Dropped by the server while idle: open a new one
+                session.close()
+                self.reconnects += 1
+        return await self._connect()
+
+    def _release(self, session: aiosmtplib.SMTP) -> None:
+        if session.is_connected:
+            self._idle.append((session, time.monotonic()))
+
+    async def _send_on(self, session: aiosmtplib.SMTP, message: EmailMessage) -> None:
+        """Send over a session, returning it to the pool unless the connection is broken."""
+        try:
+            await session.send_message(message)
+        except OSError:
+            # Connection lost (SMTPServerDisconnected, timeouts... are OSErrors)
+            session.close()
+            raise
+        except Exception:
+            # Refus du serveur (destinataire...): la session reste utilisable
+            self._release(session)
+            raise
+        self._release(session)
+
+    async def send(self, message: EmailMessage) -> None:
+        """Send one message. Raises aiosmtplib / OS errors on failure."""
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                try:
+                    await self._send_on(await self._acquire(), message)
+                except OSError:
+                    # Dropped mid-send: one more try on a new session
+                    self.reconnects += 1
+                    await self._send_on(await self._connect(), message)
+            except Exception:
+                self.failed += 1
+                raise
+
+            elapsed = time.monotonic() - started
+            self.sent += 1
+            self.send_seconds_total += elapsed
+            self.send_seconds_max = max(self.send_seconds_max, elapsed)
+
+    async def close(self) -> None:
+        """Close the idle sessions (on shutdown)."""
+        idle, self._idle = self._idle, []
+        for session, _ in idle:
+            await self._close(session)
+
+    def get_stats(self) -> dict:
+        """Session and latency counters (for monitoring)."""
+        return {
+            "size": self._size,
+            "idle_sessions": len(self._idle),
+            "sent": self.sent,
+            "failed": self.failed,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "avg_send_ms": round(self.send_seconds_total / self.sent * 1000, 1) if self.sent else 0.0,
+            "max_send_ms": round(self.send_seconds_max * 1000, 1),
+        }
+
+
+smtp_pool = SMTPPool(settings.SMTP_POOL_SIZE)
+
+
+def build_message(subject: str, recipient: str, html: str) -> EmailMessage:
+    """HTML email from the Hypnos sender address."""
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = formataddr((settings.MAIL_HYPNOS_FROM_NAME, settings.MAIL_HYPNOS_FROM))
+    message["To"] = recipient
+    message["Message-ID"] = make_msgid(domain=settings.MAIL_HYPNOS_FROM.rpartition("@")[2] or None)
+    message.set_content(html, subtype="html")
+    return message
 
 # Couleurs du design Mc'INT
 COLORS = {
@@ -293,17 +434,10 @@ async def send_verification_email(recipient_email: str, code: str) -> bool:
 
     html = get_email_wrapper(content)
 
-    message = MessageSchema(
-        subject=f"🔐 Code Mc'INT : {code}",
-        recipients=[recipient_email],
-        body=html,
-        subtype=MessageType.html
-    )
-
-    fm = FastMail(conf_mail_hypnos)
+    message = build_message(f"🔐 Code Mc'INT : {code}", recipient_email, html)
 
     try:
-        await fm.send_message(message)
+        await smtp_pool.send(message)
         return True
     except Exception as e:
         print(f"Erreur envoi email: {e}")
@@ -324,29 +458,15 @@ async def send_order_confirmation(user) -> bool:
     if not user.status_token:
         user.status_token = secrets.token_urlsafe(32)
 
-    # Helper to resolve item name/price (using cached data)
-    from src.menu.utils import get_menu_data
-    menu_data = get_menu_data()
+    # Resolve items through the indexed catalog (cached data)
+    from src.menu.utils import get_menu_catalog
+    catalog = get_menu_catalog()
 
-    def get_item_details(item_id):
-        if not item_id:
-            return None
-        for cat in ["menus", "boissons", "extras"]:
-            for item in menu_data.get(cat, []):
-                if item["id"] == item_id:
-                    return item
-        return None
-
-    menu_details = get_item_details(user.menu_id)
-    boisson_details = get_item_details(user.boisson_id)
+    menu_details = catalog.get_item(user.menu_id)
+    boisson_details = catalog.get_item(user.boisson_id)
 
     # Récupérer tous les extras
-    extras_details = []
-    if user.bonus_ids:
-        for bonus_id in user.bonus_ids:
-            details = get_item_details(bonus_id)
-            if details:
-                extras_details.append(details)
+    extras_details = catalog.get_items(user.bonus_ids)
 
     print(f"[DEBUG] send_order_confirmation: user={user.id}, email={user.email}, total_amount={user.total_amount}")
 
@@ -454,18 +574,11 @@ async def send_order_confirmation(user) -> bool:
 
     html = get_email_wrapper(content)
 
-    message = MessageSchema(
-        subject="✅ Commande Mc'INT confirmée - 7 février 2026",
-        recipients=[user.email],
-        body=html,
-        subtype=MessageType.html
-    )
-
-    fm = FastMail(conf_mail_hypnos)
+    message = build_message("✅ Commande Mc'INT confirmée - 7 février 2026", user.email, html)
 
     try:
         print(f"[DEBUG] Attempting to send message to {user.email}")
-        await fm.send_message(message)
+        await smtp_pool.send(message)
         print(f"[DEBUG] Message sent successfully to {user.email}")
         return True
     except Exception as e:
@@ -496,17 +609,10 @@ async def send_test_email(recipient_email: str) -> bool:
 
     html = get_email_wrapper(content)
 
-    message = MessageSchema(
-        subject="🧪 Test Mc'INT",
-        recipients=[recipient_email],
-        body=html,
-        subtype=MessageType.html
-    )
-
-    fm = FastMail(conf_mail_hypnos)
+    message = build_message("🧪 Test Mc'INT", recipient_email, html)
 
     try:
-        await fm.send_message(message)
+        await smtp_pool.send(message)
     except Exception:
         return False
     return True
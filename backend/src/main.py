@@ -14,16 +14,23 @@ from src.print.router import router as print_router
 from src.payments.router import router as payments_router
 from src.terminal.router import router as terminal_router
 from src.payments.background_tasks import start_background_tasks
+from src.reservations.background_tasks import start_background_tasks as start_reservation_tasks
 from src.payments.helloasso_service import close_http_client
 from src.core.config import settings
 from src.core.rate_limit import rate_limiter
-from src.db.base import Base
-from src.db.session import engine, get_db
+from src.core.rate_limit_middleware import RateLimitMiddleware, request_limits
+from src.core.idempotency import idempotency_store
+from src.outbox import outbox_sender
+from src.mail import smtp_pool
+from src.menu.utils import start_menu_watcher, stop_menu_watcher
+from src.db.base import Base, import_models
+from src.db.session import engine, async_engine, get_db
 from src.db.init_db import init_db
 # Importer les modèles pour que SQLAlchemy les enregistre
 from src.users.models import User
 
 # Créer les tables (à remplacer par Alembic en prod)
+import_models()
 Base.metadata.create_all(bind=engine)
 
 init_db()  # Lance au démarrage de l'app
@@ -38,32 +45,52 @@ async def lifespan(app: FastAPI):
     Lifespan context manager for FastAPI app.
     Starts background tasks on startup and cancels them on shutdown.
     """
-    # Startup: Start background tasks
+    # Startup: Load menu snapshot and watch menu_data.json for changes
+    print("[STARTUP] Loading menu data...")
+    start_menu_watcher()
+
+    # Start background tasks
     print("[STARTUP] Starting background tasks...")
-    background_task = await start_background_tasks()
+    payment_tasks = await start_background_tasks()
+    reservation_tasks = await start_reservation_tasks()
+    outbox_task = outbox_sender.start()
 
     # Start rate limiter cleanup task
     print("[STARTUP] Starting rate limiter cleanup task...")
     rate_limiter_task = rate_limiter.start_cleanup_task()
+    request_limits.limiter.start_cleanup_task()
+    idempotency_cleanup_task = idempotency_store.start_cleanup_task()
 
     yield
 
     # Shutdown: Cancel background tasks
     print("[SHUTDOWN] Cancelling background tasks...")
-    background_task.cancel()
-    try:
-        await background_task
-    except asyncio.CancelledError:
-        print("[SHUTDOWN] Background tasks cancelled")
+    for task in (*payment_tasks, *reservation_tasks, outbox_task, idempotency_cleanup_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    print("[SHUTDOWN] Background tasks cancelled")
 
     # Stop rate limiter cleanup
     print("[SHUTDOWN] Stopping rate limiter cleanup...")
     await rate_limiter.stop_cleanup_task()
+    await request_limits.limiter.stop_cleanup_task()
+
+    # Stop menu watcher
+    await stop_menu_watcher()
 
     # Close HTTP client
     print("[SHUTDOWN] Closing HTTP client...")
     await close_http_client()
 
+    # Close the idle SMTP sessions
+    await smtp_pool.close()
+
+    # Close the async DB pool
+    await async_engine.dispose()
+
 
 app = FastAPI(
     title="MC INT API",
@@ -86,6 +113,10 @@ allowed_origins = [
 if settings.FRONTEND_URL and settings.FRONTEND_URL not in allowed_origins:
     allowed_origins.append(settings.FRONTEND_URL)
 
+# Per-IP limits, checked before routing (added first so that CORS headers
+# are also set on the 429 responses)
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -4,7 +4,7 @@ from pathlib import Path
 from typing import List
 
 from .schemas import CategoryResponse, MenuItemResponse
-from .utils import load_menu_data
+from .utils import get_menu_data
 
 router = APIRouter(tags=["menu"])
 
@@ -12,7 +12,7 @@ router = APIRouter(tags=["menu"])
 @router.get("/categories", response_model=List[CategoryResponse])
 def get_categories():
     """Get all active menu categories."""
-    data = load_menu_data()
+    data = get_menu_data()
     
     categories = []
     for cat in data.get("categories", []):
@@ -29,7 +29,7 @@ def get_categories():
 @router.get("/items", response_model=List[MenuItemResponse])
 def get_menu_items(category_id: str | None = None):
     """Get all available menu items, optionally filtered by category."""
-    data = load_menu_data()
+    data = get_menu_data()
     all_items = []
     
     # Process Menus
@@ -1,17 +1,61 @@
 """
-Menu data utilities with thread-safe caching.
+Menu data utilities with a versioned, hot-reloadable snapshot.
 
-Provides centralized, cached access to menu data loaded from JSON.
-All modules should use get_menu_data() instead of load_menu_data() directly.
+menu_data.json is parsed once into an immutable MenuCatalog snapshot.
+Request paths only read the current snapshot (no filesystem access); a
+background watcher checks the file's mtime at most once per
+MENU_RELOAD_CHECK_INTERVAL and swaps in a new snapshot when it changed.
+An admin can also force a reload. The swap is a single reference
+assignment, so readers never see a half-loaded menu.
+
+All modules should use get_menu_catalog() for item lookups (O(1) by id or
+name) and get_menu_data() for the raw (read-only) data.
 """
 import asyncio
 import json
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Any, Optional
-
-# Thread-safe cache
-_menu_cache: Optional[Dict[str, Any]] = None
-_cache_lock = asyncio.Lock()
+from types import MappingProxyType
+from typing import Dict, Any, Iterable, List, Mapping, Optional, Tuple
+
+# Assuming the structure is backend/src/db/menu_data.json
+# and this file is in backend/src/menu/utils.py
+MENU_DATA_PATH = Path(__file__).parent.parent / "db" / "menu_data.json"
+
+# How often the background watcher checks menu_data.json for changes (seconds)
+MENU_RELOAD_CHECK_INTERVAL = 30
+
+# Item sections of menu_data.json, in lookup priority order, with the
+# item_type each section maps to
+MENU_SECTIONS: Tuple[str, ...] = ("menus", "boissons", "extras")
+SECTION_ITEM_TYPES: Mapping[str, str] = MappingProxyType({
+    "menus": "menu",
+    "boissons": "boisson",
+    "extras": "upsell",
+})
+
+EMPTY_MENU_DATA: Mapping[str, Any] = MappingProxyType(
+    {"categories": (), "menus": (), "boissons": (), "extras": ()}
+)
+
+# Current snapshot (swapped atomically) and reload bookkeeping
+_catalog: Optional["MenuCatalog"] = None
+_reload_lock = threading.Lock()
+_reload_count = 0
+_last_check_at: Optional[datetime] = None
+_last_error: Optional[str] = None
+_watcher_task: Optional[asyncio.Task] = None
+
+
+def _get_source_mtime() -> Optional[float]:
+    """mtime of menu_data.json, None if the file is missing."""
+    try:
+        return os.stat(MENU_DATA_PATH).st_mtime
+    except OSError:
+        return None
 
 
 def _load_menu_from_disk() -> Dict[str, Any]:
@@ -20,104 +64,334 @@ def _load_menu_from_disk() -> Dict[str, Any]:
 
     Returns:
         Menu data dictionary
+
+    Raises:
+        OSError, ValueError: if the file can't be read or parsed
     """
-    try:
-        # Assuming the structure is backend/src/db/menu_data.json
-        # and this file is in backend/src/menu/utils.py
-        json_path = Path(__file__).parent.parent / "db" / "menu_data.json"
-        with open(json_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading menu data: {e}")
-        return {"categories": [], "menus": [], "boissons": [], "extras": []}
+    with open(MENU_DATA_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
 
 
-def load_menu_data() -> Dict[str, Any]:
-    """
-    Load menu data from JSON file.
+def _freeze(value: Any) -> Any:
+    """Recursively convert dicts/lists to read-only mappings/tuples."""
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
 
-    DEPRECATED: Use get_menu_data() for cached access.
-    This function is kept for backward compatibility but reads from disk each time.
 
-    Returns:
-        Menu data dictionary
+@dataclass(frozen=True)
+class MenuCatalog:
     """
-    return _load_menu_from_disk()
+    Immutable, indexed view of the menu data.
 
+    Built once from menu_data.json. Every item is a read-only mapping that
+    already carries its item_type ("menu", "boisson" or "upsell"), so callers
+    never need to patch the shared data.
+    """
+    categories: Tuple[Mapping[str, Any], ...]
+    sections: Mapping[str, Tuple[Mapping[str, Any], ...]]
+    items_by_id: Mapping[str, Mapping[str, Any]]
+    items_by_name: Mapping[str, Mapping[str, Any]]
+    items_by_name_ci: Mapping[str, Mapping[str, Any]]
+    section_items_by_name: Mapping[Tuple[str, str], Mapping[str, Any]]
+    section_items_by_name_ci: Mapping[Tuple[str, str], Mapping[str, Any]]
+    section_ids: Mapping[str, frozenset]
+    category_names: Mapping[str, str]
+    menu_category_ids: frozenset
+    menu_category_names: Tuple[str, ...]
+    data: Mapping[str, Any] = field(default_factory=lambda: EMPTY_MENU_DATA, repr=False)
+    version: int = 0
+    source_mtime: Optional[float] = None
+    loaded_at: Optional[datetime] = None
+
+    @classmethod
+    def from_data(
+        cls,
+        data: Mapping[str, Any],
+        version: int = 0,
+        source_mtime: Optional[float] = None,
+    ) -> "MenuCatalog":
+        """Build the catalog and all its indexes from raw menu data."""
+        sections: Dict[str, Tuple[Mapping[str, Any], ...]] = {}
+        items_by_id: Dict[str, Mapping[str, Any]] = {}
+        items_by_name: Dict[str, Mapping[str, Any]] = {}
+        items_by_name_ci: Dict[str, Mapping[str, Any]] = {}
+        section_items_by_name: Dict[Tuple[str, str], Mapping[str, Any]] = {}
+        section_items_by_name_ci: Dict[Tuple[str, str], Mapping[str, Any]] = {}
+        section_ids: Dict[str, frozenset] = {}
+
+        for section in MENU_SECTIONS:
+            frozen_items = []
+            for raw_item in data.get(section, []):
+                item = dict(raw_item)
+                if section == "menus":
+                    item["item_type"] = item.get("item_type", "menu")
+                else:
+                    item["item_type"] = SECTION_ITEM_TYPES[section]
+                item = _freeze(item)
+                frozen_items.append(item)
+
+                # First occurrence wins, matching the historical scan order
+                items_by_id.setdefault(item["id"], item)
+                items_by_name.setdefault(item["name"], item)
+                items_by_name_ci.setdefault(item["name"].lower(), item)
+                section_items_by_name.setdefault((section, item["name"]), item)
+                section_items_by_name_ci.setdefault((section, item["name"].lower()), item)
+
+            sections[section] = tuple(frozen_items)
+            section_ids[section] = frozenset(item["id"] for item in frozen_items)
+
+        categories = tuple(_freeze(cat) for cat in data.get("categories", []))
+        category_names = {cat["id"]: cat["name"] for cat in categories}
+
+        # "Menu" categories are those that contain items of the "menus" list
+        menu_category_ids = frozenset(item.get("category") for item in sections["menus"])
+        menu_category_names = tuple(
+            cat["name"] for cat in categories if cat["id"] in menu_category_ids
+        )
+
+        return cls(
+            categories=categories,
+            sections=MappingProxyType(sections),
+            items_by_id=MappingProxyType(items_by_id),
+            items_by_name=MappingProxyType(items_by_name),
+            items_by_name_ci=MappingProxyType(items_by_name_ci),
+            section_items_by_name=MappingProxyType(section_items_by_name),
+            section_items_by_name_ci=MappingProxyType(section_items_by_name_ci),
+            section_ids=MappingProxyType(section_ids),
+            category_names=MappingProxyType(category_names),
+            menu_category_ids=menu_category_ids,
+            menu_category_names=menu_category_names,
+            data=_freeze(data),
+            version=version,
+            source_mtime=source_mtime,
+            loaded_at=datetime.now(timezone.utc),
+        )
+
+    def get_item(self, item_id: Optional[str]) -> Optional[Mapping[str, Any]]:
+        """Get an item by its ID, None if unknown."""
+        if not item_id:
+            return None
+        return self.items_by_id.get(item_id)
+
+    def get_item_by_name(
+        self,
+        name: Optional[str],
+        section: Optional[str] = None,
+        case_sensitive: bool = True,
+    ) -> Optional[Mapping[str, Any]]:
+        """
+        Get an item by its display name.
+
+        Args:
+            name: Item name as shown to users
+            section: Restrict to one section (menus, boissons, extras)
+            case_sensitive: Exact match (True) or case-insensitive match (False)
+        """
+        if not name:
+            return None
+        if section:
+            if case_sensitive:
+                return self.section_items_by_name.get((section, name))
+            return self.section_items_by_name_ci.get((section, name.lower()))
+        if case_sensitive:
+            return self.items_by_name.get(name)
+        return self.items_by_name_ci.get(name.lower())
+
+    def get_item_name(self, item_id: Optional[str], default: Optional[str] = None) -> Optional[str]:
+        """Get an item's name by its ID, `default` if unknown."""
+        item = self.get_item(item_id)
+        return item["name"] if item else default
+
+    def get_items(self, item_ids: Optional[Iterable[str]]) -> List[Mapping[str, Any]]:
+        """Resolve a list of IDs (e.g. bonus_ids), skipping unknown ones."""
+        if not item_ids:
+            return []
+        return [item for item in map(self.items_by_id.get, item_ids) if item is not None]
+
+    def get_category_name(self, category_id: Optional[str]) -> Optional[str]:
+        """Get a category's name by its ID, None if unknown."""
+        if not category_id:
+            return None
+        return self.category_names.get(category_id)
+
+
+def reload_menu(force: bool = False) -> bool:
+    """
+    Reload menu_data.json into a new snapshot if it changed on disk.
+
+    Builds the new catalog completely before swapping the module-level
+    reference, so concurrent readers see either the old or the new menu.
+    On a read/parse error the current snapshot is kept.
+
+    Args:
+        force: Reload even if the file's mtime did not change
 
-def get_menu_data() -> Dict[str, Any]:
+    Returns:
+        True if a new snapshot was installed
     """
-    Get menu data with caching (synchronous version).
+    global _catalog, _reload_count, _last_check_at, _last_error
+
+    with _reload_lock:
+        _last_check_at = datetime.now(timezone.utc)
+        mtime = _get_source_mtime()
+        current = _catalog
+
+        if current is not None and not force and mtime == current.source_mtime:
+            return False
+
+        try:
+            data = _load_menu_from_disk()
+            catalog = MenuCatalog.from_data(
+                data,
+                version=(current.version + 1) if current else 1,
+                source_mtime=mtime,
+            )
+        except Exception as e:
+            _last_error = str(e)
+            print(f"Error loading menu data: {e}")
+            if current is None:
+                # First load failed: serve an empty menu until the file is fixed
+                _catalog = MenuCatalog.from_data(EMPTY_MENU_DATA, version=0, source_mtime=None)
+            return False
+
+        _last_error = None
+        if current is not None:
+            _reload_count += 1
+            print(f"[MENU] Reloaded menu data (version {catalog.version})")
+        _catalog = catalog
+        return True
+
+
+def get_menu_catalog() -> MenuCatalog:
+    """
+    Get the current menu snapshot.
 
-    Thread-safe for use in non-async contexts.
-    Loads data from disk on first call, then returns cached copy.
+    Never touches the filesystem once the first snapshot is loaded (normally
+    at startup); later changes are picked up by the background watcher.
 
     Returns:
-        Menu data dictionary (cached)
+        MenuCatalog (immutable, safe to share between requests)
     """
-    global _menu_cache
+    catalog = _catalog
+    if catalog is None:
+        reload_menu()
+        catalog = _catalog
+    return catalog
 
-    if _menu_cache is None:
-        _menu_cache = _load_menu_from_disk()
 
-    return _menu_cache
+def load_menu_data() -> Mapping[str, Any]:
+    """
+    Get menu data.
 
+    DEPRECATED: Use get_menu_catalog() (or get_menu_data()).
+    Kept for backward compatibility; now served from the in-memory snapshot.
 
-async def get_menu_data_async() -> Dict[str, Any]:
+    Returns:
+        Menu data (read-only)
     """
-    Get menu data with thread-safe caching (async version).
+    return get_menu_data()
+
 
-    Uses asyncio.Lock to prevent race conditions on first load.
+def get_menu_data() -> Mapping[str, Any]:
+    """
+    Get the raw menu data of the current snapshot.
 
     Returns:
-        Menu data dictionary (cached)
+        Menu data (read-only mappings/tuples)
     """
-    global _menu_cache
+    return get_menu_catalog().data
+
 
-    # Fast path - cache hit
-    if _menu_cache is not None:
-        return _menu_cache
+async def get_menu_data_async() -> Mapping[str, Any]:
+    """
+    Get the raw menu data of the current snapshot (async version).
 
-    # Slow path - need to load with lock
-    async with _cache_lock:
-        # Double-check after acquiring lock
-        if _menu_cache is None:
-            _menu_cache = _load_menu_from_disk()
+    The first load (if it did not already happen at startup) runs in a
+    worker thread so it doesn't block the event loop.
 
-        return _menu_cache
+    Returns:
+        Menu data (read-only mappings/tuples)
+    """
+    if _catalog is None:
+        await asyncio.to_thread(reload_menu)
+    return get_menu_data()
 
 
 def invalidate_menu_cache():
     """
-    Invalidate the menu cache.
+    Force a reload of the menu snapshot.
 
-    Call this if menu_data.json is updated at runtime.
+    Call this if menu_data.json is updated at runtime and the change must be
+    visible before the next watcher check.
     """
-    global _menu_cache
-    _menu_cache = None
-
+    reload_menu(force=True)
+
+
+def get_menu_stats() -> dict:
+    """Snapshot version and reload counters (for monitoring)."""
+    catalog = _catalog
+    return {
+        "version": catalog.version if catalog else None,
+        "loaded_at": catalog.loaded_at.isoformat() if catalog and catalog.loaded_at else None,
+        "item_count": len(catalog.items_by_id) if catalog else 0,
+        "reload_count": _reload_count,
+        "last_check_at": _last_check_at.isoformat() if _last_check_at else None,
+        "last_error": _last_error,
+    }
+
+
+async def _menu_watch_loop():
+    """Background task: check menu_data.json for changes periodically."""
+    while True:
+        try:
+            await asyncio.sleep(MENU_RELOAD_CHECK_INTERVAL)
+            await asyncio.to_thread(reload_menu)
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            print(f"[MENU] Watcher error: {e}")
+
+
+def start_menu_watcher() -> asyncio.Task:
+    """
+    Load the first snapshot (if needed) and start the background watcher.
 
-def get_item_by_id(item_id: str) -> Optional[Dict[str, Any]]:
+    Returns:
+        The asyncio Task running the watch loop
     """
-    Get a menu item by its ID from the cached data.
+    global _watcher_task
+    get_menu_catalog()
+    if _watcher_task is None or _watcher_task.done():
+        _watcher_task = asyncio.create_task(_menu_watch_loop())
+    return _watcher_task
+
+
+async def stop_menu_watcher():
+    """Stop the background watcher."""
+    global _watcher_task
+    if _watcher_task is not None and not _watcher_task.done():
+        _watcher_task.cancel()
+        try:
+            await _watcher_task
+        except asyncio.CancelledError:
+            pass
+    _watcher_task = None
+
+
+def get_item_by_id(item_id: str) -> Optional[Mapping[str, Any]]:
+    """
+    Get a menu item by its ID from the cached catalog.
 
     Args:
         item_id: The item ID to look up
 
     Returns:
-        Item dictionary if found, None otherwise
+        Read-only item mapping if found, None otherwise
     """
-    if not item_id:
-        return None
-
-    data = get_menu_data()
-
-    for category in ["menus", "boissons", "extras"]:
-        for item in data.get(category, []):
-            if item.get("id") == item_id:
-                return item
-
-    return None
+    return get_menu_catalog().get_item(item_id)
 
 
 def get_item_name(item_id: str) -> str:
@@ -130,8 +404,7 @@ def get_item_name(item_id: str) -> str:
     Returns:
         Item name if found, the ID itself otherwise
     """
-    item = get_item_by_id(item_id)
-    return item["name"] if item else item_id
+    return get_menu_catalog().get_item_name(item_id, default=item_id)
 
 
 def get_item_price(item_id: str) -> float:
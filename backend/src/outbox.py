@@ -0,0 +1,279 @@
+"""
+Durable email outbox.
+
+Features:
+- Emails are email_outbox rows, written in the same transaction as the
+  change that triggers them (payment completion, new login code)
+- Sender loop claiming batches with FOR UPDATE SKIP LOCKED (safe with
+  several workers) and sending with bounded concurrency
+- Retries with exponential back-off, users.email_delivery_status kept in sync
+- Queue depth and latencies exposed for monitoring
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from src.core.config import settings
+
+# Max wait between two claims when no email was enqueued by this worker (in seconds)
+OUTBOX_POLL_INTERVAL = 2
+# A claimed email not reported sent/failed after this is claimed again (worker crash)
+OUTBOX_SEND_TIMEOUT = timedelta(seconds=60)
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_BASE = timedelta(seconds=30)
+OUTBOX_RETRY_MAX = timedelta(minutes=30)
+# Sent/failed rows are kept this long, then purged
+OUTBOX_RETENTION = timedelta(days=7)
+OUTBOX_PURGE_INTERVAL = 3600
+
+
+def enqueue_email(db, kind: str, recipient: str, user_id: Optional[int] = None, payload: Optional[dict] = None) -> None:
+    """
+    Add an email to the outbox within the caller's transaction.
+    The caller commits, then calls outbox_sender.wake() to send it at once.
+    """
+    from src.core.models import EmailOutbox
+
+    db.add(EmailOutbox(
+        kind=kind,
+        recipient=recipient,
+        user_id=user_id,
+        payload=payload or {},
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.now(timezone.utc),
+    ))
+
+
+class EmailSendError(Exception):
+    """Email not sent; permanent=True means retrying is pointless."""
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+async def _deliver(kind: str, recipient: str, user_id: Optional[int], payload: dict, created_at: datetime) -> None:
+    """Render and send one outbox email. Raises on failure."""
+    from src.mail import send_verification_email, send_order_confirmation
+
+    if kind == "verification":
+        # Code expiré: inutile de l'envoyer (un nouveau code sera demandé)
+        if datetime.now(timezone.utc) - created_at > timedelta(minutes=settings.EMAIL_CODE_EXPIRE_MINUTES):
+            raise EmailSendError("verification code expired", permanent=True)
+        if not await send_verification_email(recipient, payload["code"]):
+            raise EmailSendError("SMTP send failed")
+
+    elif kind == "order_confirmation":
+        from src.db.session import AsyncSessionLocal
+        from src.users.models import User
+
+        # Fresh order data; no connection held while talking to the SMTP server
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, user_id)
+            await db.commit()
+            if user is None or user.payment_status != "completed":
+                raise EmailSendError("order not completed", permanent=True)
+            if not await send_order_confirmation(user):
+                raise EmailSendError("SMTP send failed")
+
+    else:
+        raise EmailSendError(f"unknown email kind {kind}", permanent=True)
+
+
+class OutboxSender:
+    """Sends the outbox emails (one loop per worker process)."""
+
+    def __init__(self):
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.send_seconds_total = 0.0
+        self.send_seconds_max = 0.0
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+
+    def start(self) -> asyncio.Task:
+        """Start the sender loop in the running event loop. Returns the task for cleanup."""
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def wake(self) -> None:
+        """Send newly committed emails now instead of at the next poll."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _claim(self) -> list:
+        """Claim a batch of due emails (lease = next_attempt_at pushed forward)."""
+        from sqlalchemy import select, update
+        from src.db.session import AsyncSessionLocal
+        from src.core.models import EmailOutbox
+
+        now = datetime.now(timezone.utc)
+        due = (
+            select(EmailOutbox.id)
+            .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at)
+            .limit(settings.EMAIL_OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(due))
+                .values(attempts=EmailOutbox.attempts + 1, next_attempt_at=now + OUTBOX_SEND_TIMEOUT)
+                .returning(
+                    EmailOutbox.id,
+                    EmailOutbox.kind,
+                    EmailOutbox.recipient,
+                    EmailOutbox.user_id,
+                    EmailOutbox.payload,
+                    EmailOutbox.attempts,
+                    EmailOutbox.created_at,
+                )
+                .execution_options(synchronize_session=False)
+            )).all()
+            await db.commit()
+        return rows
+
+    async def _process(self, row, semaphore: asyncio.Semaphore) -> None:
+        created_at = row.created_at.replace(tzinfo=timezone.utc)  # Stored as naive UTC
+        error = None
+        permanent = False
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                await _deliver(row.kind, row.recipient, row.user_id, row.payload or {}, created_at)
+            except EmailSendError as e:
+                error, permanent = str(e), e.permanent
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            elapsed = time.monotonic() - started
+
+        await self._record(row, error, permanent or row.attempts >= OUTBOX_MAX_ATTEMPTS)
+
+        if error is None:
+            queued = (datetime.now(timezone.utc) - created_at).total_seconds()
+            self.sent += 1
+            self.send_seconds_total += elapsed
+            self.send_seconds_max = max(self.send_seconds_max, elapsed)
+            self.queue_seconds_total += queued
+            self.queue_seconds_max = max(self.queue_seconds_max, queued)
+        else:
+            print(f"[OUTBOX] {row.kind} email {row.id} to {row.recipient} failed (attempt {row.attempts}): {error}")
+
+    async def _record(self, row, error: Optional[str], final: bool) -> None:
+        """Store the outcome and mirror it to users.email_delivery_status."""
+        from sqlalchemy import update
+        from src.db.session import AsyncSessionLocal
+        from src.core.models import EmailOutbox
+        from src.users.models import User
+
+        now = datetime.now(timezone.utc)
+        if error is None:
+            values = {"status": "sent", "sent_at": now, "last_error": None}
+            delivery_status = "sent"
+        elif final:
+            values = {"status": "failed", "last_error": error[:500]}
+            delivery_status = "failed"
+            self.failed += 1
+        else:
+            delay = min(OUTBOX_RETRY_BASE * (2 ** (row.attempts - 1)), OUTBOX_RETRY_MAX)
+            values = {"next_attempt_at": now + delay, "last_error": error[:500]}
+            delivery_status = None
+            self.retried += 1
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id == row.id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            if delivery_status and row.kind == "order_confirmation" and row.user_id:
+                await db.execute(
+                    update(User)
+                    .where(User.id == row.user_id)
+                    .values(email_delivery_status=delivery_status)
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+
+    async def _purge(self) -> None:
+        from sqlalchemy import delete
+        from src.db.session import AsyncSessionLocal
+        from src.core.models import EmailOutbox
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(EmailOutbox).where(
+                    EmailOutbox.status != "pending",
+                    EmailOutbox.created_at < datetime.now(timezone.utc) - OUTBOX_RETENTION,
+                )
+            )
+            await db.commit()
+        if result.rowcount:
+            print(f"[OUTBOX] Purged {result.rowcount} old emails")
+
+    async def _run(self):
+        print(
+            f"[OUTBOX] Email sender started (concurrency: {settings.EMAIL_OUTBOX_CONCURRENCY}, "
+            f"batch: {settings.EMAIL_OUTBOX_BATCH_SIZE})"
+        )
+        semaphore = asyncio.Semaphore(max(settings.EMAIL_OUTBOX_CONCURRENCY, 1))
+
+        while True:
+            try:
+                rows = await self._claim()
+                if rows:
+                    await asyncio.gather(*(self._process(row, semaphore) for row in rows))
+                    continue  # More may be waiting
+
+                if time.monotonic() - self._last_purge > OUTBOX_PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    await self._purge()
+            except Exception as e:
+                print(f"[OUTBOX] Sender error: {e}")
+                import traceback
+                traceback.print_exc()
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def get_stats(self) -> dict:
+        """Queue depth and send counters (for monitoring)."""
+        from sqlalchemy import func, select
+        from src.db.session import AsyncSessionLocal
+        from src.core.models import EmailOutbox
+
+        async with AsyncSessionLocal() as db:
+            depth, oldest = (await db.execute(
+                select(func.count(EmailOutbox.id), func.min(EmailOutbox.created_at))
+                .where(EmailOutbox.status == "pending")
+            )).one()
+
+        return {
+            "queue_depth": depth,
+            "oldest_pending_seconds": round((datetime.now(timezone.utc) - oldest.replace(tzinfo=timezone.utc)).total_seconds(), 1) if oldest else None,
+            "concurrency": settings.EMAIL_OUTBOX_CONCURRENCY,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "avg_send_ms": round(self.send_seconds_total / self.sent * 1000, 1) if self.sent else 0.0,
+            "max_send_ms": round(self.send_seconds_max * 1000, 1),
+            "avg_queue_ms": round(self.queue_seconds_total / self.sent * 1000, 1) if self.sent else 0.0,
+            "max_queue_ms": round(self.queue_seconds_max * 1000, 1),
+        }
+
+
+outbox_sender = OutboxSender()
@@ -3,69 +3,224 @@ Background Tasks for Payment Processing
 
 This module contains async background tasks that run periodically to check
 pending payments against the HelloAsso API.
+
+Pending intents are checked concurrently (bounded by
+HELLOASSO_POLL_CONCURRENCY to stay under the HelloAsso rate limits), each
+one with its own short DB transaction.
+
+HelloAsso notifications (/payments/notifications) complete most payments;
+this poller is the slow fallback for missed notifications.
+
+Each checkout has its own schedule (users.payment_next_check_at): first
+check a few minutes after creation, then exponential back-off. Once the
+reservation has expired or the checkout is past its reuse window, it gets
+a final check and is retired, so HelloAsso calls scale with active carts.
 """
 import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
-# Interval between payment checks (in seconds)
-PAYMENT_CHECK_INTERVAL = 180
+from src.core.config import settings
+
+# Interval between two poller passes (only the due checkouts are checked)
+PAYMENT_CHECK_INTERVAL = 30
 # Timeout per HelloAsso API call (in seconds)
 API_CALL_TIMEOUT = 10
 
+# Delay before the first check of a new checkout, doubled after each check
+PAYMENT_CHECK_FIRST_DELAY = timedelta(minutes=2)
+# Max delay between two checks of the same checkout
+PAYMENT_CHECK_MAX_DELAY = timedelta(minutes=10)
 
-async def check_pending_payments():
+# Counters of the last pass and since startup (see get_poller_stats)
+_poller_stats = {
+    "passes": 0,
+    "total_checked": 0,
+    "total_completed": 0,
+    "total_retired": 0,
+    "total_errors": 0,
+    "last_pass": None,
+}
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """DateTime columns are stored as naive UTC."""
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+def payment_check_deadline(user) -> Optional[datetime]:
     """
-    Background task that checks HelloAsso API for all pending payments.
-    Runs every 3 minutes (180 seconds).
+    Time after which the checkout can no longer be paid in the normal flow:
+    reservation expired or checkout past its reuse window (earliest of both).
+    """
+    from src.payments.router import CHECKOUT_REUSE_WINDOW
 
-    This provides a safety net for payments that:
-    - User closed browser before returning from payment
-    - Network issues prevented frontend polling from completing
+    deadlines = []
+    if user.reservation_expires_at:
+        deadlines.append(_as_utc(user.reservation_expires_at))
+    if user.checkout_created_at:
+        deadlines.append(_as_utc(user.checkout_created_at) + CHECKOUT_REUSE_WINDOW)
+    return min(deadlines) if deadlines else None
+
+
+def schedule_payment_checks(user, now: datetime) -> None:
+    """Start the check schedule of a newly created checkout (caller commits)."""
+    user.payment_check_count = 0
+    user.payment_next_check_at = now + PAYMENT_CHECK_FIRST_DELAY
+
+
+def next_payment_check(user, now: datetime) -> Optional[datetime]:
+    """
+    Due time of the next check after one at `now` (exponential back-off,
+    never past the deadline). None once the deadline is reached: the check
+    just made was the final one.
+    """
+    deadline = payment_check_deadline(user)
+    if deadline is not None and now >= deadline:
+        return None
+
+    delay = min(PAYMENT_CHECK_FIRST_DELAY * (2 ** (user.payment_check_count or 0)), PAYMENT_CHECK_MAX_DELAY)
+    next_check = now + delay
+    if deadline is not None:
+        next_check = min(next_check, deadline)
+    return next_check
+
+
+async def _check_pending_payment(user_id: int, checkout_intent_id: str) -> str:
     """
-    from src.db.session import SessionLocal
+    Check one pending intent against HelloAsso: complete it if paid,
+    otherwise schedule its next check (or retire it).
+    Returns "completed", "scheduled", "retired" or "skipped".
+    """
+    from src.db.session import AsyncSessionLocal
     from src.users.models import User
     from src.payments import helloasso_service
     from src.payments.router import complete_payment
 
-    print(f"[BACKGROUND] Payment check task started (interval: {PAYMENT_CHECK_INTERVAL}s)")
+    # Add timeout to prevent blocking if HelloAsso API is slow/down
+    result = await asyncio.wait_for(
+        helloasso_service.get_checkout_intent(checkout_intent_id),
+        timeout=API_CALL_TIMEOUT
+    )
+
+    # Short transaction, once HelloAsso answered
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+        # Paid meanwhile, or a new checkout replaced this one (own schedule)
+        if user is None or user.payment_status != "pending" or user.payment_intent_id != checkout_intent_id:
+            return "skipped"
+
+        if result.get("order"):
+            was_new = await complete_payment(user, checkout_intent_id, db)
+            if was_new:
+                print(f"[BACKGROUND] Payment completed for user {user_id} ({user.email})")
+                return "completed"
+            print(f"[BACKGROUND] User {user_id} was already completed (concurrent update)")
+            return "skipped"
+
+        user.payment_next_check_at = next_payment_check(user, datetime.now(timezone.utc))
+        user.payment_check_count = (user.payment_check_count or 0) + 1
+        await db.commit()
+
+        if user.payment_next_check_at is None:
+            print(f"[BACKGROUND] Checkout {checkout_intent_id} of user {user_id} retired after {user.payment_check_count} checks")
+            return "retired"
+        return "scheduled"
+
+
+async def run_payment_check_pass() -> dict:
+    """
+    Check the pending payments that are due, at most HELLOASSO_POLL_CONCURRENCY at a time.
+    Returns the pass metrics (checked, completed, retired, errors, duration).
+    """
+    from sqlalchemy import select
+    from src.db.session import AsyncSessionLocal
+    from src.users.models import User
 
-    while True:
-        try:
-            db = SessionLocal()
+    started = time.monotonic()
+
+    # Only ids are loaded: no connection held while HelloAsso answers
+    async with AsyncSessionLocal() as db:
+        pending = (await db.execute(select(User.id, User.payment_intent_id).where(
+            User.payment_status == "pending",
+            User.payment_intent_id.isnot(None),
+            User.payment_next_check_at <= datetime.now(timezone.utc)
+        ))).all()
+
+    if pending:
+        print(f"[BACKGROUND] Checking {len(pending)} due pending payments")
+
+    semaphore = asyncio.Semaphore(max(settings.HELLOASSO_POLL_CONCURRENCY, 1))
+
+    async def check(user_id: int, checkout_intent_id: str):
+        async with semaphore:
             try:
-                pending_users = db.query(User).filter(
-                    User.payment_status == "pending",
-                    User.payment_intent_id.isnot(None)
-                ).all()
-
-                if pending_users:
-                    print(f"[BACKGROUND] Checking {len(pending_users)} pending payments")
-
-                for user in pending_users:
-                    try:
-                        # Add timeout to prevent blocking if HelloAsso API is slow/down
-                        result = await asyncio.wait_for(
-                            helloasso_service.get_checkout_intent(user.payment_intent_id),
-                            timeout=API_CALL_TIMEOUT
-                        )
-                        order = result.get("order")
-
-                        if order:
-                            was_new = await complete_payment(user, user.payment_intent_id, db)
-                            if was_new:
-                                print(f"[BACKGROUND] Payment completed for user {user.id} ({user.email})")
-                            else:
-                                print(f"[BACKGROUND] User {user.id} was already completed (concurrent update)")
-
-                    except asyncio.TimeoutError:
-                        print(f"[BACKGROUND] Timeout checking user {user.id} - skipping to next")
-                        continue
-                    except Exception as e:
-                        print(f"[BACKGROUND] Error checking user {user.id}: {e}")
-                        continue
-
-            finally:
-                db.close()
+                return await _check_pending_payment(user_id, checkout_intent_id)
+            except asyncio.TimeoutError:
+                print(f"[BACKGROUND] Timeout checking user {user_id} - skipping to next")
+                raise
+            except Exception as e:
+                print(f"[BACKGROUND] Error checking user {user_id}: {e}")
+                raise
+
+    results = await asyncio.gather(
+        *(check(user_id, intent_id) for user_id, intent_id in pending),
+        return_exceptions=True,
+    )
+
+    metrics = {
+        "checked": len(results),
+        "completed": sum(1 for r in results if r == "completed"),
+        "retired": sum(1 for r in results if r == "retired"),
+        "errors": sum(1 for r in results if isinstance(r, BaseException)),
+        "duration_seconds": round(time.monotonic() - started, 3),
+        "finished_at": time.time(),
+    }
+
+    _poller_stats["passes"] += 1
+    _poller_stats["total_checked"] += metrics["checked"]
+    _poller_stats["total_completed"] += metrics["completed"]
+    _poller_stats["total_retired"] += metrics["retired"]
+    _poller_stats["total_errors"] += metrics["errors"]
+    _poller_stats["last_pass"] = metrics
+
+    if pending:
+        print(
+            f"[BACKGROUND] Pass done: {metrics['checked']} checked, {metrics['completed']} completed, "
+            f"{metrics['retired']} retired, {metrics['errors']} errors in {metrics['duration_seconds']}s"
+        )
+    return metrics
+
+
+def get_poller_stats() -> dict:
+    """Payment poller counters (for monitoring)."""
+    return {
+        "interval_seconds": PAYMENT_CHECK_INTERVAL,
+        "concurrency": settings.HELLOASSO_POLL_CONCURRENCY,
+        **_poller_stats,
+    }
+
 
+async def check_pending_payments():
+    """
+    Background task that checks HelloAsso API for the pending payments that are due.
+    Runs every 30 seconds; each checkout follows its own back-off schedule.
+
+    This provides a safety net for payments that:
+    - User closed browser before returning from payment
+    - Network issues prevented frontend polling from completing
+    """
+    print(
+        f"[BACKGROUND] Payment check task started (interval: {PAYMENT_CHECK_INTERVAL}s, "
+        f"concurrency: {settings.HELLOASSO_POLL_CONCURRENCY})"
+    )
+
+    while True:
+        try:
+            await run_payment_check_pass()
         except Exception as e:
             print(f"[BACKGROUND] Task error: {e}")
             import traceback
@@ -78,7 +233,13 @@ async def check_pending_payments():
 async def start_background_tasks():
     """
     Start all background tasks.
-    Returns the task handle for cleanup.
+    Returns the task handles for cleanup.
     """
-    task = asyncio.create_task(check_pending_payments())
-    return task
+    from src.payments.helloasso_service import refresh_token_task
+    from src.payments.reconciliation import reconcile_orders_task
+
+    return [
+        asyncio.create_task(check_pending_payments()),
+        asyncio.create_task(refresh_token_task()),
+        asyncio.create_task(reconcile_orders_task()),
+    ]
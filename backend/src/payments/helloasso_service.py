@@ -2,14 +2,18 @@
 HelloAsso Service - OAuth2 authentication and Checkout API integration
 
 Features:
-- Thread-safe token caching with asyncio.Lock
+- One OAuth token shared by all workers (helloasso_tokens row), renewed
+  ahead of expiry by a background task
 - Persistent HTTP client with connection pooling
 - Retry logic with exponential backoff for transient failures
 - Configurable timeouts on all API calls
+- Shared checkout intent lookups: concurrent calls for one intent are
+  coalesced, pending answers cached a few seconds, paid ones for good
 """
 import asyncio
+import time
 import httpx
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any
 from src.core.config import settings
 
@@ -18,18 +22,32 @@ from src.core.config import settings
 API_TIMEOUT = 30.0  # seconds
 MAX_RETRIES = 3
 RETRY_BACKOFF_BASE = 1.0  # seconds
+INTENT_PENDING_TTL = 5.0  # seconds a "no order yet" answer is reused
+INTENT_CACHE_MAX_ENTRIES = 10000
+TOKEN_REFRESH_MARGIN = 600  # seconds before expiry the background task renews the token
+TOKEN_MIN_VALIDITY = 60  # seconds: below this a request renews the token itself
+TOKEN_REFRESH_CHECK_INTERVAL = 60  # seconds between two background checks
+TOKEN_RENEWAL_LEASE = 2 * API_TIMEOUT + 10  # seconds: covers both grants of _request_token
+TOKEN_LEASE_POLL_INTERVAL = 0.2  # seconds between two reads while another worker renews
+ORDERS_PAGE_SIZE = 100  # max allowed by the orders listing
 
 # Persistent HTTP client with connection pooling
 _http_client: Optional[httpx.AsyncClient] = None
 _client_lock = asyncio.Lock()
 
-# Cache for OAuth tokens with thread-safe access
+# Process-local copy of the shared token (helloasso_tokens row)
 _token_cache: Dict[str, Any] = {
     "access_token": None,
     "refresh_token": None,
     "expires_at": None
 }
 _token_lock = asyncio.Lock()
+_token_stats = {"local_hits": 0, "shared_checks": 0, "lease_waits": 0, "refreshes": 0, "refresh_errors": 0}
+
+# Checkout intent lookups: intent id -> (expires_at monotonic or None, result)
+_intent_cache: Dict[str, tuple] = {}
+_intent_inflight: Dict[str, asyncio.Task] = {}
+_intent_stats = {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0}
 
 
 async def get_http_client() -> httpx.AsyncClient:
@@ -57,21 +75,48 @@ async def close_http_client():
             _http_client = None
 
 
-def _update_token_cache(data: dict) -> str:
-    """Update the token cache with new token data."""
-    global _token_cache
-    _token_cache["access_token"] = data["access_token"]
-    _token_cache["refresh_token"] = data.get("refresh_token")
-    expires_in = data.get("expires_in", 3600)
-    # Cache with 5 min buffer before expiration
-    _token_cache["expires_at"] = datetime.now() + timedelta(seconds=expires_in - 300)
-    return _token_cache["access_token"]
+def _token_valid_for(seconds: int) -> bool:
+    """True if the local token copy is still valid for `seconds` seconds."""
+    expires_at = _token_cache["expires_at"]
+    return bool(
+        _token_cache["access_token"]
+        and expires_at
+        and expires_at - datetime.now(timezone.utc) > timedelta(seconds=seconds)
+    )
+
 
+def _cache_token_row(row) -> None:
+    """Copy the shared token row into the local cache."""
+    expires_at = row.expires_at
+    if expires_at is not None and expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)  # Stored as naive UTC
+    _token_cache["access_token"] = row.access_token
+    _token_cache["refresh_token"] = row.refresh_token
+    _token_cache["expires_at"] = expires_at
 
-async def _request_token_with_credentials() -> str:
-    """Request a new token using client credentials grant."""
+
+async def _request_token(refresh_token: Optional[str]) -> dict:
+    """
+    Get a new token from the OAuth endpoint: refresh_token grant when
+    possible, client credentials otherwise.
+    """
     token_url = f"{settings.HELLOASSO_URL_TOKEN}/token"
     client = await get_http_client()
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+
+    if refresh_token:
+        response = await client.post(
+            token_url,
+            data={
+                "grant_type": "refresh_token",
+                "client_id": settings.HELLOASSO_CLIENT_ID,
+                "refresh_token": refresh_token,
+            },
+            headers=headers
+        )
+        if response.status_code == 200:
+            return response.json()
+        print(f"[HELLOASSO] Token refresh failed ({response.status_code}), using client credentials")
 
     response = await client.post(
         token_url,
@@ -80,66 +125,153 @@ async def _request_token_with_credentials() -> str:
             "client_id": settings.HELLOASSO_CLIENT_ID,
             "client_secret": settings.HELLOASSO_CLIENT_SECRET,
         },
-        headers={"Content-Type": "application/x-www-form-urlencoded"}
+        headers=headers
     )
 
     if response.status_code != 200:
         raise Exception(f"HelloAsso auth failed: {response.status_code} - {response.text}")
 
-    return _update_token_cache(response.json())
-
-
-async def _refresh_access_token() -> str:
-    """Refresh the access token using the refresh token."""
-    global _token_cache
-    token_url = f"{settings.HELLOASSO_URL_TOKEN}/token"
-    client = await get_http_client()
+    return response.json()
 
-    response = await client.post(
-        token_url,
-        data={
-            "grant_type": "refresh_token",
-            "client_id": settings.HELLOASSO_CLIENT_ID,
-            "refresh_token": _token_cache["refresh_token"],
-        },
-        headers={"Content-Type": "application/x-www-form-urlencoded"}
-    )
 
-    if response.status_code != 200:
-        # Clear invalid refresh token
-        _token_cache["refresh_token"] = None
-        raise Exception(f"HelloAsso refresh failed: {response.status_code}")
+async def _renew_shared_token(min_validity: int) -> None:
+    """
+    Make sure the shared token is valid for `min_validity` more seconds,
+    renewing it if needed, and copy it locally. Call with _token_lock held.
+
+    Only one worker renews at a time: it claims a lease on the
+    helloasso_tokens row (short committed UPDATE), calls the OAuth endpoint
+    without holding any connection or row lock, then writes the token back.
+    The other workers poll the row until the new token is there, or take
+    over once the lease has expired (renewing worker killed mid-call).
+    """
+    from sqlalchemy import or_, select, update
+    from sqlalchemy.dialects.postgresql import insert
+    from src.db.session import AsyncSessionLocal
+    from src.payments.models import HelloAssoToken
+
+    _token_stats["shared_checks"] += 1
+    while True:
+        now = datetime.now(timezone.utc)
+        lease_until = now + timedelta(seconds=TOKEN_RENEWAL_LEASE)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                insert(HelloAssoToken).values(id=HelloAssoToken.SINGLETON_ID).on_conflict_do_nothing()
+            )
+            row = (await db.execute(
+                select(HelloAssoToken).where(HelloAssoToken.id == HelloAssoToken.SINGLETON_ID)
+            )).scalars().one()
+            if row.access_token and row.expires_at:
+                _cache_token_row(row)
+                if _token_valid_for(min_validity):
+                    await db.commit()
+                    return  # Renewed by another worker
+
+            # Claim only if still expiring and nobody holds a live lease
+            claimed = (await db.execute(
+                update(HelloAssoToken)
+                .where(
+                    HelloAssoToken.id == HelloAssoToken.SINGLETON_ID,
+                    or_(HelloAssoToken.renewal_lease_until.is_(None), HelloAssoToken.renewal_lease_until < now),
+                    or_(
+                        HelloAssoToken.access_token.is_(None),
+                        HelloAssoToken.expires_at.is_(None),
+                        HelloAssoToken.expires_at < now + timedelta(seconds=min_validity),
+                    ),
+                )
+                .values(renewal_lease_until=lease_until)
+                .returning(HelloAssoToken.refresh_token)
+                .execution_options(synchronize_session=False)
+            )).first()
+            await db.commit()
+
+        if claimed is not None:
+            break
+        _token_stats["lease_waits"] += 1
+        await asyncio.sleep(TOKEN_LEASE_POLL_INTERVAL)
+
+    try:
+        data = await _request_token(claimed.refresh_token)
+    except BaseException:
+        # Hand the renewal over to the next worker right away
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(HelloAssoToken)
+                .where(HelloAssoToken.id == HelloAssoToken.SINGLETON_ID, HelloAssoToken.renewal_lease_until == lease_until)
+                .values(renewal_lease_until=None)
+            )
+            await db.commit()
+        raise
+
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=data.get("expires_in", 1800))
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(HelloAssoToken)
+            .where(HelloAssoToken.id == HelloAssoToken.SINGLETON_ID)
+            .values(
+                access_token=data["access_token"],
+                refresh_token=data.get("refresh_token"),
+                expires_at=expires_at,
+                updated_at=now,
+                renewal_lease_until=None,
+            )
+        )
+        await db.commit()
 
-    return _update_token_cache(response.json())
+    _token_cache["access_token"] = data["access_token"]
+    _token_cache["refresh_token"] = data.get("refresh_token")
+    _token_cache["expires_at"] = expires_at
+    _token_stats["refreshes"] += 1
+    print(f"[HELLOASSO] Access token renewed (expires at {expires_at.isoformat()})")
 
 
 async def get_access_token() -> str:
     """
     Get a valid HelloAsso access token.
 
-    Uses cached token if valid, otherwise:
-    1. Tries to refresh using refresh_token
-    2. Falls back to client_credentials if refresh fails
-
-    Thread-safe with asyncio.Lock to prevent race conditions.
+    Uses the local copy while valid. Otherwise reads the token shared by all
+    workers, renewing it only if nobody did (see _renew_shared_token). The
+    background task renews it TOKEN_REFRESH_MARGIN seconds before expiry,
+    so requests normally never wait on the OAuth endpoint.
     """
-    global _token_cache
+    if _token_valid_for(TOKEN_MIN_VALIDITY):
+        _token_stats["local_hits"] += 1
+        return _token_cache["access_token"]
 
     async with _token_lock:
-        # Check if we have a valid cached token
-        if _token_cache["access_token"] and _token_cache["expires_at"]:
-            if datetime.now() < _token_cache["expires_at"]:
-                return _token_cache["access_token"]
+        if not _token_valid_for(TOKEN_MIN_VALIDITY):
+            await _renew_shared_token(TOKEN_MIN_VALIDITY)
+        return _token_cache["access_token"]
+
+
+async def refresh_token_task():
+    """Background task renewing the shared token ahead of its expiry."""
+    if not settings.HELLOASSO_CLIENT_ID:
+        print("[HELLOASSO] No client id configured, token refresh task disabled")
+        return
 
-        # Try refresh token first if available
-        if _token_cache["refresh_token"]:
-            try:
-                return await _refresh_access_token()
-            except Exception:
-                pass  # Fall back to client_credentials
+    print(f"[HELLOASSO] Token refresh task started (margin: {TOKEN_REFRESH_MARGIN}s)")
+    while True:
+        try:
+            if not _token_valid_for(TOKEN_REFRESH_MARGIN):
+                async with _token_lock:
+                    if not _token_valid_for(TOKEN_REFRESH_MARGIN):
+                        await _renew_shared_token(TOKEN_REFRESH_MARGIN)
+        except Exception as e:
+            _token_stats["refresh_errors"] += 1
+            print(f"[HELLOASSO] Token refresh error: {e}")
+
+        await asyncio.sleep(TOKEN_REFRESH_CHECK_INTERVAL)
 
-        # Request new token with client credentials
-        return await _request_token_with_credentials()
+
+def get_token_stats() -> Dict[str, Any]:
+    """Token cache counters (for monitoring)."""
+    expires_at = _token_cache["expires_at"]
+    return {
+        **_token_stats,
+        "expires_in_seconds": int((expires_at - datetime.now(timezone.utc)).total_seconds()) if expires_at else None,
+    }
 
 
 async def _request_with_retry(
@@ -278,16 +410,82 @@ async def create_checkout_intent(
     }
 
 
-async def get_checkout_intent(checkout_intent_id: str) -> Dict[str, Any]:
+async def get_checkout_intent(checkout_intent_id: str, fresh: bool = False) -> Dict[str, Any]:
     """
     Get the status of a checkout intent and associated order/payment info.
 
+    Concurrent calls for the same intent share one HelloAsso request. A
+    completed intent (with an order) is cached for good, a pending one for
+    INTENT_PENDING_TTL seconds. Errors are not cached.
+
     Args:
         checkout_intent_id: The ID of the checkout intent
+        fresh: Skip cached pending answers and in-flight requests (e.g. on
+            a payment notification, which means the status just changed)
 
     Returns:
         Dict with checkout intent details, order and payment info if completed
     """
+    cached = _intent_cache.get(checkout_intent_id)
+    if cached is not None:
+        expires_at, result = cached
+        if expires_at is None or (not fresh and time.monotonic() < expires_at):
+            _intent_stats["hits"] += 1
+            return result
+
+    task = _intent_inflight.get(checkout_intent_id)
+    if task is not None and not fresh:
+        _intent_stats["coalesced"] += 1
+    else:
+        _intent_stats["bypassed" if fresh else "misses"] += 1
+        task = asyncio.create_task(_load_checkout_intent(checkout_intent_id))
+        # Retrieve the exception even if every caller went away
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        _intent_inflight[checkout_intent_id] = task
+
+    # Shielded: a caller timing out doesn't cancel the request for the others
+    return await asyncio.shield(task)
+
+
+async def _load_checkout_intent(checkout_intent_id: str) -> Dict[str, Any]:
+    try:
+        result = await _fetch_checkout_intent(checkout_intent_id)
+        _store_checkout_intent(checkout_intent_id, result)
+        return result
+    finally:
+        if _intent_inflight.get(checkout_intent_id) is asyncio.current_task():
+            del _intent_inflight[checkout_intent_id]
+
+
+def _store_checkout_intent(checkout_intent_id: str, result: Dict[str, Any]) -> None:
+    if len(_intent_cache) >= INTENT_CACHE_MAX_ENTRIES:
+        # Drop the pending answers (expired or not) before growing further
+        for key in [k for k, (expires_at, _) in _intent_cache.items() if expires_at is not None]:
+            del _intent_cache[key]
+        if len(_intent_cache) >= INTENT_CACHE_MAX_ENTRIES:
+            return
+
+    current = _intent_cache.get(checkout_intent_id)
+    if current is not None and current[0] is None:
+        return  # Already known as completed
+    expires_at = None if result.get("order") else time.monotonic() + INTENT_PENDING_TTL
+    _intent_cache[checkout_intent_id] = (expires_at, result)
+
+
+def get_intent_cache_stats() -> Dict[str, Any]:
+    """Checkout intent lookup counters (for monitoring)."""
+    completed = sum(1 for expires_at, _ in _intent_cache.values() if expires_at is None)
+    return {
+        **_intent_stats,
+        "in_flight": len(_intent_inflight),
+        "cached_completed": completed,
+        "cached_pending": len(_intent_cache) - completed,
+        "pending_ttl_seconds": INTENT_PENDING_TTL,
+    }
+
+
+async def _fetch_checkout_intent(checkout_intent_id: str) -> Dict[str, Any]:
+    """Query HelloAsso for a checkout intent (no cache)."""
     access_token = await get_access_token()
 
     org_slug = settings.HELLOASSO_ORGANIZATION_SLUG
@@ -308,3 +506,52 @@ async def get_checkout_intent(checkout_intent_id: str) -> Dict[str, Any]:
         raise Exception(f"HelloAsso get intent failed: {response.status_code} - {response.text}")
 
     return response.json()
+
+
+async def list_orders(
+    from_date: Optional[datetime] = None,
+    continuation_token: Optional[str] = None,
+    page_size: int = ORDERS_PAGE_SIZE
+) -> Dict[str, Any]:
+    """
+    Get one page of the organization's orders, oldest first.
+
+    Args:
+        from_date: Only orders made at or after this date
+        continuation_token: Token of the previous page's pagination
+        page_size: Orders per page (max 100)
+
+    Returns:
+        Dict with 'data' (orders, with payments) and 'pagination'
+        (including the 'continuationToken' of the next page)
+    """
+    access_token = await get_access_token()
+
+    org_slug = settings.HELLOASSO_ORGANIZATION_SLUG
+    if not org_slug:
+        raise Exception("HELLOASSO_ORGANIZATION_SLUG is not configured")
+
+    url = f"{settings.HELLOASSO_API}/organizations/{org_slug}/orders"
+    params = {
+        "pageSize": page_size,
+        "sortOrder": "Asc",
+        "withDetails": "true",
+    }
+    if from_date:
+        params["from"] = from_date.astimezone(timezone.utc).isoformat()
+    if continuation_token:
+        params["continuationToken"] = continuation_token
+
+    response = await _request_with_retry(
+        "GET",
+        url,
+        params=params,
+        headers={
+            "Authorization": f"Bearer {access_token}"
+        }
+    )
+
+    if response.status_code != 200:
+        raise Exception(f"HelloAsso list orders failed: {response.status_code} - {response.text}")
+
+    return response.json()
@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime, timezone
+from src.db.base import Base
+
+
+class PaymentNotification(Base):
+    """HelloAsso notification already processed (deduplication of redeliveries)."""
+    __tablename__ = "payment_notifications"
+
+    event_id = Column(String, primary_key=True)  # eventType:data.id[:state]
+    event_type = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=True)
+    received_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class HelloAssoToken(Base):
+    """HelloAsso OAuth token shared by all worker processes (single row)."""
+    __tablename__ = "helloasso_tokens"
+
+    SINGLETON_ID = 1
+
+    id = Column(Integer, primary_key=True)
+    access_token = Column(String, nullable=True)
+    refresh_token = Column(String, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    renewal_lease_until = Column(DateTime, nullable=True)  # Worker renewing the token until then (NULL: nobody)
+
+
+class SyncCheckpoint(Base):
+    """High-water mark of an incremental sync with an external API."""
+    __tablename__ = "sync_checkpoints"
+
+    name = Column(String, primary_key=True)  # e.g. "helloasso_orders"
+    high_water_mark = Column(DateTime, nullable=True)  # Latest item date already processed
+    updated_at = Column(DateTime, nullable=True)
@@ -0,0 +1,233 @@
+"""
+Bulk reconciliation of pending payments against the HelloAsso orders listing.
+
+Instead of one checkout intent lookup per pending user, pages through the
+organization's orders made since the last checkpoint (one call per 100
+orders), matches the paid ones to users in bulk (reservation_id metadata
+or checkout intent id) and completes them through complete_payment(),
+which is idempotent.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# Checkpoint row (sync_checkpoints.name) holding the high-water mark
+RECONCILIATION_CHECKPOINT = "helloasso_orders"
+# Interval between two scheduled reconciliations (in seconds)
+RECONCILIATION_INTERVAL = 900
+# Orders re-read before the high-water mark (orders registered late by HelloAsso)
+RECONCILIATION_OVERLAP = timedelta(minutes=10)
+# Safety cap on the pages read in one run
+RECONCILIATION_MAX_PAGES = 200
+
+# One run at a time per process (scheduled job vs admin endpoint)
+_reconcile_lock = asyncio.Lock()
+
+_reconciliation_stats = {
+    "runs": 0,
+    "total_completed": 0,
+    "errors": 0,
+    "last_run": None,
+}
+
+
+def _order_is_paid(order: dict) -> bool:
+    return any(payment.get("state") == "Authorized" for payment in order.get("payments") or [])
+
+
+def _order_reservation_id(order: dict) -> Optional[int]:
+    value = (order.get("metadata") or {}).get("reservation_id")
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _order_checkout_id(order: dict) -> Optional[str]:
+    value = order.get("checkoutIntentId")
+    return str(value) if value is not None else None
+
+
+def _order_date(order: dict) -> Optional[datetime]:
+    value = order.get("date") or (order.get("meta") or {}).get("createdAt")
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def _complete_paid_orders(orders: list[dict]) -> tuple[int, int]:
+    """
+    Complete the pending users matching the paid orders of one page
+    (one query for the whole page). Returns (matched, completed).
+    """
+    from sqlalchemy import or_, select
+    from src.db.session import AsyncSessionLocal
+    from src.users.models import User
+    from src.payments.router import complete_payment
+
+    paid = [order for order in orders if _order_is_paid(order)]
+    reservation_ids = {rid for order in paid if (rid := _order_reservation_id(order)) is not None}
+    checkout_ids = {cid for order in paid if (cid := _order_checkout_id(order))}
+    if not reservation_ids and not checkout_ids:
+        return 0, 0
+
+    conditions = []
+    if reservation_ids:
+        conditions.append(User.id.in_(reservation_ids))
+    if checkout_ids:
+        conditions.append(User.payment_intent_id.in_(checkout_ids))
+
+    matched = completed = 0
+    async with AsyncSessionLocal() as db:
+        users = (await db.execute(
+            select(User).where(User.payment_status == "pending", or_(*conditions))
+        )).scalars().all()
+        by_id = {user.id: user for user in users}
+        by_checkout = {user.payment_intent_id: user for user in users if user.payment_intent_id}
+
+        for order in paid:
+            checkout_id = _order_checkout_id(order)
+            user = by_checkout.get(checkout_id) or by_id.get(_order_reservation_id(order))
+            checkout_intent_id = checkout_id or (user.payment_intent_id if user else None)
+            if user is None or not checkout_intent_id:
+                continue
+
+            matched += 1
+            if await complete_payment(user, checkout_intent_id, db):
+                completed += 1
+                print(f"[RECONCILE] Payment completed for user {user.id} (order {order.get('id')})")
+
+    return matched, completed
+
+
+async def _save_high_water_mark(high_water_mark: datetime) -> None:
+    """Store the checkpoint (never moves backwards, runs can overlap across workers)."""
+    from sqlalchemy import func
+    from sqlalchemy.dialects.postgresql import insert
+    from src.db.session import AsyncSessionLocal
+    from src.payments.models import SyncCheckpoint
+
+    now = datetime.now(timezone.utc)
+    stmt = insert(SyncCheckpoint).values(
+        name=RECONCILIATION_CHECKPOINT,
+        high_water_mark=high_water_mark,
+        updated_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SyncCheckpoint.name],
+        set_={
+            "high_water_mark": func.greatest(SyncCheckpoint.high_water_mark, stmt.excluded.high_water_mark),
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    async with AsyncSessionLocal() as db:
+        await db.execute(stmt)
+        await db.commit()
+
+
+async def reconcile_orders(full: bool = False) -> dict:
+    """
+    Page through the HelloAsso orders and complete the matching pending payments.
+
+    Args:
+        full: Ignore the checkpoint and read every order of the organization
+
+    Returns:
+        Run metrics (pages, orders, matched, completed, high-water mark, duration)
+    """
+    from src.db.session import AsyncSessionLocal
+    from src.payments import helloasso_service
+    from src.payments.models import SyncCheckpoint
+
+    async with _reconcile_lock:
+        started = time.monotonic()
+
+        from_date = None
+        if not full:
+            async with AsyncSessionLocal() as db:
+                checkpoint = await db.get(SyncCheckpoint, RECONCILIATION_CHECKPOINT)
+                if checkpoint and checkpoint.high_water_mark:
+                    # Stored as naive UTC
+                    from_date = checkpoint.high_water_mark.replace(tzinfo=timezone.utc) - RECONCILIATION_OVERLAP
+
+        pages = orders_seen = matched = completed = 0
+        high_water_mark = None
+        continuation_token = None
+        try:
+            while pages < RECONCILIATION_MAX_PAGES:
+                page = await helloasso_service.list_orders(
+                    from_date=from_date,
+                    continuation_token=continuation_token,
+                )
+                pages += 1
+                orders = page.get("data") or []
+                if not orders:
+                    break
+
+                orders_seen += len(orders)
+                page_matched, page_completed = await _complete_paid_orders(orders)
+                matched += page_matched
+                completed += page_completed
+
+                # Orders come oldest first: the checkpoint advances page by page
+                dates = [d for d in map(_order_date, orders) if d is not None]
+                if dates:
+                    high_water_mark = max([*dates, high_water_mark] if high_water_mark else dates)
+                    await _save_high_water_mark(high_water_mark)
+
+                continuation_token = (page.get("pagination") or {}).get("continuationToken")
+                if not continuation_token or len(orders) < helloasso_service.ORDERS_PAGE_SIZE:
+                    break
+        except Exception:
+            _reconciliation_stats["errors"] += 1
+            raise
+        finally:
+            metrics = {
+                "full": full,
+                "from": from_date.isoformat() if from_date else None,
+                "pages": pages,
+                "orders": orders_seen,
+                "matched": matched,
+                "completed": completed,
+                "high_water_mark": high_water_mark.isoformat() if high_water_mark else None,
+                "duration_seconds": round(time.monotonic() - started, 3),
+            }
+            _reconciliation_stats["runs"] += 1
+            _reconciliation_stats["total_completed"] += completed
+            _reconciliation_stats["last_run"] = metrics
+
+        print(
+            f"[RECONCILE] {orders_seen} orders in {pages} pages, {matched} matched, "
+            f"{completed} completed in {metrics['duration_seconds']}s"
+        )
+        return metrics
+
+
+def get_reconciliation_stats() -> dict:
+    """Reconciliation counters (for monitoring)."""
+    return {
+        "interval_seconds": RECONCILIATION_INTERVAL,
+        **_reconciliation_stats,
+    }
+
+
+async def reconcile_orders_task():
+    """Background task running an incremental reconciliation periodically."""
+    from src.core.config import settings
+
+    if not settings.HELLOASSO_CLIENT_ID:
+        print("[RECONCILE] No HelloAsso client id configured, reconciliation task disabled")
+        return
+
+    print(f"[RECONCILE] Reconciliation task started (interval: {RECONCILIATION_INTERVAL}s)")
+    while True:
+        await asyncio.sleep(RECONCILIATION_INTERVAL)
+        try:
+            await reconcile_orders()
+        except Exception as e:
+            print(f"[RECONCILE] Reconciliation error: {e}")
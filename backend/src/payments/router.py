@@ -3,11 +3,13 @@ Payment Router - HelloAsso Checkout endpoints
 
 Features:
 - Race condition protection for payment completion
-- Background email sending to avoid blocking responses
+- Confirmation emails queued in the outbox (src/outbox.py)
 - Idempotent payment completion
+- HelloAsso notifications (webhook) as the primary completion path
 """
-import asyncio
-from fastapi import APIRouter, HTTPException, Request
+import hashlib
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from src.payments.schemas import (
     CheckoutRequest,
     CheckoutResponse,
@@ -18,158 +20,255 @@ from src.payments.schemas import (
 from src.payments import helloasso_service
 from src.core.config import settings
 from src.auth.service import is_user_blacklisted, is_ordering_open
-from sqlalchemy.orm import Session
+from src.core.idempotency import idempotency_store
+from src.outbox import enqueue_email, outbox_sender
+from src.reservations.availability import sync_slot_hold
+from src.reservations.router import get_current_user_from_cookie
+from src.db.session import get_async_db, release_connection
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from datetime import datetime, timezone
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 import secrets
 import traceback
 
 router = APIRouter(prefix="/payments", tags=["Payments"])
 
-# Lock for payment completion to prevent race conditions
-# Each entry stores (lock, last_used_timestamp)
-_payment_locks: dict[int, tuple[asyncio.Lock, float]] = {}
-_locks_lock = asyncio.Lock()
-_LOCK_TTL_SECONDS = 3600  # 1 hour
+# A pending checkout younger than this is reused instead of creating a new one
+CHECKOUT_REUSE_WINDOW = timedelta(minutes=15)
 
 
-async def _cleanup_old_locks():
-    """Remove locks older than TTL to prevent memory leaks."""
-    import time
-    current_time = time.time()
-    to_remove = []
+async def complete_payment(user, checkout_intent_id: str, db: AsyncSession) -> bool:
+    """
+    Mark a payment as completed and queue the confirmation email (outbox).
+    Returns True if this was a new completion, False if already completed.
 
-    for user_id, (lock, last_used) in _payment_locks.items():
-        if current_time - last_used > _LOCK_TTL_SECONDS and not lock.locked():
-            to_remove.append(user_id)
+    This function is used by:
+    - /status/{checkout_intent_id} endpoint (frontend polling)
+    - /verify/{checkout_intent_id} endpoint (legacy)
+    - Background task (periodic checking)
 
-    for user_id in to_remove:
-        del _payment_locks[user_id]
+    Serialized through the database: the user row is locked (SELECT ... FOR
+    UPDATE) until the commit, so concurrent completions from any worker
+    process wait for each other and only the first one sees "pending".
+    """
+    from src.users.models import User
 
-    if to_remove:
-        print(f"[DEBUG] Cleaned up {len(to_remove)} expired payment locks")
+    try:
+        # Row lock + reload: the status checked below is the committed one
+        locked = (await db.execute(
+            select(User)
+            .where(User.id == user.id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )).scalars().first()
+
+        if locked is None or locked.payment_status == "completed":
+            print(f"[DEBUG] complete_payment: user {user.id} already completed, skipping")
+            # Release the row lock (commit: a rollback would expire the
+            # caller's loaded objects)
+            await db.commit()
+            return False  # Already done
 
+        print(f"[DEBUG] complete_payment: completing payment for user {user.id}")
 
-async def _get_user_lock(user_id: int) -> asyncio.Lock:
-    """Get or create a lock for a specific user."""
-    import time
-    async with _locks_lock:
-        # Cleanup old locks periodically (every time we access locks)
-        if len(_payment_locks) > 100:  # Only cleanup if we have many locks
-            await _cleanup_old_locks()
+        locked.payment_status = "completed"
+        locked.payment_intent_id = checkout_intent_id
+        locked.payment_date = datetime.now(timezone.utc)
+        locked.payment_next_check_at = None
 
-        current_time = time.time()
-        if user_id not in _payment_locks:
-            _payment_locks[user_id] = (asyncio.Lock(), current_time)
-        else:
-            # Update last used time
-            lock, _ = _payment_locks[user_id]
-            _payment_locks[user_id] = (lock, current_time)
-        return _payment_locks[user_id][0]
+        # Payé après expiration: la place a pu être rendue par le balayage,
+        # on la reprend (sans contrôle de capacité, la commande est payée)
+        # Ordre des verrous: users puis slot_capacity (le balayage des
+        # réservations expirées saute les users verrouillés)
+        await db.run_sync(sync_slot_hold, locked)
 
+        if not locked.status_token:
+            locked.status_token = secrets.token_urlsafe(32)
 
-async def _send_confirmation_email_background(user_id: int, user_email: str):
-    """
-    Send confirmation email in background without blocking the response.
+        # Same transaction: the email is sent if and only if the payment is recorded
+        enqueue_email(db, "order_confirmation", locked.email, user_id=locked.id)
 
-    Args:
-        user_id: User ID to look up fresh data
-        user_email: Email for logging purposes
-    """
-    from src.db.session import SessionLocal
-    from src.users.models import User
-    from src.mail import send_order_confirmation
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
 
-    try:
-        print(f"[BACKGROUND_EMAIL] Sending confirmation to {user_email}")
+    outbox_sender.wake()
 
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.id == user_id).first()
-            if user and user.payment_status == "completed":
-                email_sent = await send_order_confirmation(user)
-                if email_sent:
-                    user.email_delivery_status = "sent"
-                    print(f"[BACKGROUND_EMAIL] Email sent successfully to {user_email}")
-                else:
-                    user.email_delivery_status = "failed"
-                    print(f"[BACKGROUND_EMAIL] Email failed for {user_email}")
-                db.commit()  # Save email delivery status
-        finally:
-            db.close()
+    return True
 
-    except Exception as e:
-        # Try to update delivery status even on exception
-        try:
-            db = SessionLocal()
-            user = db.query(User).filter(User.id == user_id).first()
-            if user:
-                user.email_delivery_status = "failed"
-                db.commit()
-            db.close()
-        except Exception:
-            pass
-        print(f"[BACKGROUND_EMAIL] Exception sending email to {user_email}: {e}")
-        traceback.print_exc()
 
+def validate_payer_names(payer_first_name: str, payer_last_name: str) -> None:
+    """HelloAsso requires a first and last name of at least 2 characters."""
+    if not payer_first_name or len(payer_first_name) < 2:
+        raise HTTPException(
+            status_code=400,
+            detail="Le prénom est requis et doit contenir au moins 2 caractères"
+        )
+    if not payer_last_name or len(payer_last_name) < 2:
+        raise HTTPException(
+            status_code=400,
+            detail="Le nom est requis et doit contenir au moins 2 caractères"
+        )
 
-async def complete_payment(user, checkout_intent_id: str, db: Session) -> bool:
-    """
-    Mark a payment as completed and send confirmation email in background.
-    Returns True if this was a new completion, False if already completed.
 
-    This function is used by:
-    - /status/{checkout_intent_id} endpoint (frontend polling)
-    - /verify/{checkout_intent_id} endpoint (legacy)
-    - Background task (periodic checking)
+async def start_checkout(
+    user,
+    db: AsyncSession,
+    payer_email: str,
+    payer_first_name: str,
+    payer_last_name: str,
+    metadata: Optional[dict] = None
+) -> CheckoutResponse:
+    """
+    Reuse the user's recent pending checkout or create a new HelloAsso one.
 
-    Uses per-user locking to prevent race conditions.
+    The caller has loaded and validated the user (ordering open, blacklist).
+    Used by /payments/checkout and /reservations/checkout.
     """
-    # Get user-specific lock to prevent concurrent updates
-    user_lock = await _get_user_lock(user.id)
+    from src.payments.background_tasks import schedule_payment_checks
+    from src.db.session import release_connection
 
-    async with user_lock:
-        # Re-check status inside the lock (double-checked locking pattern)
-        db.refresh(user)
+    # HelloAsso calls below can take up to 30s (retries): give the
+    # connection back to the pool first, each DB step opens a short transaction
+    await release_connection(db)
 
-        if user.payment_status == "completed":
-            print(f"[DEBUG] complete_payment: user {user.id} already completed, skipping")
-            return False  # Already done
+    # Check for existing recent checkout that can be reused
+    if (user.payment_intent_id and
+        user.checkout_redirect_url and
+        user.checkout_created_at and
+        user.payment_status != "completed"):
 
-        print(f"[DEBUG] complete_payment: completing payment for user {user.id}")
+        checkout_age = datetime.now(timezone.utc) - user.checkout_created_at.replace(tzinfo=timezone.utc)
 
-        user.payment_status = "completed"
-        user.payment_intent_id = checkout_intent_id
-        user.payment_date = datetime.now(timezone.utc)
+        if checkout_age < CHECKOUT_REUSE_WINDOW:
+            # Verify checkout is still pending with HelloAsso
+            try:
+                result = await helloasso_service.get_checkout_intent(user.payment_intent_id)
+            except Exception as e:
+                print(f"[DEBUG] Error checking existing checkout: {e}, creating new one")
+                result = None  # Continue to create new checkout
+
+            if result is not None and not result.get("order"):
+                # Checkout still pending, reuse it
+                print(f"[DEBUG] Reusing existing checkout {user.payment_intent_id} for user {user.id}")
+                return CheckoutResponse(
+                    redirect_url=user.checkout_redirect_url,
+                    checkout_intent_id=user.payment_intent_id
+                )
+            if result is not None:
+                # Checkout was paid: complete the payment, no new checkout
+                print(f"[DEBUG] Existing checkout {user.payment_intent_id} already paid, completing")
+                await complete_payment(user, user.payment_intent_id, db)
+                raise HTTPException(
+                    status_code=400,
+                    detail="Paiement déjà effectué"
+                )
 
-        if not user.status_token:
-            user.status_token = secrets.token_urlsafe(32)
+    # Build URLs for HelloAsso redirects (must be HTTPS!)
+    # Use HELLOASSO_REDIRECT_BASE_URL if set, otherwise fall back to FRONTEND_URL
+    redirect_base = settings.HELLOASSO_REDIRECT_BASE_URL
+    if not redirect_base:
+        redirect_base = settings.FRONTEND_URL or "http://localhost:5173"
 
-        db.commit()
-        db.refresh(user)
+    # Remove trailing slash to avoid double slashes
+    redirect_base = redirect_base.rstrip('/')
 
-    # Send confirmation email in background (outside the lock)
-    asyncio.create_task(
-        _send_confirmation_email_background(user.id, user.email)
+    # Ensure HTTPS for HelloAsso (required by their API)
+    if not redirect_base.startswith("https://"):
+        raise HTTPException(
+            status_code=400,
+            detail="HelloAsso requiert une URL HTTPS. Configure HELLOASSO_REDIRECT_BASE_URL dans .env"
+        )
+
+    return_url = f"{redirect_base}/payment/success"
+    error_url = f"{redirect_base}/payment/error"
+    back_url = f"{redirect_base}/order"
+
+    # Build metadata
+    metadata = dict(metadata or {})
+    metadata["reservation_id"] = user.id
+
+    # Create checkout intent
+    result = await helloasso_service.create_checkout_intent(
+        payer_email=payer_email,
+        payer_first_name=payer_first_name,
+        payer_last_name=payer_last_name,
+        return_url=return_url,
+        error_url=error_url,
+        back_url=back_url,
+        metadata=metadata,
+        contains_donation=False
     )
 
-    return True
+    checkout_intent_id = result["id"]
+    redirect_url = result["redirectUrl"]
+
+    # The order may have been paid meanwhile (poller, other tab)
+    await db.refresh(user)
+    if user.payment_status == "completed":
+        raise HTTPException(
+            status_code=400,
+            detail="Paiement déjà effectué"
+        )
+
+    # Store checkout details for later lookup and reuse
+    user.payment_intent_id = checkout_intent_id
+    user.checkout_redirect_url = redirect_url
+    user.checkout_created_at = datetime.now(timezone.utc)
+    schedule_payment_checks(user, user.checkout_created_at)
+
+    await db.commit()
+    print(f"[DEBUG] Stored checkout {checkout_intent_id} for user {user.id}")
+
+    return CheckoutResponse(
+        redirect_url=redirect_url,
+        checkout_intent_id=checkout_intent_id
+    )
 
 
 @router.post("/checkout", response_model=CheckoutResponse)
-async def create_checkout(request: Request, checkout_request: CheckoutRequest):
+async def create_checkout(
+    request: Request,
+    checkout_request: CheckoutRequest,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user_from_cookie)
+):
     """
     Create a HelloAsso Checkout Intent.
     Returns a redirect URL to send the user to HelloAsso payment page.
 
+    Requires the access_token cookie: only the owner of the reservation can
+    start its checkout.
     If an existing pending checkout was created recently (within 15 minutes),
     it will be reused to prevent duplicate checkouts from multiple browser tabs.
+    With an Idempotency-Key header, a replayed request gets the stored
+    response without calling HelloAsso again.
     """
-    from src.db.session import SessionLocal
-    from src.users.models import User
-    from datetime import timedelta
+    # Same answer as an unknown reservation: don't reveal which ids exist
+    if current_user.id != checkout_request.reservation_id:
+        raise HTTPException(
+            status_code=404,
+            detail="Réservation introuvable"
+        )
+    # _create_checkout uses its own session, don't hold this one's connection
+    await release_connection(db)
+
+    return await idempotency_store.run(
+        idempotency_key,
+        current_user.id,
+        "payments.checkout",
+        checkout_request,
+        lambda: _create_checkout(checkout_request),
+    )
+
 
-    CHECKOUT_REUSE_WINDOW = timedelta(minutes=15)
+async def _create_checkout(checkout_request: CheckoutRequest) -> CheckoutResponse:
+    from src.db.session import AsyncSessionLocal
+    from src.users.models import User
 
     if not is_ordering_open():
         raise HTTPException(
@@ -178,21 +277,12 @@ async def create_checkout(request: Request, checkout_request: CheckoutRequest):
         )
 
     # Validate that user has valid prenom/nom for HelloAsso
-    if not checkout_request.payer_first_name or len(checkout_request.payer_first_name) < 2:
-        raise HTTPException(
-            status_code=400,
-            detail="Le prénom est requis et doit contenir au moins 2 caractères"
-        )
-    if not checkout_request.payer_last_name or len(checkout_request.payer_last_name) < 2:
-        raise HTTPException(
-            status_code=400,
-            detail="Le nom est requis et doit contenir au moins 2 caractères"
-        )
+    validate_payer_names(checkout_request.payer_first_name, checkout_request.payer_last_name)
 
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         # Find user by reservation_id (required, no email fallback for security)
-        user = db.query(User).filter(User.id == checkout_request.reservation_id).first()
+        user = await db.get(User, checkout_request.reservation_id)
 
         if not user:
             raise HTTPException(
@@ -209,87 +299,13 @@ async def create_checkout(request: Request, checkout_request: CheckoutRequest):
 
         print(f"[DEBUG] Found user by reservation_id: {user.id}")
 
-        # Check for existing recent checkout that can be reused
-        if (user.payment_intent_id and
-            user.checkout_redirect_url and
-            user.checkout_created_at and
-            user.payment_status != "completed"):
-
-            checkout_age = datetime.now(timezone.utc) - user.checkout_created_at.replace(tzinfo=timezone.utc)
-
-            if checkout_age < CHECKOUT_REUSE_WINDOW:
-                # Verify checkout is still pending with HelloAsso
-                try:
-                    result = await helloasso_service.get_checkout_intent(user.payment_intent_id)
-                    order = result.get("order")
-
-                    if not order:
-                        # Checkout still pending, reuse it
-                        print(f"[DEBUG] Reusing existing checkout {user.payment_intent_id} for user {user.id}")
-                        return CheckoutResponse(
-                            redirect_url=user.checkout_redirect_url,
-                            checkout_intent_id=user.payment_intent_id
-                        )
-                    else:
-                        # Checkout was paid, complete the payment
-                        print(f"[DEBUG] Existing checkout {user.payment_intent_id} already paid, completing")
-                        await complete_payment(user, user.payment_intent_id, db)
-
-                except Exception as e:
-                    print(f"[DEBUG] Error checking existing checkout: {e}, creating new one")
-                    # Continue to create new checkout
-
-        # Build URLs for HelloAsso redirects (must be HTTPS!)
-        # Use HELLOASSO_REDIRECT_BASE_URL if set, otherwise fall back to FRONTEND_URL
-        redirect_base = settings.HELLOASSO_REDIRECT_BASE_URL
-        if not redirect_base:
-            redirect_base = settings.FRONTEND_URL or "http://localhost:5173"
-
-        # Remove trailing slash to avoid double slashes
-        redirect_base = redirect_base.rstrip('/')
-
-        # Ensure HTTPS for HelloAsso (required by their API)
-        if not redirect_base.startswith("https://"):
-            raise HTTPException(
-                status_code=400,
-                detail="HelloAsso requiert une URL HTTPS. Configure HELLOASSO_REDIRECT_BASE_URL dans .env"
-            )
-
-        return_url = f"{redirect_base}/payment/success"
-        error_url = f"{redirect_base}/payment/error"
-        back_url = f"{redirect_base}/order"
-
-        # Build metadata
-        metadata = checkout_request.metadata or {}
-        if checkout_request.reservation_id:
-            metadata["reservation_id"] = checkout_request.reservation_id
-
-        # Create checkout intent
-        result = await helloasso_service.create_checkout_intent(
+        return await start_checkout(
+            user,
+            db,
             payer_email=checkout_request.payer_email,
             payer_first_name=checkout_request.payer_first_name,
             payer_last_name=checkout_request.payer_last_name,
-            return_url=return_url,
-            error_url=error_url,
-            back_url=back_url,
-            metadata=metadata,
-            contains_donation=False
-        )
-
-        checkout_intent_id = result["id"]
-        redirect_url = result["redirectUrl"]
-
-        # Store checkout details for later lookup and reuse
-        user.payment_intent_id = checkout_intent_id
-        user.checkout_redirect_url = redirect_url
-        user.checkout_created_at = datetime.now(timezone.utc)
-
-        db.commit()
-        print(f"[DEBUG] Stored checkout {checkout_intent_id} for user {user.id}")
-
-        return CheckoutResponse(
-            redirect_url=redirect_url,
-            checkout_intent_id=checkout_intent_id
+            metadata=checkout_request.metadata
         )
 
     except HTTPException:
@@ -297,7 +313,7 @@ async def create_checkout(request: Request, checkout_request: CheckoutRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        db.close()
+        await db.close()
 
 
 @router.get("/status/{checkout_intent_id}", response_model=PaymentStatusResponse)
@@ -308,13 +324,15 @@ async def get_payment_status(checkout_intent_id: str):
 
     This is the primary endpoint for frontend polling after payment return.
     """
-    from src.db.session import SessionLocal
+    from src.db.session import AsyncSessionLocal, release_connection
     from src.users.models import User
 
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         # Find user by payment_intent_id (stored during checkout creation)
-        user = db.query(User).filter(User.payment_intent_id == checkout_intent_id).first()
+        user = (await db.execute(
+            select(User).where(User.payment_intent_id == checkout_intent_id)
+        )).scalars().first()
 
         if not user:
             print(f"[DEBUG] get_payment_status: no user found for intent {checkout_intent_id}")
@@ -330,7 +348,8 @@ async def get_payment_status(checkout_intent_id: str):
                 checkout_intent_id=checkout_intent_id
             )
 
-        # Query HelloAsso API for current status
+        # Query HelloAsso API for current status (connection released meanwhile)
+        await release_connection(db)
         try:
             result = await helloasso_service.get_checkout_intent(checkout_intent_id)
             print(f"[DEBUG] get_payment_status: HelloAsso result keys: {list(result.keys())}")
@@ -364,7 +383,7 @@ async def get_payment_status(checkout_intent_id: str):
             )
 
     finally:
-        db.close()
+        await db.close()
 
 
 @router.get("/verify/{checkout_intent_id}", response_model=PaymentVerifyResponse)
@@ -373,7 +392,7 @@ async def verify_payment(checkout_intent_id: str):
     Verify a payment after user returns from HelloAsso.
     Checks the checkout intent status and returns order/payment info.
     """
-    from src.db.session import SessionLocal
+    from src.db.session import AsyncSessionLocal
     from src.users.models import User
 
     try:
@@ -396,20 +415,22 @@ async def verify_payment(checkout_intent_id: str):
 
             print(f"[DEBUG] reservation_id from metadata: {res_id} (type: {type(res_id)})")
 
-            db = SessionLocal()
+            db = AsyncSessionLocal()
             try:
                 user = None
 
                 # Strategy 1: Find by reservation_id from metadata
                 if res_id:
-                    user = db.query(User).filter(User.id == int(res_id)).first()
+                    user = await db.get(User, int(res_id))
                     if user:
                         print(f"[DEBUG] User found by reservation_id: {user.id} ({user.email})")
 
                 # Strategy 2: Find by checkout_intent_id stored in payment_intent_id
                 if not user:
                     print(f"[DEBUG] Attempting to find user by checkout_intent_id: {checkout_intent_id}")
-                    user = db.query(User).filter(User.payment_intent_id == checkout_intent_id).first()
+                    user = (await db.execute(
+                        select(User).where(User.payment_intent_id == checkout_intent_id)
+                    )).scalars().first()
                     if user:
                         print(f"[DEBUG] User found by checkout_intent_id: {user.id} ({user.email})")
 
@@ -429,13 +450,13 @@ async def verify_payment(checkout_intent_id: str):
                         print(f"[DEBUG] Payment already completed for user {user.id}")
 
                     # Refresh to get latest data including status_token
-                    db.refresh(user)
+                    await db.refresh(user)
                     status_token = user.status_token
                 else:
                     print(f"[ERROR] No user found for this payment (intent: {checkout_intent_id})")
 
             finally:
-                db.close()
+                await db.close()
 
             # Payment successful
             return PaymentVerifyResponse(
@@ -461,3 +482,142 @@ async def verify_payment(checkout_intent_id: str):
             success=False,
             message=str(e)
         )
+
+
+# Compteurs des notifications HelloAsso (exposés dans /admin/metrics)
+_notification_stats = {
+    "received": 0,
+    "duplicates": 0,
+    "completed": 0,
+    "ignored": 0,
+    "rejected": 0,
+    "errors": 0,
+}
+
+
+def get_notification_stats() -> dict:
+    """HelloAsso notification counters (for monitoring)."""
+    return dict(_notification_stats)
+
+
+def _notification_event_id(event_type: str, data: dict, raw_body: bytes) -> str:
+    """
+    Stable id of a notification: HelloAsso redelivers the same payload,
+    so eventType + object id (+ payment state) identifies it.
+    """
+    object_id = data.get("id")
+    if object_id is None:
+        return f"{event_type}:sha1:{hashlib.sha1(raw_body).hexdigest()}"
+    state = data.get("state")
+    return f"{event_type}:{object_id}:{state}" if state else f"{event_type}:{object_id}"
+
+
+@router.post("/notifications")
+async def receive_notification(request: Request):
+    """
+    HelloAsso notification (webhook) endpoint: primary payment completion path.
+
+    The notification is only a hint: the payment is confirmed through the
+    HelloAsso API (checkout intent has an order) before complete_payment().
+    Redeliveries are deduplicated by event id. Any 2xx tells HelloAsso to
+    stop retrying, so only transient errors answer 5xx.
+    """
+    from src.db.session import AsyncSessionLocal, release_connection
+    from src.payments.models import PaymentNotification
+    from src.users.models import User
+
+    # URL secrète configurée côté HelloAsso (.../notifications?token=...)
+    if settings.HELLOASSO_NOTIFICATION_SECRET and not secrets.compare_digest(
+        request.query_params.get("token", ""), settings.HELLOASSO_NOTIFICATION_SECRET
+    ):
+        _notification_stats["rejected"] += 1
+        raise HTTPException(status_code=403, detail="Notification refusée")
+
+    raw_body = await request.body()
+    try:
+        payload = json.loads(raw_body)
+    except ValueError:
+        _notification_stats["rejected"] += 1
+        raise HTTPException(status_code=400, detail="Notification invalide")
+    if not isinstance(payload, dict):
+        _notification_stats["rejected"] += 1
+        raise HTTPException(status_code=400, detail="Notification invalide")
+
+    _notification_stats["received"] += 1
+    event_type = payload.get("eventType")
+    # Malformed parts (null, string, list...) are treated as absent: a 5xx
+    # would make HelloAsso redeliver the same payload forever
+    data = payload.get("data")
+    if not isinstance(data, dict):
+        data = {}
+    metadata = payload.get("metadata")
+    if not isinstance(metadata, dict):
+        metadata = {}
+
+    if event_type not in ("Order", "Payment"):
+        _notification_stats["ignored"] += 1
+        return {"status": "ignored"}
+
+    event_id = _notification_event_id(event_type, data, raw_body)
+    print(f"[NOTIFICATION] Received {event_id}")
+
+    async with AsyncSessionLocal() as db:
+        if await db.get(PaymentNotification, event_id):
+            _notification_stats["duplicates"] += 1
+            return {"status": "duplicate"}
+
+        # Checkout metadata set in create_checkout / admin checkout links
+        user = None
+        res_id = metadata.get("reservation_id")
+        if res_id is not None:
+            try:
+                user = await db.get(User, int(res_id))
+            except (TypeError, ValueError):
+                user = None
+        intent_id = data.get("checkoutIntentId")
+        if not user and intent_id:
+            user = (await db.execute(
+                select(User).where(User.payment_intent_id == str(intent_id))
+            )).scalars().first()
+
+        if not user or not user.payment_intent_id:
+            print(f"[NOTIFICATION] No pending checkout for {event_id} (reservation_id: {res_id})")
+            _notification_stats["ignored"] += 1
+            return {"status": "ignored"}
+
+        status_value = "already_completed"
+        if user.payment_status != "completed":
+            checkout_intent_id = user.payment_intent_id
+
+            # Vérification auprès de l'API HelloAsso (connexion rendue au pool)
+            await release_connection(db)
+            try:
+                result = await helloasso_service.get_checkout_intent(checkout_intent_id, fresh=True)
+            except Exception as e:
+                print(f"[NOTIFICATION] HelloAsso check failed for {event_id}: {e}")
+                _notification_stats["errors"] += 1
+                # 5xx: HelloAsso will deliver it again
+                raise HTTPException(status_code=502, detail="Vérification du paiement impossible")
+
+            if not result.get("order"):
+                # Payment not (yet) validated: not recorded, a later
+                # notification for the same order can still complete it
+                print(f"[NOTIFICATION] {event_id}: checkout {checkout_intent_id} has no order yet")
+                _notification_stats["ignored"] += 1
+                return {"status": "pending"}
+
+            if await complete_payment(user, checkout_intent_id, db):
+                print(f"[NOTIFICATION] Payment completed for user {user.id} ({event_id})")
+                _notification_stats["completed"] += 1
+                status_value = "completed"
+
+        db.add(PaymentNotification(event_id=event_id, event_type=event_type, user_id=user.id))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Same notification processed concurrently
+            await db.rollback()
+            _notification_stats["duplicates"] += 1
+            return {"status": "duplicate"}
+
+    return {"status": status_value}
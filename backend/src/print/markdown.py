@@ -119,18 +119,9 @@ def generate_pdf_for_all_clients(reservations: List[Any]) -> bytes:
     pdf = TicketPDF(orientation='P', unit='mm', format='A4')
     pdf.set_auto_page_break(auto=False)
 
-    # Helper to resolve item name/price
-    from src.menu.utils import load_menu_data
-    menu_data = load_menu_data()
-
-    def get_item_details(item_id):
-        if not item_id:
-            return None
-        for cat in ["menus", "boissons", "extras"]:
-            for item in menu_data.get(cat, []):
-                if item["id"] == item_id:
-                    return item
-        return None
+    # Resolve items through the indexed catalog (one lookup per item)
+    from src.menu.utils import get_menu_catalog
+    catalog = get_menu_catalog()
 
     # Track Y position for each column
     col_y = [MARGIN, MARGIN]  # [left_col_y, right_col_y]
@@ -138,8 +129,8 @@ def generate_pdf_for_all_clients(reservations: List[Any]) -> bytes:
 
     for user in reservations:
         # Préparation des produits
-        menu_details = get_item_details(user.menu_id)
-        boisson_details = get_item_details(user.boisson_id)
+        menu_details = catalog.get_item(user.menu_id)
+        boisson_details = catalog.get_item(user.boisson_id)
 
         produits = []
         if menu_details:
@@ -155,15 +146,12 @@ def generate_pdf_for_all_clients(reservations: List[Any]) -> bytes:
                 "type": "boisson"
             })
         # Ajouter tous les extras
-        if user.bonus_ids:
-            for bonus_id in user.bonus_ids:
-                bonus_details = get_item_details(bonus_id)
-                if bonus_details:
-                    produits.append({
-                        "nom": bonus_details["name"],
-                        "prix": bonus_details.get("price", 0),
-                        "type": "extra"
-                    })
+        for bonus_details in catalog.get_items(user.bonus_ids):
+            produits.append({
+                "nom": bonus_details["name"],
+                "prix": bonus_details.get("price", 0),
+                "type": "extra"
+            })
 
         # Adresse / Logement
         if user.habite_residence:
@@ -10,6 +10,7 @@ from ..users.router import get_current_user_from_cookie
 from ..users.models import User
 from ..core.exceptions import AdminException
 from ..db.session import get_db
+from ..menu.utils import get_menu_catalog
 
 router = APIRouter(tags=["print"])
 
@@ -86,31 +87,17 @@ def get_print_summary(
         )
     ).all()
     
-    # Helper to resolve item name
-    from src.menu.utils import load_menu_data
-    menu_data = load_menu_data()
-    
-    def get_item_name(item_id):
-        if not item_id: return None
-        for cat in ["menus", "boissons", "extras"]:
-            for item in menu_data.get(cat, []):
-                if item["id"] == item_id:
-                    return item["name"]
-        return None
+    # Résolution des noms via le catalogue indexé (O(1) par item)
+    catalog = get_menu_catalog()
 
     # Compter les types de commandes
     combos_dict = {}
     for res in reservations:
-        menu_name = get_item_name(res.menu_id) or "Aucun"
-        boisson_name = get_item_name(res.boisson_id) or "Aucune"
+        menu_name = catalog.get_item_name(res.menu_id) or "Aucun"
+        boisson_name = catalog.get_item_name(res.boisson_id) or "Aucune"
 
         # Récupérer tous les extras
-        extras_names = []
-        if res.bonus_ids:
-            for bonus_id in res.bonus_ids:
-                name = get_item_name(bonus_id)
-                if name:
-                    extras_names.append(name)
+        extras_names = [item["name"] for item in catalog.get_items(res.bonus_ids)]
 
         combo_key = (menu_name, boisson_name, tuple(sorted(extras_names)))
         combos_dict[combo_key] = combos_dict.get(combo_key, 0) + 1
@@ -174,38 +161,21 @@ def get_orders_list(
     offset = (page - 1) * per_page
     reservations = query.order_by(User.heure_reservation).offset(offset).limit(per_page).all()
 
-    # Define get_item_name helper if not already defined in this scope? 
-    # It's better to redefine or import it properly. Since we are in a function, let's just do it again cleanly.
-    
-    from src.menu.utils import load_menu_data
-    menu_data_list = load_menu_data()
-    
-    def get_name(item_id):
-        if not item_id: return None
-        for cat in ["menus", "boissons", "extras"]:
-            for item in menu_data_list.get(cat, []):
-                if item["id"] == item_id:
-                    return item["name"]
-        return None
+    catalog = get_menu_catalog()
 
     # Build response
     orders = []
     for res in reservations:
         # Récupérer tous les extras
-        extras_names = []
-        if res.bonus_ids:
-            for bonus_id in res.bonus_ids:
-                name = get_name(bonus_id)
-                if name:
-                    extras_names.append(name)
+        extras_names = [item["name"] for item in catalog.get_items(res.bonus_ids)]
 
         orders.append(OrderItem(
             id=res.id,
             prenom=res.prenom,
             nom=res.nom,
             heure_reservation=res.heure_reservation.strftime("%H:%M") if res.heure_reservation else "",
-            menu=get_name(res.menu_id),
-            boisson=get_name(res.boisson_id),
+            menu=catalog.get_item_name(res.menu_id),
+            boisson=catalog.get_item_name(res.boisson_id),
             extras=extras_names,
             payment_status=res.payment_status or "pending",
             is_maisel=res.adresse_if_maisel is not None,
@@ -2,13 +2,29 @@
 Module de gestion des disponibilités des créneaux horaires.
 
 Optimized to use efficient database queries instead of N+1 pattern.
+
+Booking uses one counter row per slot (slot_capacity) decremented with a
+single conditional UPDATE, so concurrent bookings only contend on that row
+instead of locking every order of the slot. users.slot_held records which
+orders currently consume capacity, so releases are exact.
+
+Pending orders whose reservation_expires_at has passed stop counting at once
+for display, and the expiry sweeper (background_tasks.py) gives their place
+back to the counters in batches.
+
+Every function that changes a hold flags the session; once that session
+commits, the cached availability payload (cache.py) is invalidated.
 """
+from collections import Counter
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import time
-from typing import Dict
+from sqlalchemy import event, func, select, update, or_
+from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime, time, timezone
+from typing import Dict, Optional
 
 from src.users.models import User
+from src.reservations.models import SlotCapacity
+from src.reservations.cache import invalidate_availability_cache
 
 
 # ============================================================
@@ -32,11 +48,87 @@ TIME_SLOTS = [
     {"slot": "17:00 - 18:00", "start": time(17, 0), "end": time(18, 0)},
 ]
 
+# Statuts de paiement pour lesquels une commande occupe une place
+HOLDING_PAYMENT_STATUSES = ("completed", "pending")
+
+# Nombre max de réservations expirées libérées par transaction
+EXPIRED_HOLDS_BATCH_SIZE = 200
+
+# Compteurs des libérations de places expirées (exposés dans /admin/metrics)
+_expiry_stats = {
+    "sweeps": 0,
+    "released_total": 0,
+    "released_inline": 0,
+    "last_released": 0,
+    "last_sweep_at": None,
+}
+
+
+# Clé de Session.info: la transaction en cours modifie l'occupation des créneaux
+_SLOTS_CHANGED = "slots_changed"
+
+
+def _mark_slots_changed(db: Session) -> None:
+    """Invalidate the availability cache when this session commits."""
+    db.info[_SLOTS_CHANGED] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    # After the commit, so a reload can't cache the data being replaced
+    if session.info.pop(_SLOTS_CHANGED, False):
+        invalidate_availability_cache()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_SLOTS_CHANGED, None)
+
+
+def _not_expired(now: datetime):
+    """Filtre: la commande n'est pas une réservation en attente expirée."""
+    return or_(
+        User.payment_status != "pending",
+        User.reservation_expires_at.is_(None),
+        User.reservation_expires_at > now,
+    )
+
+
+def _expired_hold(now: datetime):
+    """Filtre: réservation en attente expirée qui occupe encore une place."""
+    return (
+        (User.payment_status == "pending")
+        & User.slot_held.is_(True)
+        & (User.reservation_expires_at < now)
+    )
+
+
+def get_held_slot_counts(db: Session) -> Dict[time, int]:
+    """
+    Count the places recorded as held (slot_held) per slot, expired or not.
+
+    This is what the slot_capacity counters must match; used by the
+    counter maintenance functions below.
+    """
+    counts = db.query(
+        User.heure_reservation,
+        func.count(User.id).label('count')
+    ).filter(
+        User.menu_id.isnot(None),
+        User.slot_held.is_(True),
+        User.heure_reservation.isnot(None)
+    ).group_by(User.heure_reservation).all()
+
+    return {row.heure_reservation: row.count for row in counts}
+
 
 def get_all_slot_counts(db: Session) -> Dict[time, int]:
     """
     Get reservation counts for all time slots in a single query.
 
+    Expired pending reservations are not counted, even before the sweeper
+    has released them.
+
     Returns:
         Dictionary mapping slot start time to reservation count
     """
@@ -46,8 +138,9 @@ def get_all_slot_counts(db: Session) -> Dict[time, int]:
         func.count(User.id).label('count')
     ).filter(
         User.menu_id.isnot(None),
-        User.payment_status.in_(["completed", "pending"]),
-        User.heure_reservation.isnot(None)
+        User.slot_held.is_(True),
+        User.heure_reservation.isnot(None),
+        _not_expired(datetime.now(timezone.utc))
     ).group_by(User.heure_reservation).all()
 
     # Convert to dictionary
@@ -56,17 +149,19 @@ def get_all_slot_counts(db: Session) -> Dict[time, int]:
 
 def count_reservations_for_slot(db: Session, slot_time: time) -> int:
     """
-    Compte le nombre de réservations confirmées pour un créneau donné.
+    Compte le nombre de réservations qui occupent un créneau donné.
 
     On compte les utilisateurs qui ont:
     - Une heure de réservation correspondant au créneau
-    - Un statut de paiement 'completed' OU 'pending' (réservation en cours)
     - Un menu_id non null (donc une commande en cours)
+    - Une place comptée dans slot_capacity (slot_held)
+    - Une réservation non expirée si le paiement est en attente
     """
     count = db.query(func.count(User.id)).filter(
         User.heure_reservation == slot_time,
         User.menu_id.isnot(None),
-        User.payment_status.in_(["completed", "pending"])
+        User.slot_held.is_(True),
+        _not_expired(datetime.now(timezone.utc))
     ).scalar()
 
     return count or 0
@@ -124,38 +219,253 @@ def is_slot_available(db: Session, slot_time: time) -> bool:
     Returns:
         True si disponible, False sinon
     """
-    current_count = count_reservations_for_slot(db, slot_time)
-    return current_count < MAX_ORDERS_PER_SLOT
+    remaining = db.execute(
+        select(SlotCapacity.remaining).where(SlotCapacity.slot_time == slot_time)
+    ).scalar()
+    return remaining is not None and remaining > 0
+
 
+def should_hold_slot(user: User) -> bool:
+    """True si la commande de l'utilisateur doit occuper une place dans son créneau."""
+    return (
+        user.menu_id is not None
+        and user.heure_reservation is not None
+        and user.payment_status in HOLDING_PAYMENT_STATUSES
+    )
 
-def reserve_slot_with_lock(db: Session, slot_time: time) -> bool:
+
+def reserve_slot(db: Session, slot_time: time, force: bool = False) -> bool:
     """
-    Atomically check slot availability with row-level locking to prevent race conditions.
+    Atomically take one place in a slot.
 
-    Uses SELECT FOR UPDATE to lock rows while checking availability, preventing
-    two concurrent requests from overbooking the same time slot.
+    Single conditional UPDATE on the slot's counter row: two concurrent
+    requests can't both take the last place, and only this one row is
+    locked (until the caller's transaction ends).
 
     Args:
-        db: Session SQLAlchemy
+        db: Session SQLAlchemy (the caller commits)
         slot_time: L'heure du créneau (ex: time(8, 0) pour 8h)
+        force: Take the place even if the slot is full (admin overbooking)
+
+    Returns:
+        True si une place a été prise, False si le créneau est complet (ou inconnu)
+    """
+    stmt = (
+        update(SlotCapacity)
+        .where(SlotCapacity.slot_time == slot_time)
+        .values(remaining=SlotCapacity.remaining - 1)
+        .returning(SlotCapacity.remaining)
+    )
+    if not force:
+        stmt = stmt.where(SlotCapacity.remaining > 0)
+
+    if db.execute(stmt).first() is None:
+        return False
+    _mark_slots_changed(db)
+    return True
+
+
+def hold_slot(db: Session, user: User, slot_time: time, force: bool = False) -> bool:
+    """
+    Take a place in `slot_time` for the user's order and mark it as held.
+
+    Any place the user already holds is released first. The caller sets
+    user.heure_reservation and commits (same transaction as the counter).
 
     Returns:
-        True si le créneau est disponible et peut être réservé, False sinon
-    """
-    from sqlalchemy import text
-
-    # Lock rows for this time slot and count them
-    # FOR UPDATE cannot be used with COUNT(*), so we select IDs and count in Python
-    result = db.execute(
-        text("""
-            SELECT id FROM users
-            WHERE heure_reservation = :slot_time
-            AND menu_id IS NOT NULL
-            AND payment_status IN ('completed', 'pending')
-            FOR UPDATE
-        """),
-        {"slot_time": slot_time}
-    ).fetchall()
-
-    current_count = len(result) if result else 0
-    return current_count < MAX_ORDERS_PER_SLOT
+        True si la place est prise, False si le créneau est complet
+    """
+    release_slot(db, user)
+    if not reserve_slot(db, slot_time, force=force):
+        return False
+    user.slot_held = True
+    return True
+
+
+def release_slot(db: Session, user: User) -> bool:
+    """
+    Give back the place held by the user's order (replaced, expired or deleted).
+
+    Must be called before user.heure_reservation is changed. The caller commits.
+
+    Returns:
+        True if a place was released
+    """
+    if not user.slot_held:
+        return False
+
+    if user.heure_reservation is not None:
+        db.execute(
+            update(SlotCapacity)
+            .where(SlotCapacity.slot_time == user.heure_reservation)
+            .values(remaining=func.least(SlotCapacity.remaining + 1, MAX_ORDERS_PER_SLOT))
+        )
+    user.slot_held = False
+    _mark_slots_changed(db)
+    return True
+
+
+def sync_slot_hold(db: Session, user: User, force: bool = True) -> bool:
+    """
+    Make the user's hold match its order after an update (admin edits, payment).
+
+    Call release_slot() before changing heure_reservation/menu_id, then this
+    once the new values are set. Admin paths use force=True (no capacity check).
+
+    Returns:
+        True if the user holds a place afterwards
+    """
+    # The order itself changed (payment status, expiry...), even if the hold didn't
+    _mark_slots_changed(db)
+    if user.slot_held or not should_hold_slot(user):
+        return bool(user.slot_held)
+    return hold_slot(db, user, user.heure_reservation, force=force)
+
+
+def ensure_slot_capacity_rows(db: Session) -> None:
+    """
+    Create the missing slot_capacity rows (one per TIME_SLOTS entry).
+
+    New rows are initialised from the current holds. Existing rows are left
+    untouched (see reconcile_slot_capacity).
+    """
+    counts = get_held_slot_counts(db)
+
+    stmt = insert(SlotCapacity).values([
+        {"slot_time": slot["start"], "remaining": MAX_ORDERS_PER_SLOT - counts.get(slot["start"], 0)}
+        for slot in TIME_SLOTS
+    ]).on_conflict_do_nothing(index_elements=[SlotCapacity.slot_time])
+
+    db.execute(stmt)
+    db.commit()
+
+
+def reconcile_slot_capacity(db: Session) -> Dict[time, tuple[int, int]]:
+    """
+    Check the slot counters against the users table and fix any drift.
+
+    The counter rows are locked first (FOR UPDATE), so bookings in flight
+    finish before the holds are counted and none start until the fix is
+    committed. Only 10 tiny rows are locked, for a few milliseconds.
+
+    Returns:
+        Corrected slots: {slot_time: (old_remaining, new_remaining)}
+    """
+    try:
+        rows = db.execute(
+            select(SlotCapacity).order_by(SlotCapacity.slot_time).with_for_update()
+        ).scalars().all()
+
+        counts = get_held_slot_counts(db)
+
+        corrections = {}
+        for row in rows:
+            expected = MAX_ORDERS_PER_SLOT - counts.get(row.slot_time, 0)
+            if row.remaining != expected:
+                corrections[row.slot_time] = (row.remaining, expected)
+                row.remaining = expected
+
+        db.commit()
+        return corrections
+    except Exception:
+        db.rollback()
+        raise
+
+
+def release_expired_holds(
+    db: Session,
+    slot_time: Optional[time] = None,
+    batch_size: int = EXPIRED_HOLDS_BATCH_SIZE,
+) -> int:
+    """
+    Give back the places held by expired pending reservations (one batch).
+
+    The counter rows are locked before the users (same order as bookings and
+    admin edits, so the two can't deadlock), and users already locked by
+    another transaction are skipped (SKIP LOCKED) and retried next pass.
+    One UPDATE per slot, whatever the batch size.
+
+    The orders stay "pending": a payment that completes later takes a place
+    again (see sync_slot_hold in complete_payment).
+
+    Args:
+        db: Session SQLAlchemy (committed here)
+        slot_time: Only release holds of this slot (booking retry)
+        batch_size: Max reservations released in this transaction
+
+    Returns:
+        Number of places released (== batch_size means there may be more)
+    """
+    now = datetime.now(timezone.utc)
+
+    # Cheap check through ix_users_payment_status_expires, without any lock
+    exists_query = select(User.id).where(_expired_hold(now))
+    if slot_time is not None:
+        exists_query = exists_query.where(User.heure_reservation == slot_time)
+    if db.execute(exists_query.limit(1)).first() is None:
+        return 0
+
+    try:
+        slots_query = select(SlotCapacity.slot_time).order_by(SlotCapacity.slot_time).with_for_update()
+        if slot_time is not None:
+            slots_query = slots_query.where(SlotCapacity.slot_time == slot_time)
+        db.execute(slots_query).all()
+
+        users_query = (
+            select(User)
+            .where(_expired_hold(now))
+            .order_by(User.reservation_expires_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        if slot_time is not None:
+            users_query = users_query.where(User.heure_reservation == slot_time)
+        users = db.execute(users_query).scalars().all()
+
+        freed = Counter(user.heure_reservation for user in users if user.heure_reservation is not None)
+        for user in users:
+            user.slot_held = False
+        if users:
+            _mark_slots_changed(db)
+
+        for freed_slot, count in freed.items():
+            db.execute(
+                update(SlotCapacity)
+                .where(SlotCapacity.slot_time == freed_slot)
+                .values(remaining=func.least(SlotCapacity.remaining + count, MAX_ORDERS_PER_SLOT))
+            )
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    _expiry_stats["released_total"] += len(users)
+    if slot_time is not None:
+        _expiry_stats["released_inline"] += len(users)
+    return len(users)
+
+
+def sweep_expired_holds(db: Session, batch_size: int = EXPIRED_HOLDS_BATCH_SIZE) -> int:
+    """
+    Release every expired pending hold, one batch (transaction) at a time.
+
+    Returns:
+        Total number of places released
+    """
+    total = 0
+    while True:
+        released = release_expired_holds(db, batch_size=batch_size)
+        total += released
+        if released < batch_size:
+            break
+
+    _expiry_stats["sweeps"] += 1
+    _expiry_stats["last_released"] = total
+    _expiry_stats["last_sweep_at"] = datetime.now(timezone.utc).isoformat()
+    return total
+
+
+def get_expiry_stats() -> dict:
+    """Compteurs du balayage des réservations expirées (pour /admin/metrics)."""
+    return dict(_expiry_stats)
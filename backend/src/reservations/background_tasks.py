@@ -0,0 +1,117 @@
+"""
+Background Tasks for Slot Capacity
+
+This module contains async background tasks that keep the slot_capacity
+counters consistent with the users table, and give back the places held by
+expired pending reservations. It also starts the availability stream hub.
+"""
+import asyncio
+
+from sqlalchemy.exc import ProgrammingError
+
+# Interval between slot capacity reconciliations (in seconds)
+SLOT_RECONCILE_INTERVAL = 300
+
+# Interval between expired reservation sweeps (in seconds)
+EXPIRED_HOLDS_SWEEP_INTERVAL = 60
+
+
+def _ensure_slot_capacity_rows():
+    """Create the missing slot counter rows (blocking, run in a thread)."""
+    from src.db.session import SessionLocal
+    from src.reservations.availability import ensure_slot_capacity_rows
+
+    db = SessionLocal()
+    try:
+        ensure_slot_capacity_rows(db)
+    finally:
+        db.close()
+
+
+def _reconcile_once() -> dict:
+    """Run one reconciliation pass (blocking, run in a thread)."""
+    from src.db.session import SessionLocal
+    from src.reservations.availability import reconcile_slot_capacity
+
+    db = SessionLocal()
+    try:
+        return reconcile_slot_capacity(db)
+    finally:
+        db.close()
+
+
+def _sweep_expired_once() -> int:
+    """Release the places of expired pending reservations (blocking, run in a thread)."""
+    from src.db.session import SessionLocal
+    from src.reservations.availability import sweep_expired_holds
+
+    db = SessionLocal()
+    try:
+        return sweep_expired_holds(db)
+    finally:
+        db.close()
+
+
+async def sweep_expired_holds_task():
+    """
+    Background task that gives back the places held by pending reservations
+    past their reservation_expires_at (1h without payment).
+    Runs every minute (60 seconds), in batches of EXPIRED_HOLDS_BATCH_SIZE.
+    """
+    print(f"[BACKGROUND] Expired reservations sweep started (interval: {EXPIRED_HOLDS_SWEEP_INTERVAL}s)")
+
+    while True:
+        try:
+            released = await asyncio.to_thread(_sweep_expired_once)
+            if released:
+                print(f"[BACKGROUND] Released {released} place(s) held by expired reservations")
+        except Exception as e:
+            print(f"[BACKGROUND] Expired reservations sweep error: {e}")
+            import traceback
+            traceback.print_exc()
+
+        await asyncio.sleep(EXPIRED_HOLDS_SWEEP_INTERVAL)
+
+
+async def reconcile_slot_capacity_task():
+    """
+    Background task that checks the slot counters against the users table.
+    Runs every 5 minutes (300 seconds).
+
+    Drift should never happen; a correction is logged so it can be
+    investigated (e.g. rows edited by hand in the database).
+    """
+    print(f"[BACKGROUND] Slot capacity reconciliation started (interval: {SLOT_RECONCILE_INTERVAL}s)")
+
+    while True:
+        try:
+            corrections = await asyncio.to_thread(_reconcile_once)
+            for slot_time, (old, new) in corrections.items():
+                print(f"[BACKGROUND] Slot {slot_time.strftime('%H:%M')} capacity corrected: {old} -> {new}")
+        except Exception as e:
+            print(f"[BACKGROUND] Slot reconciliation error: {e}")
+            import traceback
+            traceback.print_exc()
+
+        await asyncio.sleep(SLOT_RECONCILE_INTERVAL)
+
+
+async def start_background_tasks():
+    """
+    Make sure every slot has a counter row, then start the reconciliation
+    and expiry sweep tasks and the availability stream hub.
+    Returns the task handles for cleanup.
+    """
+    from src.reservations.stream import availability_hub
+
+    try:
+        await asyncio.to_thread(_ensure_slot_capacity_rows)
+    except ProgrammingError as e:
+        # Schéma pas encore migré (users.slot_held absent...): le backend doit
+        # démarrer quand même pour que scripts/update_db.sh puisse le migrer
+        print(f"[STARTUP] Slot capacity init skipped, database not migrated (run scripts/update_db.sh): {e.orig}")
+    return [
+        asyncio.create_task(reconcile_slot_capacity_task()),
+        asyncio.create_task(sweep_expired_holds_task()),
+        availability_hub.start(),
+    ]
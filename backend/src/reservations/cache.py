@@ -0,0 +1,152 @@
+"""
+In-process cache for the slot availability payload.
+
+Features:
+- Request coalescing: concurrent callers share one in-flight query
+- Invalidated after any commit that changes a slot hold (see availability.py)
+- Short TTL as a safety net (expired pending holds, edits made outside the app)
+- Content-based ETag so clients can revalidate with If-None-Match
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from typing import Optional
+
+# Max age of a cached payload, even without invalidation (in seconds)
+AVAILABILITY_CACHE_TTL = 2.0
+
+
+def _load_available_slots() -> list[dict]:
+    """Run the availability query with its own session (blocking, run in a thread)."""
+    from src.db.session import SessionLocal
+    from src.reservations.availability import get_available_slots
+
+    db = SessionLocal()
+    try:
+        return get_available_slots(db)
+    finally:
+        db.close()
+
+
+def compute_etag(slots: list[dict]) -> str:
+    """Strong ETag derived from the payload (same counts -> same ETag)."""
+    digest = hashlib.sha1(json.dumps(slots, sort_keys=True).encode()).hexdigest()
+    return f'"{digest[:16]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header value matches the current ETag."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(
+        value.removeprefix("W/") == etag for value in candidates
+    )
+
+
+class AvailabilityCache:
+    """
+    Single-entry cache of get_available_slots() with single-flight loading.
+
+    invalidate() only bumps a generation counter, so it can be called from
+    any thread (sync routes, background sweeps). A payload loaded while an
+    invalidation happened is tagged with the old generation and never served
+    as fresh.
+    """
+
+    def __init__(self, ttl: float = AVAILABILITY_CACHE_TTL):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._generation = 0
+        # (generation, loaded_at monotonic, slots, etag)
+        self._entry: Optional[tuple[int, float, list[dict], str]] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self._inflight_generation = -1
+        self._listeners = []
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.not_modified = 0
+
+    def invalidate(self) -> None:
+        """Mark the cached payload as stale (thread-safe)."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def add_listener(self, callback) -> None:
+        """Register a callback run on each invalidation, in the invalidating thread."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def _fresh_entry(self):
+        entry = self._entry
+        if entry is None:
+            return None
+        generation, loaded_at, _, _ = entry
+        if generation != self._generation or time.monotonic() - loaded_at > self._ttl:
+            return None
+        return entry
+
+    async def get(self) -> tuple[list[dict], str]:
+        """
+        Return (slots, etag), querying the database at most once at a time.
+
+        The shared load is shielded: a client disconnecting doesn't cancel
+        the query for the other callers waiting on it.
+        """
+        entry = self._fresh_entry()
+        if entry is not None:
+            self.hits += 1
+            return entry[2], entry[3]
+
+        task = self._inflight
+        if task is not None and self._inflight_generation == self._generation:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            self._inflight_generation = self._generation
+            task = asyncio.create_task(self._load(self._inflight_generation))
+            # Retrieve the exception even if every caller went away
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight = task
+
+        return await asyncio.shield(task)
+
+    async def _load(self, generation: int) -> tuple[list[dict], str]:
+        try:
+            slots = await asyncio.to_thread(_load_available_slots)
+            etag = compute_etag(slots)
+            self._entry = (generation, time.monotonic(), slots, etag)
+            return slots, etag
+        finally:
+            if self._inflight is asyncio.current_task():
+                self._inflight = None
+
+    def get_stats(self) -> dict:
+        """Hit/miss counters (for monitoring)."""
+        entry = self._entry
+        return {
+            "ttl_seconds": self._ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "not_modified": self.not_modified,
+            "etag": entry[3] if entry else None,
+        }
+
+
+availability_cache = AvailabilityCache()
+
+
+def invalidate_availability_cache() -> None:
+    """Force the next /reservations/availability call to hit the database."""
+    availability_cache.invalidate()
@@ -15,4 +15,14 @@ class MenuItemLimit(Base):
     # Number allowed per hour in this interval. None = Infinite.
     max_quantity: Mapped[int | None] = mapped_column(Integer, nullable=True)
     # Current remaining quantity for this slot. None = Infinite.
-    current_quantity: Mapped[int | None] = mapped_column(Integer, nullable=True)
\ No newline at end of file
+    current_quantity: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+
+class SlotCapacity(Base):
+    """Remaining capacity of a delivery time slot (one row per slot)."""
+    __tablename__ = "slot_capacity"
+
+    slot_time: Mapped[datetime] = mapped_column(Time, primary_key=True)  # Slot start, e.g. 08:00
+    # Decremented atomically on booking, incremented when a hold is released.
+    # Can be negative if an admin overbooks the slot.
+    remaining: Mapped[int] = mapped_column(Integer, nullable=False)
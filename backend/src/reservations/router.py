@@ -1,56 +1,72 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Cookie
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Cookie, Header, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 from datetime import datetime, date, time, timedelta, timezone
 import re
 
-from src.db.session import get_db
+from src.db.session import get_async_db, release_connection
 from src.reservations import schemas, service
-from src.reservations.availability import get_available_slots, is_slot_available, reserve_slot_with_lock, MAX_ORDERS_PER_SLOT
+from src.reservations.availability import (
+    hold_slot,
+    release_slot,
+    release_expired_holds,
+    MAX_ORDERS_PER_SLOT,
+)
+from src.reservations.cache import availability_cache, etag_matches
+from src.reservations.stream import availability_hub
 from src.auth.service import get_user_by_token, is_user_blacklisted, is_ordering_open
 from src.core.exceptions import UserNotVerifiedException
-from src.menu.utils import load_menu_data
+from src.core.idempotency import idempotency_store
+from src.menu.utils import get_menu_catalog
 
 router = APIRouter()
 
-# Helper to find item in JSON
-def find_item_by_name(name: str):
-    data = load_menu_data()
-    # Search in menus, boissons, extras
-    for menu in data.get("menus", []):
-         if menu["name"] == name:
-             menu["item_type"] = menu.get("item_type", "menu")
-             return menu
-    for drink in data.get("boissons", []):
-         if drink["name"] == name:
-             drink["item_type"] = "boisson"
-             return drink
-    for extra in data.get("extras", []):
-         if extra["name"] == name:
-             extra["item_type"] = "upsell"
-             return extra
-    return None
-
-def find_category_name_by_id(cat_id: str):
-    data = load_menu_data()
-    for cat in data.get("categories", []):
-        if cat["id"] == cat_id:
-            return cat["name"]
-    return None
-
 @router.get("/availability")
-async def check_availability(db: Session = Depends(get_db)):
+async def check_availability(request: Request, response: Response):
     """
     Retourne les créneaux horaires disponibles.
     Un créneau est disponible s'il reste de la capacité (max 30 commandes par créneau).
+
+    Servi depuis le cache en mémoire (une seule requête SQL pour tous les appels
+    simultanés). Renvoie 304 si l'ETag envoyé dans If-None-Match est à jour.
+    """
+    slots, etag = await availability_cache.get()
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        availability_cache.not_modified += 1
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return {"slots": slots, "version": etag.strip('"')}
+
+
+@router.get("/availability/stream")
+async def stream_availability(request: Request):
     """
-    slots = get_available_slots(db)
-    return {"slots": slots}
+    Flux Server-Sent Events des disponibilités.
+
+    Envoie l'état complet (event: snapshot) à la connexion, puis uniquement
+    les créneaux modifiés (event: delta), avec un heartbeat toutes les 15s.
+    Renvoie 503 si le nombre max de connexions est atteint (repli sur /availability).
+    """
+    queue, snapshot = await availability_hub.subscribe()
+    return StreamingResponse(
+        availability_hub.events(request, queue, snapshot),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Pas de buffering nginx, sinon les événements arrivent par paquets
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 
-def get_current_user_from_cookie(
+async def get_current_user_from_cookie(
     access_token: Optional[str] = Cookie(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Dépendance pour récupérer l'utilisateur depuis le cookie access_token.
@@ -62,18 +78,38 @@ def get_current_user_from_cookie(
             detail="Non connecté"
         )
     
-    user = get_user_by_token(access_token, db)
+    user = await get_user_by_token(access_token, db)
     return user
 
 
 @router.post("/", response_model=dict)
 async def create_reservation(
     request: schemas.ReservationCreateRequest,
-    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie)
 ):
     """
-    Étape 3: Création de la réservation avec validations strictes
+    Étape 3: Création de la réservation (voir _create_reservation).
+    Avec un en-tête Idempotency-Key, une requête rejouée renvoie la réponse
+    enregistrée sans retoucher la commande ni le créneau.
+    """
+    return await idempotency_store.run(
+        idempotency_key,
+        current_user.id,
+        "reservations.create",
+        request,
+        lambda: _create_reservation(request, db, current_user),
+    )
+
+
+async def _create_reservation(
+    request: schemas.ReservationCreateRequest,
+    db: AsyncSession,
+    current_user
+) -> dict:
+    """
+    Création de la réservation avec validations strictes
     - Date: 7 février 2026
     - Heure: entre 7h et 20h
     - Numéro chambre: entre 1000 et 7999
@@ -109,6 +145,8 @@ async def create_reservation(
     has_pending_order = current_user.menu_id or current_user.boisson_id or (current_user.bonus_ids and len(current_user.bonus_ids) > 0)
 
     if has_pending_order and current_user.payment_status != "completed":
+        # Give back the slot place held by the replaced order
+        await db.run_sync(release_slot, current_user)
         # Reset user reservation fields to allow new order
         current_user.menu_id = None
         current_user.boisson_id = None
@@ -116,7 +154,7 @@ async def create_reservation(
         current_user.payment_status = "pending"
         current_user.payment_attempts = 0
         current_user.reservation_expires_at = None
-        db.commit()
+        await db.commit()
     
     reservation_date = date(2026, 2, 7)
     
@@ -169,6 +207,8 @@ async def create_reservation(
                 detail="L'adresse est requise pour les non-résidents"
             )
         # Vérifier que l'adresse est à Évry (91000) via API BAN
+        # (connexion DB rendue au pool pendant l'appel externe)
+        await release_connection(db)
         import httpx
         try:
             async with httpx.AsyncClient() as client:
@@ -220,22 +260,11 @@ async def create_reservation(
     # VALIDATION 4: Vérifier que les items menu existent et correspondent au bon type
     # Groupes de catégories mutuellement exclusives pour les menus
     # On ne peut prendre qu'UN SEUL item parmi toutes ces catégories
-    EXCLUSIVE_MENU_CATEGORIES = []
-    # Dynamic loading of exclusive categories from JSON
-    # We identify "Menu" categories as those that contain items in the "menus" list
-    menu_data = load_menu_data()
-    
-    # Get all category IDs used by menus
-    menu_category_ids = set()
-    for m in menu_data.get("menus", []):
-        menu_category_ids.add(m.get("category"))
-        
-    # Get names for these categories
-    for cat in menu_data.get("categories", []):
-         if cat["id"] in menu_category_ids:
-             EXCLUSIVE_MENU_CATEGORIES.append(cat["name"])
+    # "Menu" categories are those that contain items in the "menus" list
+    # (precomputed once by the catalog)
+    catalog = get_menu_catalog()
+    EXCLUSIVE_MENU_CATEGORIES = catalog.menu_category_names
 
-    
     # VALIDATION MENU OBLIGATOIRE
     if not request.menu:
         raise HTTPException(
@@ -248,7 +277,7 @@ async def create_reservation(
     extra_items = []  # Liste d'extras validés
 
     if request.menu:
-        menu_item = find_item_by_name(request.menu)
+        menu_item = catalog.get_item_by_name(request.menu)
         if not menu_item:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -261,7 +290,7 @@ async def create_reservation(
             )
 
         # Vérifier que le menu appartient à une catégorie valide
-        cat_name = find_category_name_by_id(menu_item["category"])
+        cat_name = catalog.get_category_name(menu_item["category"])
         if cat_name and cat_name not in EXCLUSIVE_MENU_CATEGORIES:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -269,7 +298,7 @@ async def create_reservation(
             )
 
     if request.boisson:
-        boisson_item = find_item_by_name(request.boisson)
+        boisson_item = catalog.get_item_by_name(request.boisson)
         if not boisson_item:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -285,7 +314,7 @@ async def create_reservation(
     if request.extras:
         seen_ids = set()
         for extra_name in request.extras:
-            extra_item = find_item_by_name(extra_name)
+            extra_item = catalog.get_item_by_name(extra_name)
             if not extra_item:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
@@ -320,9 +349,15 @@ async def create_reservation(
                 detail="Le poulet rôti n'est pas disponible avant 10h00 (ouverture du fournisseur à 9h00). Veuillez choisir un créneau à partir de 10h00."
             )
 
-    # VALIDATION 5: Vérifier la disponibilité du créneau avec verrouillage
-    # Utilise SELECT FOR UPDATE pour éviter les conditions de concurrence
-    if not reserve_slot_with_lock(db, reservation_time):
+    # VALIDATION 5: Prendre une place dans le créneau
+    # Décrément conditionnel atomique du compteur slot_capacity (rendu si la
+    # transaction n'est pas validée). Si le créneau semble complet, on libère
+    # les réservations expirées de ce créneau sans attendre le balayage.
+    # (fonctions synchrones partagées, exécutées via run_sync sur la session async)
+    if not await db.run_sync(hold_slot, current_user, reservation_time) and not (
+        await db.run_sync(release_expired_holds, reservation_time)
+        and await db.run_sync(hold_slot, current_user, reservation_time)
+    ):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Ce créneau n'est plus disponible"
@@ -394,8 +429,8 @@ async def create_reservation(
     current_user.boisson_id = boisson_item["id"] if boisson_item else None
     current_user.bonus_ids = [extra["id"] for extra in extra_items] if extra_items else []
 
-    # Note: La disponibilité des créneaux est gérée par comptage SQL dans availability.py
-    # (MAX_ORDERS_PER_SLOT commandes max par créneau)
+    # Note: La place du créneau a été prise par hold_slot() (compteur slot_capacity,
+    # MAX_ORDERS_PER_SLOT commandes max par créneau)
 
     # Calculer le montant total avec validation des prix
     total = 0.0
@@ -441,10 +476,10 @@ async def create_reservation(
     current_user.updated_at = datetime.now(timezone.utc)
     
     try:
-        db.commit()
-        db.refresh(current_user)
+        await db.commit()
+        await db.refresh(current_user)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erreur lors de la création de la réservation: {str(e)}"
@@ -471,10 +506,68 @@ async def create_reservation(
     return response
 
 
+@router.post("/checkout", response_model=dict)
+async def create_reservation_and_checkout(
+    request: schemas.ReservationCheckoutRequest,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user_from_cookie)
+):
+    """
+    Réservation + checkout HelloAsso en un seul aller-retour.
+
+    Mêmes validations que POST /reservations/ (créneau pris et commité),
+    puis création ou réutilisation du checkout comme POST /payments/checkout.
+    Réponse: celle de la réservation + redirect_url et checkout_intent_id.
+    Idempotency-Key supporté comme sur POST /reservations/.
+    """
+    return await idempotency_store.run(
+        idempotency_key,
+        current_user.id,
+        "reservations.checkout",
+        request,
+        lambda: _create_reservation_and_checkout(request, db, current_user),
+    )
+
+
+async def _create_reservation_and_checkout(
+    request: schemas.ReservationCheckoutRequest,
+    db: AsyncSession,
+    current_user
+) -> dict:
+    from src.payments.router import start_checkout, validate_payer_names
+
+    # Avant de prendre la place: un nom invalide ferait échouer le checkout
+    validate_payer_names(request.payer_first_name, request.payer_last_name)
+
+    response = await _create_reservation(request, db, current_user)
+
+    try:
+        checkout = await start_checkout(
+            current_user,
+            db,
+            payer_email=request.payer_email,
+            payer_first_name=request.payer_first_name,
+            payer_last_name=request.payer_last_name,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        # La réservation est enregistrée: le client peut réessayer /payments/checkout
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+    response["redirect_url"] = checkout.redirect_url
+    response["checkout_intent_id"] = checkout.checkout_intent_id
+    return response
+
+
 @router.post("/{reservation_id}/payment", response_model=schemas.PaymentConfirmResponse)
 async def process_payment(
     reservation_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_current_user_from_cookie)
 ):
     """
@@ -514,10 +607,10 @@ async def process_payment(
     from src.users.models import User as Reservation
     import httpx
     
-    reservation = db.query(Reservation).filter(
+    reservation = (await db.execute(select(Reservation).where(
         Reservation.id == reservation_id,
         Reservation.id == current_user.id # user_id check matches id since Reservation IS User
-    ).first()
+    ))).scalars().first()
     
     if not reservation:
         raise HTTPException(
@@ -563,7 +656,7 @@ async def process_payment(
                 reservation.payment_status = "completed"
                 reservation.payment_intent_id = payment_data.get("id", "STRIPE_MOCK_INTENT")
                 reservation.payment_date = datetime.now(timezone.utc)
-                db.commit()
+                await db.commit()
                 
                 return schemas.PaymentConfirmResponse(
                     message="Paiement confirmé",
@@ -572,7 +665,7 @@ async def process_payment(
                 )
             else:
                 reservation.payment_attempts += 1
-                db.commit()
+                await db.commit()
                 raise HTTPException(
                     status_code=status.HTTP_502_BAD_GATEWAY,
                     detail=f"Erreur lors du paiement (Tentative {reservation.payment_attempts}/3)"
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, EmailStr
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
@@ -34,6 +34,12 @@ class ReservationCreateRequest(BaseModel):
     extras: Optional[List[str]] = None  # Liste d'extras (ex: ["Poulet Rôti", "La Chouffe"])
 
 
+class ReservationCheckoutRequest(ReservationCreateRequest):
+    """Réservation + paiement HelloAsso en une seule requête"""
+    payer_email: EmailStr
+    payer_first_name: str
+    payer_last_name: str
+
 
 class ReservationResponse(BaseModel):
     """Réponse réservation"""
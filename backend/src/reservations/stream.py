@@ -0,0 +1,183 @@
+"""
+Live slot availability over Server-Sent Events.
+
+Features:
+- One in-process hub per worker, fed by availability cache invalidations
+- Each client gets the full payload once, then per-slot deltas only
+- Heartbeat comments keep idle connections open through proxies
+- Per-process subscriber cap (503 beyond it, clients fall back to polling)
+"""
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+
+from src.reservations.cache import availability_cache
+
+# Max simultaneous stream clients per worker process
+AVAILABILITY_STREAM_MAX_SUBSCRIBERS = 2000
+
+# Interval between heartbeat comments on an idle stream (in seconds)
+AVAILABILITY_STREAM_HEARTBEAT = 15
+
+# Client reconnection delay sent in the stream (in milliseconds)
+AVAILABILITY_STREAM_RETRY_MS = 3000
+
+# Max wait between two checks, even without invalidation (expired holds stop
+# counting as time passes, without any commit)
+AVAILABILITY_STREAM_REFRESH_INTERVAL = 5
+
+# Delay used to batch the invalidations of a burst of bookings into one delta
+AVAILABILITY_STREAM_DEBOUNCE = 0.2
+
+# Pending events per client before it is sent a fresh snapshot instead
+AVAILABILITY_STREAM_QUEUE_SIZE = 32
+
+
+def format_sse(event: str, data: dict, event_id: Optional[str] = None) -> str:
+    """Format one Server-Sent Event."""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class AvailabilityHub:
+    """
+    Broadcasts slot availability changes to the connected stream clients.
+
+    The hub keeps the last published payload and sends each subscriber only
+    the slots that differ from it. Slot entries carry absolute values, so
+    a client that applies a delta twice (or after its snapshot) stays right.
+    """
+
+    def __init__(self, max_subscribers: int = AVAILABILITY_STREAM_MAX_SUBSCRIBERS):
+        self._max_subscribers = max_subscribers
+        self._subscribers: set[asyncio.Queue] = set()
+        self._slots: dict[str, dict] = {}
+        self._version: Optional[str] = None
+        self._changed: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.peak_subscribers = 0
+        self.rejected = 0
+        self.deltas_published = 0
+        self.resyncs = 0
+
+    def start(self) -> asyncio.Task:
+        """Start the refresh loop in the running event loop. Returns the task for cleanup."""
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        availability_cache.add_listener(self._on_invalidate)
+        self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def _on_invalidate(self) -> None:
+        # Called from whichever thread committed the change
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._changed.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=AVAILABILITY_STREAM_REFRESH_INTERVAL)
+                await asyncio.sleep(AVAILABILITY_STREAM_DEBOUNCE)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+
+            if not self._subscribers:
+                continue
+            try:
+                slots, version = await availability_cache.get()
+                self._publish(slots, version)
+            except Exception as e:
+                print(f"[STREAM] Availability refresh error: {e}")
+
+    def _publish(self, slots: list[dict], version: str) -> None:
+        """Send the slots that changed since the last publication to every subscriber."""
+        if version == self._version:
+            return
+
+        changed = [slot for slot in slots if self._slots.get(slot["start"]) != slot]
+        self._slots = {slot["start"]: slot for slot in slots}
+        self._version = version
+        if not changed or not self._subscribers:
+            return
+
+        message = format_sse("delta", {"slots": changed, "version": version.strip('"')}, version.strip('"'))
+        self.deltas_published += 1
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and send the whole state instead
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._snapshot_message())
+                self.resyncs += 1
+
+    def _snapshot_message(self) -> str:
+        version = (self._version or "").strip('"')
+        return format_sse("snapshot", {"slots": list(self._slots.values()), "version": version}, version)
+
+    async def subscribe(self) -> tuple[asyncio.Queue, str]:
+        """
+        Register a client. Returns its queue and the initial snapshot event.
+
+        Raises:
+            HTTPException: 503 if the subscriber cap is reached
+        """
+        if len(self._subscribers) >= self._max_subscribers:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Trop de connexions en cours, réessayez plus tard",
+                headers={"Retry-After": "10"},
+            )
+
+        slots, version = await availability_cache.get()
+        # No await between publishing and registering: the new client's
+        # snapshot is exactly the state the next delta is computed from
+        self._publish(slots, version)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=AVAILABILITY_STREAM_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        self.peak_subscribers = max(self.peak_subscribers, len(self._subscribers))
+        return queue, self._snapshot_message()
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    async def events(self, request: Request, queue: asyncio.Queue, snapshot: str):
+        """Async generator of SSE chunks for one client (used by StreamingResponse)."""
+        try:
+            yield f"retry: {AVAILABILITY_STREAM_RETRY_MS}\n\n"
+            yield snapshot
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=AVAILABILITY_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    message = ": heartbeat\n\n"
+                yield message
+        finally:
+            self.unsubscribe(queue)
+
+    def get_stats(self) -> dict:
+        """Subscriber and publication counters (for monitoring)."""
+        return {
+            "subscribers": len(self._subscribers),
+            "peak_subscribers": self.peak_subscribers,
+            "max_subscribers": self._max_subscribers,
+            "rejected": self.rejected,
+            "deltas_published": self.deltas_published,
+            "resyncs": self.resyncs,
+        }
+
+
+availability_hub = AvailabilityHub()
@@ -9,6 +9,7 @@ from ..users.router import get_current_user_from_cookie
 from ..users.models import User
 from ..core.exceptions import AdminException
 from ..db.session import get_db
+from ..menu.utils import get_menu_catalog
 
 router = APIRouter(tags=["terminal"])
 
@@ -58,28 +59,14 @@ def get_terminal_orders(
             )
         ).order_by(User.heure_reservation).all()
 
-    # Helper to resolve item name
-    from src.menu.utils import load_menu_data
-    menu_data = load_menu_data()
-    
-    def get_item_name(item_id):
-        if not item_id: return None
-        for cat in ["menus", "boissons", "extras"]:
-            for item in menu_data.get(cat, []):
-                if item["id"] == item_id:
-                    return item["name"]
-        return None
+    # Résolution des noms via le catalogue indexé (O(1) par item)
+    catalog = get_menu_catalog()
 
     # Build response
     orders = []
     for res in reservations:
         # Récupérer tous les extras
-        extras_names = []
-        if res.bonus_ids:
-            for bonus_id in res.bonus_ids:
-                name = get_item_name(bonus_id)
-                if name:
-                    extras_names.append(name)
+        extras_names = [item["name"] for item in catalog.get_items(res.bonus_ids)]
 
         orders.append(TerminalOrder(
             id=res.id,
@@ -88,8 +75,8 @@ def get_terminal_orders(
             is_maisel=res.adresse_if_maisel is not None,
             batiment=res.adresse_if_maisel.value if res.adresse_if_maisel else None,
             chambre=res.numero_if_maisel,
-            menu=get_item_name(res.menu_id),
-            boisson=get_item_name(res.boisson_id),
+            menu=catalog.get_item_name(res.menu_id),
+            boisson=catalog.get_item_name(res.boisson_id),
             extras=extras_names,
             heure=res.heure_reservation.strftime("%H:%M") if res.heure_reservation else "00:00"
         ))
@@ -45,12 +45,18 @@ class User(Base):
     checkout_created_at = Column(DateTime, nullable=True)  # When checkout was created
     payment_date = Column(DateTime, nullable=True)
     payment_attempts = Column(Integer, default=0)
+    payment_next_check_at = Column(DateTime, nullable=True)  # Prochaine vérif HelloAsso par le poller (NULL: aucune)
+    payment_check_count = Column(Integer, nullable=False, default=0, server_default="0")
     reservation_expires_at = Column(DateTime, nullable=True)
+    slot_held = Column(Boolean, nullable=False, default=False, server_default="false")  # Compté dans slot_capacity
     email_delivery_status = Column(String, default="pending")  # pending, sent, failed
 
-    # Composite index for common queries (payment_status + menu_id)
+    # Composite indexes for common queries (payment_status + menu_id,
+    # expired pending holds sweep, due payment checks)
     __table_args__ = (
         Index('ix_users_payment_status_menu', 'payment_status', 'menu_id'),
+        Index('ix_users_payment_status_expires', 'payment_status', 'reservation_expires_at'),
+        Index('ix_users_payment_status_next_check', 'payment_status', 'payment_next_check_at'),
     )
     
     # Métadonnées
@@ -1,48 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Cookie
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 
-from src.db.session import get_db
+from src.db.session import get_async_db
 from src.reservations.router import get_current_user_from_cookie
 from src.users.models import User
+from src.menu.utils import get_menu_catalog
 
 router = APIRouter()
 
 
 @router.get("/me")
 async def get_current_user_details(
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_from_cookie)
 ):
     """Récupérer les détails complets de l'utilisateur connecté et sa commande"""
-    # Re-fetch user with items loaded
-    # Fetch user
-    user = db.query(User).filter(User.id == current_user.id).first()
+    # current_user est chargé par la dépendance (une seule requête)
+    user = current_user
     
     has_active_order = user.menu_id is not None or user.boisson_id is not None or (user.bonus_ids and len(user.bonus_ids) > 0)
 
-    # Helper to resolve item name/price
-    from src.menu.utils import load_menu_data
-    menu_data = load_menu_data()
-
-    def get_item_details(item_id):
-        if not item_id: return None
-        for cat in ["menus", "boissons", "extras"]:
-            for item in menu_data.get(cat, []):
-                if item["id"] == item_id:
-                    return item
-        return None
-
-    menu_details = get_item_details(user.menu_id)
-    boisson_details = get_item_details(user.boisson_id)
+    catalog = get_menu_catalog()
+    menu_details = catalog.get_item(user.menu_id)
+    boisson_details = catalog.get_item(user.boisson_id)
 
     # Récupérer tous les extras
-    extras_details = []
-    if user.bonus_ids:
-        for bonus_id in user.bonus_ids:
-            details = get_item_details(bonus_id)
-            if details:
-                extras_details.append(details["name"])
+    extras_details = [item["name"] for item in catalog.get_items(user.bonus_ids)]
 
     return {
         "id": user.id,
@@ -76,13 +60,13 @@ async def get_current_user_details(
 @router.get("/order/status/{status_token}")
 async def get_order_status(
     status_token: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Récupérer le statut d'une commande via un token unique.
     Endpoint public (pas d'authentification requise).
     """
-    user = db.query(User).filter(User.status_token == status_token).first()
+    user = (await db.execute(select(User).where(User.status_token == status_token))).scalars().first()
     
     if not user:
         raise HTTPException(
@@ -97,20 +81,9 @@ async def get_order_status(
         adresse = user.adresse or "Non renseignée"
     
     
-    # Helper to resolve item name/price
-    from src.menu.utils import load_menu_data
-    menu_data = load_menu_data()
-    
-    def get_item_details(item_id):
-        if not item_id: return None
-        for cat in ["menus", "boissons", "extras"]:
-            for item in menu_data.get(cat, []):
-                if item["id"] == item_id:
-                    return item
-        return None
-        
-    menu_details = get_item_details(user.menu_id)
-    boisson_details = get_item_details(user.boisson_id)
+    catalog = get_menu_catalog()
+    menu_details = catalog.get_item(user.menu_id)
+    boisson_details = catalog.get_item(user.boisson_id)
 
     # Construire la liste des produits
     produits = []
@@ -127,15 +100,12 @@ async def get_order_status(
             "category": "Boisson"
         })
     # Ajouter tous les extras
-    if user.bonus_ids:
-        for bonus_id in user.bonus_ids:
-            bonus_details = get_item_details(bonus_id)
-            if bonus_details:
-                produits.append({
-                    "name": bonus_details["name"],
-                    "price": bonus_details.get("price", 0),
-                    "category": "Supplément"
-                })
+    for bonus_details in catalog.get_items(user.bonus_ids):
+        produits.append({
+            "name": bonus_details["name"],
+            "price": bonus_details.get("price", 0),
+            "category": "Supplément"
+        })
     
     return {
         "prenom": user.prenom,
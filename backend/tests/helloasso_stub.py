@@ -0,0 +1,130 @@
+"""
+In-process stand-in for the HelloAsso API (OAuth, checkout intents, orders).
+
+Installed as the transport of helloasso_service's shared HTTP client, so the
+real request code (retries, token sharing, paging) runs against it.
+"""
+import asyncio
+import json
+import re
+from datetime import datetime
+
+import httpx
+
+from src.payments import helloasso_service
+
+
+class HelloAssoStub:
+    def __init__(self, page_size: int = 2):
+        # checkout intent id -> response body
+        self.intents: dict[str, dict] = {}
+        # Orders of the organization, oldest first
+        self.orders: list[dict] = []
+        self.page_size = page_size
+        self.requests: list[httpx.Request] = []
+        self.token_requests = 0
+        # Token endpoint behaviour: answer delay, failures before answering
+        self.token_delay = 0.0
+        self.token_failures = 0
+        # Database connections checked out while each token request was served
+        self.connections_during_token = []
+        self.created_intents = 0
+
+    # --- Fixtures ---------------------------------------------------------
+
+    def add_intent(self, intent_id, paid: bool = False, order_id: int = None, metadata: dict = None) -> dict:
+        intent = {"id": int(intent_id), "metadata": metadata or {}}
+        if paid:
+            intent["order"] = {"id": order_id or int(intent_id) * 10, "payments": [{"state": "Authorized"}]}
+        self.intents[str(intent_id)] = intent
+        return intent
+
+    def add_order(self, order_id: int, date: str, checkout_intent_id=None, metadata=None, state: str = "Authorized") -> dict:
+        order = {
+            "id": order_id,
+            "date": date,
+            "payments": [{"id": order_id * 10, "state": state, "date": date}],
+        }
+        if checkout_intent_id is not None:
+            order["checkoutIntentId"] = checkout_intent_id
+        if metadata is not None:
+            order["metadata"] = metadata
+        self.orders.append(order)
+        return order
+
+    def listing_requests(self) -> list[httpx.Request]:
+        return [r for r in self.requests if r.url.path.endswith("/orders")]
+
+    # --- Transport --------------------------------------------------------
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        path = request.url.path
+
+        if path.endswith("/token"):
+            from src.db.session import async_engine
+
+            self.token_requests += 1
+            self.connections_during_token.append(async_engine.pool.checkedout())
+            await asyncio.sleep(self.token_delay)
+            if self.token_failures:
+                self.token_failures -= 1
+                return httpx.Response(500)
+            return httpx.Response(200, json={
+                "access_token": f"token-{self.token_requests}",
+                "refresh_token": f"refresh-{self.token_requests}",
+                "expires_in": 1800,
+            })
+
+        match = re.search(r"/checkout-intents/([^/]+)$", path)
+        if match and request.method == "GET":
+            intent = self.intents.get(match.group(1))
+            if intent is None:
+                return httpx.Response(404, json={"errors": [{"message": "Not found"}]})
+            return httpx.Response(200, json=intent)
+
+        if path.endswith("/checkout-intents") and request.method == "POST":
+            self.created_intents += 1
+            intent_id = str(9000 + self.created_intents)
+            body = json.loads(request.content)
+            self.intents[intent_id] = {"id": int(intent_id), "metadata": body.get("metadata") or {}}
+            return httpx.Response(200, json={"id": int(intent_id), "redirectUrl": f"https://pay.test/{intent_id}"})
+
+        if path.endswith("/orders"):
+            return self._orders_page(request)
+
+        return httpx.Response(404)
+
+    def _orders_page(self, request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        orders = self.orders
+        if params.get("from"):
+            from_date = datetime.fromisoformat(params["from"])
+            orders = [o for o in orders if datetime.fromisoformat(o["date"]) >= from_date]
+
+        start = int(params.get("continuationToken") or 0)
+        size = min(int(params.get("pageSize") or 20), self.page_size)
+        page = orders[start:start + size]
+        pagination = {"pageSize": size}
+        if page:
+            # Like HelloAsso: a token is returned with each page, the
+            # listing ends with an empty page
+            pagination["continuationToken"] = str(start + len(page))
+        return httpx.Response(200, json={"data": page, "pagination": pagination})
+
+    # --- Installation -----------------------------------------------------
+
+    def install(self) -> None:
+        self._saved_client = helloasso_service._http_client
+        helloasso_service._http_client = httpx.AsyncClient(transport=httpx.MockTransport(self._handle))
+        # Module-level asyncio objects are bound to the loop that used them
+        helloasso_service._client_lock = asyncio.Lock()
+        helloasso_service._token_lock = asyncio.Lock()
+        helloasso_service._token_cache.update(access_token=None, refresh_token=None, expires_at=None)
+        helloasso_service._intent_cache.clear()
+        helloasso_service._intent_inflight.clear()
+
+    def uninstall(self) -> None:
+        helloasso_service._http_client = self._saved_client
+        helloasso_service._intent_cache.clear()
+        helloasso_service._intent_inflight.clear()
@@ -0,0 +1,86 @@
+"""
+Minimal local SMTP server for the SMTP pool tests (asyncio, no dependency).
+
+Records connections, commands and delivered messages, and can misbehave
+like a real provider: expire idle sessions, or drop the connection in the
+middle of a send.
+"""
+import asyncio
+
+
+class SMTPTestServer:
+    def __init__(self):
+        self.connections = 0
+        self.commands: list[str] = []
+        self.messages: list[bytes] = []
+        # Next DATA commands answered by closing the connection
+        self.drop_on_data = 0
+        # Recipients answered 550
+        self.rejected_recipients: set[str] = set()
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._expired: set[asyncio.StreamWriter] = set()
+        self._server = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.close_connections()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def count(self, verb: str) -> int:
+        return sum(1 for command in self.commands if command.upper().startswith(verb))
+
+    def expire_sessions(self) -> None:
+        """Idle timeout: the next command of each open session gets a 421."""
+        self._expired.update(self._writers)
+
+    def close_connections(self) -> None:
+        """Server side close of every open session."""
+        for writer in list(self._writers):
+            writer.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._writers.add(writer)
+        try:
+            writer.write(b"220 localhost ESMTP test\r\n")
+            while line := await reader.readline():
+                command = line.decode().strip()
+                self.commands.append(command)
+                verb = command.split(" ", 1)[0].upper()
+
+                if writer in self._expired:
+                    writer.write(b"421 4.4.2 Idle timeout\r\n")
+                    await writer.drain()
+                    break
+                if verb in ("EHLO", "HELO"):
+                    writer.write(b"250-localhost\r\n250 8BITMIME\r\n")
+                elif verb == "RCPT" and any(f"<{r}>" in command for r in self.rejected_recipients):
+                    writer.write(b"550 5.1.1 Recipient rejected\r\n")
+                elif verb == "DATA":
+                    if self.drop_on_data:
+                        self.drop_on_data -= 1
+                        break
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    body = []
+                    while (data_line := await reader.readline()) not in (b".\r\n", b""):
+                        body.append(data_line)
+                    self.messages.append(b"".join(body))
+                    writer.write(b"250 2.0.0 Ok: queued\r\n")
+                elif verb == "QUIT":
+                    writer.write(b"221 2.0.0 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 2.0.0 Ok\r\n")
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._expired.discard(writer)
+            writer.close()
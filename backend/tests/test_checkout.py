@@ -0,0 +1,103 @@
+"""
+start_checkout(): reuse of a recent checkout, and no new checkout once the
+existing one turns out paid. POST /payments/checkout only for the owner of
+the reservation.
+"""
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from src.users.models import User
+from tests.conftest import counts, create_user, run
+
+
+async def start(user_id: int):
+    from src.db.session import AsyncSessionLocal
+    from src.payments.router import start_checkout
+
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+        return await start_checkout(user, db, user.email, "Jean", "Dupont")
+
+
+def recent_checkout_user(engine) -> int:
+    return create_user(
+        engine,
+        "101",
+        checkout_redirect_url="https://pay.test/101",
+        checkout_created_at=datetime.now(timezone.utc),
+    )
+
+
+def test_pending_checkout_is_reused(pg, helloasso):
+    user_id = recent_checkout_user(pg)
+    helloasso.add_intent(101, paid=False)
+
+    response = run(start(user_id))
+
+    assert (response.checkout_intent_id, response.redirect_url) == ("101", "https://pay.test/101")
+    assert helloasso.created_intents == 0
+
+
+def test_paid_checkout_completes_without_new_checkout(pg, helloasso):
+    user_id = recent_checkout_user(pg)
+    helloasso.add_intent(101, paid=True)
+
+    with pytest.raises(HTTPException) as error:
+        run(start(user_id))
+
+    assert (error.value.status_code, error.value.detail) == (400, "Paiement déjà effectué")
+    assert helloasso.created_intents == 0
+    assert counts(pg) == {"notifications": 0, "outbox": 1, "completed": 1}
+    with Session(pg) as session:
+        assert session.get(User, user_id).payment_intent_id == "101"
+
+
+def test_unknown_checkout_is_replaced(pg, helloasso):
+    user_id = recent_checkout_user(pg)
+
+    response = run(start(user_id))
+
+    assert helloasso.created_intents == 1
+    assert response.checkout_intent_id == "9001"
+
+
+async def post_checkout(reservation_id: int, cookies: dict) -> httpx.Response:
+    from src.payments.router import router
+
+    app = FastAPI()
+    app.include_router(router)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test", cookies=cookies
+    ) as client:
+        return await client.post(
+            "/payments/checkout",
+            headers={"Idempotency-Key": "same-key"},
+            json={
+                "payer_email": "jean.dupont@telecom-sudparis.eu",
+                "payer_first_name": "Jean",
+                "payer_last_name": "Dupont",
+                "reservation_id": reservation_id,
+            },
+        )
+
+
+def test_checkout_of_another_reservation_is_rejected(pg, helloasso):
+    from src.core.models import IdempotencyKey
+    from src.core.security import create_access_token
+
+    owner_id = recent_checkout_user(pg)
+    caller_id = create_user(pg, "102", email_verified=True)
+    token = create_access_token("user102@telecom-sudparis.eu", caller_id)
+
+    assert run(post_checkout(owner_id, {})).status_code == 401
+    response = run(post_checkout(owner_id, {"access_token": token}))
+
+    assert (response.status_code, response.json()["detail"]) == (404, "Réservation introuvable")
+    assert helloasso.created_intents == 0
+    with Session(pg) as session:
+        assert session.scalar(select(func.count()).select_from(IdempotencyKey)) == 0
@@ -0,0 +1,93 @@
+"""
+Renewal of the HelloAsso token shared by the worker processes
+(helloasso_tokens row + renewal lease).
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.orm import Session
+
+from src.payments import helloasso_service
+from src.payments.models import HelloAssoToken
+from tests.conftest import run
+
+
+def forget_local_token():
+    """Local copy of another worker process: empty."""
+    helloasso_service._token_cache.update(access_token=None, refresh_token=None, expires_at=None)
+
+
+def shared_token(engine) -> HelloAssoToken:
+    with Session(engine) as session:
+        return session.get(HelloAssoToken, HelloAssoToken.SINGLETON_ID)
+
+
+def test_renewal_holds_no_connection_during_oauth_call(pg, helloasso):
+    run(helloasso_service._renew_shared_token(60))
+
+    assert helloasso.token_requests == 1
+    assert helloasso.connections_during_token == [0]
+    row = shared_token(pg)
+    assert row.access_token == "token-1"
+    assert row.renewal_lease_until is None
+
+
+def test_concurrent_workers_share_one_renewal(pg, helloasso):
+    helloasso.token_delay = 0.5
+
+    async def worker():
+        # Each call stands for a worker process with no local copy yet
+        forget_local_token()
+        await helloasso_service._renew_shared_token(60)
+        return helloasso_service._token_cache["access_token"]
+
+    async def scenario():
+        return await asyncio.gather(*(worker() for _ in range(5)))
+
+    lease_waits = helloasso_service._token_stats["lease_waits"]
+    assert run(scenario()) == ["token-1"] * 5
+    assert helloasso.token_requests == 1
+    # The others polled the row while the lease holder was renewing
+    assert helloasso_service._token_stats["lease_waits"] > lease_waits
+
+
+def test_failed_renewal_releases_the_lease(pg, helloasso):
+    # Both grants fail (refresh_token, then client credentials)
+    helloasso.token_failures = 1
+
+    with pytest.raises(Exception, match="HelloAsso auth failed"):
+        run(helloasso_service._renew_shared_token(60))
+    assert shared_token(pg).renewal_lease_until is None
+
+    run(helloasso_service._renew_shared_token(60))
+    assert shared_token(pg).access_token == "token-2"
+
+
+def test_expired_lease_is_taken_over(pg, helloasso):
+    with Session(pg) as session:
+        # Worker killed while renewing: its lease was never released
+        session.add(HelloAssoToken(
+            id=HelloAssoToken.SINGLETON_ID,
+            renewal_lease_until=datetime.now(timezone.utc) - timedelta(seconds=1),
+        ))
+        session.commit()
+
+    run(helloasso_service._renew_shared_token(60))
+
+    assert helloasso.token_requests == 1
+    assert shared_token(pg).renewal_lease_until is None
+
+
+def test_valid_shared_token_is_reused(pg, helloasso):
+    with Session(pg) as session:
+        session.add(HelloAssoToken(
+            id=HelloAssoToken.SINGLETON_ID,
+            access_token="shared",
+            refresh_token="refresh",
+            expires_at=datetime.now(timezone.utc) + timedelta(minutes=20),
+        ))
+        session.commit()
+
+    assert run(helloasso_service.get_access_token()) == "shared"
+    assert helloasso.token_requests == 0
@@ -0,0 +1,137 @@
+"""
+SMTP session pool (src/mail.py) against a local SMTP server: session reuse,
+RSET after an idle drop, single retry when the server disconnects.
+"""
+import asyncio
+
+import aiosmtplib
+import pytest
+
+from src.core.config import settings
+from src.mail import SMTPPool, build_message
+from tests.smtp_server import SMTPTestServer
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    monkeypatch.setattr(settings, "MAIL_HYPNOS_SERVER", "127.0.0.1")
+    monkeypatch.setattr(settings, "MAIL_HYPNOS_STARTTLS", False)
+    monkeypatch.setattr(settings, "MAIL_HYPNOS_SSL_TLS", False)
+    monkeypatch.setattr(settings, "MAIL_HYPNOS_USE_CREDENTIALS", False)
+
+    def scenario(steps, size: int = 2):
+        """Run steps(server, pool) against a fresh server and pool."""
+        async def main():
+            server = SMTPTestServer()
+            monkeypatch.setattr(settings, "MAIL_HYPNOS_PORT", await server.start())
+            pool = SMTPPool(size)
+            try:
+                await steps(server, pool)
+            finally:
+                await pool.close()
+                await server.stop()
+            return server, pool
+
+        return asyncio.run(main())
+
+    return scenario
+
+
+def message(i: int = 0):
+    return build_message(f"Test {i}", "jean.dupont@telecom-sudparis.eu", f"<p>Message {i}</p>")
+
+
+def test_sequential_sends_reuse_one_session(smtp):
+    async def steps(server, pool):
+        for i in range(5):
+            await pool.send(message(i))
+
+    server, pool = smtp(steps)
+
+    assert len(server.messages) == 5
+    assert (server.connections, pool.connects) == (1, 1)
+    # Reused session reset before each message
+    assert server.count("RSET") == 4
+    assert pool.get_stats()["sent"] == 5
+
+
+def test_concurrent_sends_open_at_most_size_sessions(smtp):
+    async def steps(server, pool):
+        await asyncio.gather(*(pool.send(message(i)) for i in range(10)))
+
+    server, pool = smtp(steps, size=3)
+
+    assert len(server.messages) == 10
+    assert server.connections == pool.connects <= 3
+
+
+def test_session_expired_while_idle_is_replaced(smtp):
+    async def steps(server, pool):
+        await pool.send(message(1))
+        server.expire_sessions()
+        await pool.send(message(2))
+
+    server, pool = smtp(steps)
+
+    # RSET answered 421 on the idle session: new session, message delivered
+    assert server.count("RSET") == 1
+    assert len(server.messages) == 2
+    assert (server.connections, pool.connects, pool.reconnects) == (2, 2, 1)
+    assert pool.failed == 0
+
+
+def test_session_closed_while_idle_is_replaced(smtp):
+    async def steps(server, pool):
+        await pool.send(message(1))
+        server.close_connections()
+        await asyncio.sleep(0.1)
+        await pool.send(message(2))
+
+    server, pool = smtp(steps)
+
+    assert len(server.messages) == 2
+    assert (server.connections, pool.connects) == (2, 2)
+    assert pool.failed == 0
+
+
+def test_disconnect_mid_send_is_retried_once(smtp):
+    async def steps(server, pool):
+        server.drop_on_data = 1
+        await pool.send(message())
+
+    server, pool = smtp(steps)
+
+    assert len(server.messages) == 1
+    assert server.count("DATA") == 2
+    assert (server.connections, pool.reconnects, pool.failed) == (2, 1, 0)
+
+
+def test_second_disconnect_fails_the_send(smtp):
+    async def steps(server, pool):
+        server.drop_on_data = 2
+        with pytest.raises(aiosmtplib.SMTPServerDisconnected):
+            await pool.send(message())
+        # The pool still works afterwards
+        await pool.send(message())
+
+    server, pool = smtp(steps)
+
+    # One retry only: 2 attempts for the failed send, 1 for the next
+    assert server.count("DATA") == 3
+    assert len(server.messages) == 1
+    assert (pool.failed, pool.sent) == (1, 1)
+
+
+def test_refused_recipient_keeps_the_session(smtp):
+    async def steps(server, pool):
+        server.rejected_recipients.add("unknown@telecom-sudparis.eu")
+        await pool.send(message(1))
+        with pytest.raises(aiosmtplib.SMTPRecipientsRefused):
+            await pool.send(build_message("Test", "unknown@telecom-sudparis.eu", "<p>x</p>"))
+        await pool.send(message(2))
+
+    server, pool = smtp(steps)
+
+    assert len(server.messages) == 2
+    assert server.connections == 1
+    assert pool.failed == 1
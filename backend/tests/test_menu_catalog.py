@@ -0,0 +1,27 @@
+"""
+MenuCatalog.get_item_by_name(): exact and case-insensitive lookups within a
+section.
+"""
+from src.menu.utils import MenuCatalog
+
+CATALOG = MenuCatalog.from_data({
+    "categories": [{"id": "cat", "name": "Menus"}],
+    "menus": [
+        {"id": "m1", "name": "Menu Chef", "category": "cat"},
+        {"id": "m2", "name": "MENU CHEF", "category": "cat"},
+    ],
+    "boissons": [{"id": "b1", "name": "Coca"}],
+    "extras": [],
+})
+
+
+def test_case_sensitive_lookup_finds_the_exact_name_in_the_section():
+    assert CATALOG.get_item_by_name("Menu Chef", section="menus")["id"] == "m1"
+    assert CATALOG.get_item_by_name("MENU CHEF", section="menus")["id"] == "m2"
+    assert CATALOG.get_item_by_name("menu chef", section="menus") is None
+    assert CATALOG.get_item_by_name("Coca", section="menus") is None
+
+
+def test_case_insensitive_lookup_keeps_the_first_item():
+    assert CATALOG.get_item_by_name("menu chef", section="menus", case_sensitive=False)["id"] == "m1"
+    assert CATALOG.get_item_by_name("COCA", section="boissons", case_sensitive=False)["id"] == "b1"
@@ -0,0 +1,45 @@
+"""
+Email outbox: delivery failures reported to the sender, and emails queued
+in the transaction of the change that triggers them.
+"""
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import src.mail
+from src.core.models import EmailOutbox
+from src.outbox import EmailSendError, _deliver
+from src.users.models import User
+from tests.conftest import run
+
+
+async def failed_send(*args) -> bool:
+    return False
+
+
+def test_failed_verification_send_is_retried(monkeypatch):
+    monkeypatch.setattr(src.mail, "send_verification_email", failed_send)
+
+    with pytest.raises(EmailSendError) as error:
+        run(_deliver("verification", "jean.dupont@telecom-sudparis.eu", None, {"code": "abc123"}, datetime.now(timezone.utc)))
+
+    assert not error.value.permanent
+
+
+def test_verification_code_and_email_are_committed_together(pg):
+    from src.auth.service import request_verification_code
+    from src.db.session import AsyncSessionLocal
+
+    async def request():
+        async with AsyncSessionLocal() as db:
+            return await request_verification_code("jean.dupont@telecom-sudparis.eu", db)
+
+    delivery_email, code = run(request())
+
+    with Session(pg) as session:
+        user = session.scalars(select(User)).one()
+        email, = session.scalars(select(EmailOutbox)).all()
+    assert user.verification_code == code
+    assert (email.kind, email.recipient, email.payload) == ("verification", delivery_email, {"code": code})
@@ -0,0 +1,87 @@
+"""
+complete_payment() racing against itself: several sessions and worker
+processes completing the same checkout must record exactly one payment and
+queue exactly one confirmation email (SELECT ... FOR UPDATE on the user).
+"""
+import asyncio
+import multiprocessing
+
+from sqlalchemy import select
+
+from tests.conftest import counts, create_user, run
+
+WORKERS = 8
+PROCESSES = 4
+
+
+async def _complete(user_id: int, intent_id: str) -> bool:
+    from src.db.session import AsyncSessionLocal
+    from src.payments.router import complete_payment
+    from src.users.models import User
+
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+        return await complete_payment(user, intent_id, db)
+
+
+def _complete_in_process(user_id, intent_id, barrier, results):
+    barrier.wait()
+    results.put(run(_complete(user_id, intent_id)))
+
+
+def test_second_session_waits_for_the_row_lock(pg):
+    from src.db.session import AsyncSessionLocal
+    from src.users.models import User
+
+    user_id = create_user(pg, "101")
+
+    async def scenario():
+        async with AsyncSessionLocal() as holder:
+            # Another worker holding the user row (e.g. in complete_payment)
+            await holder.execute(select(User).where(User.id == user_id).with_for_update())
+
+            waiting = asyncio.create_task(_complete(user_id, "101"))
+            await asyncio.sleep(0.5)
+            assert not waiting.done()
+
+            locked = await holder.get(User, user_id)
+            locked.payment_status = "completed"
+            await holder.commit()
+
+            return await asyncio.wait_for(waiting, 5)
+
+    # The waiting session sees the committed status and does nothing
+    assert run(scenario()) is False
+    assert counts(pg)["outbox"] == 0
+
+
+def test_concurrent_sessions_complete_once(pg):
+    user_id = create_user(pg, "101")
+
+    async def scenario():
+        return await asyncio.gather(*(_complete(user_id, "101") for _ in range(WORKERS)))
+
+    results = run(scenario())
+
+    assert sorted(results) == [False] * (WORKERS - 1) + [True]
+    assert counts(pg) == {"notifications": 0, "outbox": 1, "completed": 1}
+
+
+def test_concurrent_processes_complete_once(pg):
+    user_id = create_user(pg, "101")
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(PROCESSES)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_complete_in_process, args=(user_id, "101", barrier, results))
+        for _ in range(PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+
+    assert [process.exitcode for process in processes] == [0] * PROCESSES
+    assert sorted(results.get(timeout=5) for _ in range(PROCESSES)) == [False] * (PROCESSES - 1) + [True]
+    assert counts(pg) == {"notifications": 0, "outbox": 1, "completed": 1}
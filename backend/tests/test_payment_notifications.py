@@ -0,0 +1,100 @@
+"""
+Replay of HelloAsso notifications against the webhook endpoint, with the
+HelloAsso API answered by HelloAssoStub.
+"""
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from src.payments.router import router
+from tests.conftest import counts, create_user, run
+
+app = FastAPI()
+app.include_router(router)
+
+
+async def post_notifications(*payloads) -> list[httpx.Response]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = []
+        for payload in payloads:
+            body = payload if isinstance(payload, (str, bytes)) else json.dumps(payload)
+            responses.append(await client.post(
+                "/payments/notifications", content=body, headers={"content-type": "application/json"}
+            ))
+        return responses
+
+
+def order_event(order_id, intent_id=None, metadata=None) -> dict:
+    data = {"id": order_id}
+    if intent_id is not None:
+        data["checkoutIntentId"] = intent_id
+    return {"eventType": "Order", "data": data, "metadata": metadata}
+
+
+def test_rejects_non_object_payload():
+    responses = run(post_notifications("[1, 2]", "not json"))
+    assert [r.status_code for r in responses] == [400, 400]
+
+
+def test_ignores_other_event_types():
+    response, = run(post_notifications({"eventType": "Form", "data": {"id": 1}}))
+    assert response.json() == {"status": "ignored"}
+
+
+def test_paid_order_completes_once_across_redeliveries(pg, helloasso):
+    user_id = create_user(pg, "101")
+    helloasso.add_intent(101, paid=True, metadata={"reservation_id": user_id})
+
+    event = order_event(1010, 101, {"reservation_id": user_id})
+    responses = run(post_notifications(event, event, event))
+
+    assert [r.json()["status"] for r in responses] == ["completed", "duplicate", "duplicate"]
+    assert counts(pg) == {"notifications": 1, "outbox": 1, "completed": 1}
+
+
+def test_unknown_checkout_intent_is_ignored(pg, helloasso):
+    create_user(pg, "101")
+
+    responses = run(post_notifications(order_event(2020, 999), order_event(2021)))
+
+    assert [r.json()["status"] for r in responses] == ["ignored", "ignored"]
+    assert counts(pg) == {"notifications": 0, "outbox": 0, "completed": 0}
+    assert helloasso.requests == []
+
+
+def test_pending_intent_is_not_recorded(pg, helloasso):
+    create_user(pg, "101")
+    helloasso.add_intent(101, paid=False)
+
+    event = order_event(1010, 101)
+    first, = run(post_notifications(event))
+    assert first.json() == {"status": "pending"}
+    assert counts(pg)["notifications"] == 0
+
+    # Payment validated later: the same notification completes it
+    helloasso.add_intent(101, paid=True)
+    second, = run(post_notifications(event))
+    assert second.json() == {"status": "completed"}
+    assert counts(pg) == {"notifications": 1, "outbox": 1, "completed": 1}
+
+
+@pytest.mark.parametrize("metadata", ["reservation_id=1", [1, 2], None, 42, {"reservation_id": "abc"}])
+def test_malformed_metadata_falls_back_to_checkout_intent(pg, helloasso, metadata):
+    create_user(pg, "101")
+    helloasso.add_intent(101, paid=True)
+
+    response, = run(post_notifications(order_event(1010, 101, metadata)))
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "completed"}
+
+
+@pytest.mark.parametrize("data", ["1010", [1010], None])
+def test_malformed_data_is_ignored(pg, helloasso, data):
+    response, = run(post_notifications({"eventType": "Order", "data": data, "metadata": "x"}))
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ignored"}
@@ -0,0 +1,64 @@
+"""
+Rate limiter: shared Postgres counters and fallback to the in-memory ones.
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from src.core.rate_limit import PostgresRateLimitBackend, RateLimitBackend, RateLimiter
+from tests.conftest import run
+
+
+class BrokenBackend(RateLimitBackend):
+    name = "broken"
+
+    async def hit(self, key, max_requests, window_seconds):
+        raise ConnectionError("database down")
+
+
+def test_postgres_backend_enforces_the_limit(pg):
+    backend = PostgresRateLimitBackend()
+
+    async def hits():
+        return [await backend.hit("verify:jean.dupont", 3, 60) for _ in range(5)]
+
+    assert run(hits()) == [True, True, True, False, False]
+
+
+def test_postgres_backend_counts_concurrent_hits_once(pg):
+    limiter = RateLimiter(backend=PostgresRateLimitBackend())
+
+    async def hit():
+        try:
+            await limiter.check("ip:157.159.1.1", 5, 60)
+            return True
+        except HTTPException:
+            return False
+
+    async def scenario():
+        return await asyncio.gather(*(hit() for _ in range(20)))
+
+    assert sorted(run(scenario())) == [False] * 15 + [True] * 5
+    assert limiter.fallbacks == 0
+
+
+def test_unavailable_backend_falls_back_to_memory():
+    limiter = RateLimiter(backend=BrokenBackend())
+
+    async def checks():
+        for _ in range(3):
+            await limiter.check("email:jean.dupont", 3, 60)
+        with pytest.raises(HTTPException):
+            await limiter.check("email:jean.dupont", 3, 60)
+
+    asyncio.run(checks())
+    assert limiter.fallbacks == 4
+
+
+def test_backend_without_hit_cannot_be_created():
+    class IncompleteBackend(RateLimitBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
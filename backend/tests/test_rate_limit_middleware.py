@@ -0,0 +1,73 @@
+"""
+Per-IP request limits of the ASGI middleware: order of the route and global
+checks, and higher limits behind a shared NAT.
+"""
+import ipaddress
+
+from src.core.rate_limit_middleware import RequestLimits, RoutePolicy, get_client_ip, parse_networks
+
+MENU = RoutePolicy("menu", "/menu", 5, 60)
+GLOBAL = RoutePolicy("global", "/", 3, 60)
+CAMPUS = (ipaddress.ip_network("157.159.0.0/16"),)
+
+
+def limits(**kwargs) -> RequestLimits:
+    kwargs.setdefault("shared_networks", ())
+    return RequestLimits(policies=(MENU,), global_policy=GLOBAL, **kwargs)
+
+
+def test_global_rejection_is_not_counted_on_the_route():
+    request_limits = limits()
+
+    for _ in range(3):
+        assert request_limits.check("/status", "93.184.216.34") is None
+    # Global limit reached by other routes
+    assert request_limits.check("/menu", "93.184.216.34") is GLOBAL
+    assert request_limits.check("/menu", "93.184.216.34") is GLOBAL
+
+    assert request_limits.rejected == {"global": 2}
+    assert request_limits.limiter.allow("menu:93.184.216.34", 1, 60)
+
+
+def test_route_limit_applies_below_the_global_one():
+    request_limits = RequestLimits(
+        policies=(RoutePolicy("menu", "/menu", 2, 60),), global_policy=RoutePolicy("global", "/", 10, 60),
+        shared_networks=(),
+    )
+
+    results = [request_limits.check("/menu/items", "93.184.216.34") for _ in range(3)]
+
+    assert [policy.name if policy else None for policy in results] == [None, None, "menu"]
+    assert request_limits.check("/status", "93.184.216.34") is None
+
+
+def test_shared_network_gets_higher_limits():
+    request_limits = limits(shared_networks=CAMPUS, shared_network_factor=10)
+
+    campus = [request_limits.check("/status", "157.159.10.20") for _ in range(31)]
+    outside = [request_limits.check("/status", "93.184.216.34") for _ in range(4)]
+
+    assert campus.count(None) == 30 and campus[-1] is GLOBAL
+    assert outside.count(None) == 3 and outside[-1] is GLOBAL
+    assert request_limits.get_stats()["shared_network_requests"] == 31
+
+
+def test_parse_networks_skips_invalid_entries():
+    networks = parse_networks(" 157.159.0.0/16, not-a-network,,2001:db8::/32 ")
+
+    assert [str(network) for network in networks] == ["157.159.0.0/16", "2001:db8::/32"]
+
+
+def test_client_ip_from_proxy_headers(monkeypatch):
+    from src.core.config import settings
+
+    monkeypatch.setattr(settings, "TRUSTED_PROXY_HOPS", 2)
+    scope = {
+        "client": ("172.18.0.5", 40000),
+        "headers": [(b"x-forwarded-for", b"1.2.3.4, 157.159.10.20, 172.70.1.1")],
+    }
+
+    # Entry written by the outermost proxy; the client-sent one is ignored
+    assert get_client_ip(scope) == "157.159.10.20"
+    # Direct connection: headers are not trusted
+    assert get_client_ip({**scope, "client": ("93.184.216.34", 40000)}) == "93.184.216.34"
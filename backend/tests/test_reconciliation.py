@@ -0,0 +1,140 @@
+"""
+Bulk reconciliation of pending payments against the orders listing of the
+HelloAsso stand-in (paging, checkpoint, payment state, matching).
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.orm import Session
+
+from src.payments import helloasso_service
+from src.payments.models import SyncCheckpoint
+from src.payments.reconciliation import (
+    RECONCILIATION_CHECKPOINT,
+    RECONCILIATION_OVERLAP,
+    _save_high_water_mark,
+    reconcile_orders,
+)
+from src.users.models import User
+from tests.conftest import counts, create_user, run
+
+PAGE_SIZE = 2
+START = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def small_pages(helloasso, monkeypatch):
+    helloasso.page_size = PAGE_SIZE
+    monkeypatch.setattr(helloasso_service, "ORDERS_PAGE_SIZE", PAGE_SIZE)
+
+
+def at(minutes: int) -> str:
+    return (START + timedelta(minutes=minutes)).isoformat()
+
+
+def checkpoint(engine):
+    with Session(engine) as session:
+        row = session.get(SyncCheckpoint, RECONCILIATION_CHECKPOINT)
+        return row.high_water_mark.replace(tzinfo=timezone.utc) if row else None
+
+
+def payment_status(engine, user_id: int) -> tuple:
+    with Session(engine) as session:
+        user = session.get(User, user_id)
+        return user.payment_status, user.payment_intent_id
+
+
+def test_pages_through_every_order(pg, helloasso):
+    user_ids = [create_user(pg, str(100 + i)) for i in range(5)]
+    for i in range(5):
+        helloasso.add_order(1000 + i, at(i), checkout_intent_id=100 + i)
+
+    metrics = run(reconcile_orders())
+
+    assert metrics["pages"] == 3
+    assert metrics["orders"] == 5
+    assert metrics["completed"] == 5
+    assert [r.url.params.get("continuationToken") for r in helloasso.listing_requests()] == [None, "2", "4"]
+    assert all(payment_status(pg, user_id)[0] == "completed" for user_id in user_ids)
+    assert counts(pg)["outbox"] == 5
+    assert checkpoint(pg) == START + timedelta(minutes=4)
+
+
+def test_incremental_run_rereads_the_overlap(pg, helloasso):
+    helloasso.add_order(1000, at(0), checkout_intent_id=100)
+    helloasso.add_order(1001, at(30), checkout_intent_id=101)
+    run(reconcile_orders())
+    assert checkpoint(pg) == START + timedelta(minutes=30)
+
+    # Registered by HelloAsso after the run, dated just before the checkpoint
+    late_user = create_user(pg, "102")
+    helloasso.add_order(1002, at(25), checkout_intent_id=102)
+    helloasso.requests.clear()
+
+    metrics = run(reconcile_orders())
+
+    from_param, = {r.url.params.get("from") for r in helloasso.listing_requests()}
+    assert datetime.fromisoformat(from_param) == START + timedelta(minutes=30) - RECONCILIATION_OVERLAP
+    assert metrics["completed"] == 1
+    assert payment_status(pg, late_user)[0] == "completed"
+
+
+def test_checkpoint_never_moves_backwards(pg):
+    run(_save_high_water_mark(START + timedelta(minutes=30)))
+    # Slower run of another worker finishing later with an older mark
+    run(_save_high_water_mark(START))
+
+    assert checkpoint(pg) == START + timedelta(minutes=30)
+
+
+def test_full_run_ignores_the_checkpoint(pg, helloasso):
+    run(_save_high_water_mark(START + timedelta(days=1)))
+    user_id = create_user(pg, "100")
+    helloasso.add_order(1000, at(0), checkout_intent_id=100)
+
+    metrics = run(reconcile_orders(full=True))
+
+    assert helloasso.listing_requests()[0].url.params.get("from") is None
+    assert metrics["completed"] == 1
+    assert payment_status(pg, user_id)[0] == "completed"
+
+
+@pytest.mark.parametrize("state", ["Pending", "Refused", "Refunded", "Registered"])
+def test_only_authorized_payments_complete(pg, helloasso, state):
+    user_id = create_user(pg, "100")
+    helloasso.add_order(1000, at(0), checkout_intent_id=100, state=state)
+
+    metrics = run(reconcile_orders())
+
+    assert (metrics["matched"], metrics["completed"]) == (0, 0)
+    assert payment_status(pg, user_id)[0] == "pending"
+    assert counts(pg)["outbox"] == 0
+
+
+def test_matches_by_checkout_intent_or_metadata(pg, helloasso):
+    by_checkout = create_user(pg, "100")
+    by_metadata = create_user(pg, "101")
+    unmatched = create_user(pg, "102")
+    helloasso.add_order(1000, at(0), checkout_intent_id=100)
+    # Admin checkout link: only the reservation id in the metadata
+    helloasso.add_order(1001, at(1), metadata={"reservation_id": str(by_metadata)})
+    helloasso.add_order(1002, at(2), checkout_intent_id=999, metadata={"reservation_id": "abc"})
+    helloasso.add_order(1003, at(3))
+
+    metrics = run(reconcile_orders())
+
+    assert (metrics["matched"], metrics["completed"]) == (2, 2)
+    assert payment_status(pg, by_checkout) == ("completed", "100")
+    assert payment_status(pg, by_metadata) == ("completed", "101")
+    assert payment_status(pg, unmatched) == ("pending", "102")
+
+
+def test_rerun_completes_nothing_twice(pg, helloasso):
+    create_user(pg, "100")
+    helloasso.add_order(1000, at(0), checkout_intent_id=100)
+
+    run(reconcile_orders())
+    metrics = run(reconcile_orders(full=True))
+
+    assert metrics["completed"] == 0
+    assert counts(pg) == {"notifications": 0, "outbox": 1, "completed": 1}
@@ -0,0 +1,75 @@
+"""
+Login with the imported BDE roster: members skip the BDE API without being
+recorded as freshly checked by it.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import Session
+
+from src.auth import service
+from src.auth.membership import bde_membership
+from src.auth.roster import parse_roster, replace_roster
+from src.users.models import User
+from tests.conftest import run
+
+EMAIL = "jean.dupont@telecom-sudparis.eu"
+
+
+async def unexpected_bde_check(*args):
+    raise AssertionError("BDE API called")
+
+
+def login(engine) -> tuple[int, bool]:
+    from src.db.session import AsyncSessionLocal
+
+    with Session(engine) as session:
+        session.add(User(
+            email=EMAIL,
+            normalized_email="jean.dupont",
+            verification_code="abc123",
+            code_created_at=datetime.now(timezone.utc),
+        ))
+        session.commit()
+
+    async def verify():
+        async with AsyncSessionLocal() as db:
+            return await service.verify_code(EMAIL, "abc123", db)
+
+    return run(verify())
+
+
+def test_roster_member_skips_the_bde_api(pg, monkeypatch):
+    monkeypatch.setattr(bde_membership, "check", unexpected_bde_check)
+    members, rejected = parse_roster(f"email\n{EMAIL}\nnot-an-email\n".encode())
+    assert rejected == 1
+
+    async def load():
+        from src.db.session import AsyncSessionLocal
+
+        async with AsyncSessionLocal() as db:
+            await replace_roster(db, members)
+
+    run(load())
+    user_id, is_cotisant = login(pg)
+
+    assert is_cotisant
+    with Session(pg) as session:
+        user = session.get(User, user_id)
+        assert user.is_cotisant
+        # Not an API check: a later removal from the roster is not masked
+        assert user.cotisant_checked_at is None
+
+
+def test_non_member_asks_the_bde_api(pg, monkeypatch):
+    calls = []
+
+    async def bde_check(email, identity, stored_is_cotisant, stored_checked_at):
+        calls.append(identity)
+        return False, True
+
+    monkeypatch.setattr(bde_membership, "check", bde_check)
+    user_id, is_cotisant = login(pg)
+
+    assert (calls, is_cotisant) == (["jean.dupont"], False)
+    with Session(pg) as session:
+        assert session.get(User, user_id).cotisant_checked_at is not None
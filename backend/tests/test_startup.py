@@ -0,0 +1,29 @@
+"""
+Backend startup on a database whose schema is not migrated yet.
+"""
+import asyncio
+
+from sqlalchemy import text
+
+from tests.conftest import run
+
+
+def test_reservation_tasks_start_without_slot_held_column(pg, capsys):
+    from src.reservations.background_tasks import start_background_tasks
+
+    with pg.begin() as connection:
+        connection.execute(text("ALTER TABLE users DROP COLUMN slot_held"))
+
+    async def start():
+        tasks = await start_background_tasks()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    try:
+        run(start())
+    finally:
+        with pg.begin() as connection:
+            connection.execute(text("ALTER TABLE users ADD COLUMN slot_held BOOLEAN NOT NULL DEFAULT false"))
+
+    assert "Slot capacity init skipped" in capsys.readouterr().out
@@ -1,4 +1,4 @@
-import { useState } from 'react'
+import { useRef, useState } from 'react'
 import { fetchWithAuth } from '../../../utils/api'
 import type { MenuItem } from '../../../context/MenuContext'
 import type { DeliveryInfo } from './Delivery'
@@ -38,6 +38,9 @@ const Checkout = ({
     const [isSubmitting, setIsSubmitting] = useState(false)
     const [error, setError] = useState('')
     const [phoneError, setPhoneError] = useState('')
+    // Same key for every submit of this checkout: double clicks and retries
+    // get the first response instead of creating a second order
+    const idempotencyKey = useRef(crypto.randomUUID())
 
     // Validate phone number (French + international formats)
     const validatePhone = (phone: string): boolean => {
@@ -171,39 +174,30 @@ const Checkout = ({
             extras: extraItems.map(item => item.title),
         }
 
-        const reservationResponse = await fetchWithAuth('/api/reservations/', {
+        // Reservation + HelloAsso checkout in a single request
+        const response = await fetchWithAuth('/api/reservations/checkout', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(reservationData),
-        })
-
-        if (!reservationResponse.ok) {
-            const errorData = await reservationResponse.json().catch(() => ({}))
-            throw new Error(errorData.detail || 'Erreur lors de la création de la réservation')
-        }
-
-        const reservation = await reservationResponse.json()
-
-        localStorage.setItem('pending_reservation_id', reservation.id?.toString() || '')
-
-        const response = await fetchWithAuth('/api/payments/checkout', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: {
+                'Content-Type': 'application/json',
+                'Idempotency-Key': idempotencyKey.current,
+            },
             body: JSON.stringify({
+                ...reservationData,
                 payer_email: payerEmail,
                 payer_first_name: payerFirstName,
                 payer_last_name: payerLastName,
-                reservation_id: reservation.id
             }),
         })
 
         if (!response.ok) {
             const errorData = await response.json().catch(() => ({}))
-            throw new Error(errorData.detail || 'Erreur lors de la création du paiement')
+            throw new Error(errorData.detail || 'Erreur lors de la création de la réservation')
         }
 
         const data = await response.json()
 
+        localStorage.setItem('pending_reservation_id', data.id?.toString() || '')
+
         // Store checkout intent ID for verification on return
         localStorage.setItem('checkout_intent_id', data.checkout_intent_id)
 
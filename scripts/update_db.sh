@@ -143,6 +143,18 @@ add_column_if_not_exists "users" "boisson_id" "VARCHAR"
 add_column_if_not_exists "users" "bonus_ids" "JSONB" "'[]'"
 add_column_if_not_exists "users" "date_reservation" "DATE"
 add_column_if_not_exists "users" "heure_reservation" "TIME"
+add_column_if_not_exists "users" "payment_next_check_at" "TIMESTAMP"
+add_column_if_not_exists "users" "payment_check_count" "INTEGER NOT NULL" "0"
+
+# slot_held: lu au démarrage du backend (compteurs de places), doit exister avant
+# qu'il démarre. Les commandes existantes qui occupent une place sont marquées
+# (même règle que la migration Alembic 009)
+SLOT_HELD_EXISTS=$(query_sql "SELECT COUNT(*) FROM information_schema.columns WHERE table_name='users' AND column_name='slot_held'")
+add_column_if_not_exists "users" "slot_held" "BOOLEAN NOT NULL" "false"
+if [ "$SLOT_HELD_EXISTS" != "1" ]; then
+    run_sql "UPDATE users SET slot_held = true WHERE menu_id IS NOT NULL AND heure_reservation IS NOT NULL AND payment_status IN ('completed', 'pending');" > /dev/null 2>&1
+    echo "   ✓ Places occupées marquées (slot_held)"
+fi
 
 # Migration: convertir bonus_id en bonus_ids si nécessaire
 echo ""